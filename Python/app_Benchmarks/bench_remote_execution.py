@@ -0,0 +1,336 @@
+__author__ = 'belens'
+"""
+Program benchmarks vseLib/VseRemoteExecution against a local stand-in of a
+ViPR node (mock_vipr_node.py), so SSH path optimizations can be measured
+without a real ViPR instance.
+
+Example CLI:
+    -records 10
+    -records 10 -latency_ms 40 -bandwidth_kbps 1024 -m 0
+
+Scenarios (each run with SSH session pooling off, then on):
+    1) rx_cmd_simple - N dbcli dumps, one record each
+    2) xfer_file_sftp - N downloads of small dumps, plus one large dump
+       with compression off vs automatic
+    3) XFER app obtain_xml_dump_file/apply_xml_update_file - N records,
+       one at a time, the way the app does it today
+    4) batching - one dbcli dump for all N records, and N separate dumps
+       pulled with xfer_files_sftp_parallel
+
+env_cfg.ini must point VIPR_HOSTNAME/VIPR_USER/VIPR_PASSWORD at the mock
+node (127.0.0.1, root/mock by default).
+"""
+
+import argparse
+import imp
+import os
+import shutil
+import sys
+import time
+from vseLib.vseCmn import VseExceptions, vseCmn
+from vseLib.VseRemoteExecution import VseRemoteExecution
+from mock_vipr_node import MockViprNode, PATH_VIPRC_DBCLI
+
+DEFAULT_ENV_CFG_FILE = r'./env_cfg.ini'
+DEFAULT_LOCAL_PATH = os.path.dirname(os.path.realpath(__file__))
+
+PATH_XFER_APP = os.path.join(
+    DEFAULT_LOCAL_PATH, '..',
+    'app_XFER_XIV_Cinder_To_Native_Behind_VPLEX',
+    'xfer_xiv_cinder_to_native_behind_vplex.py')
+
+CF_NAME = 'ExportGroup'
+URI_TEMPLATE = 'urn:storageos:ExportGroup:bench-{0:06d}:vdc1'
+LARGE_URI = 'urn:storageos:ExportGroup:bench-large:vdc1'
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="%(prog)s measures VseRemoteExecution throughput "
+                    "against a local mock ViPR node, before and after "
+                    "SSH session pooling and batching.")
+
+    o_args = parser.add_argument_group('Optional Arguments')
+    o_args.add_argument('-records', '-n',
+                        type=int,
+                        default=10,
+                        help='Number of dbcli records per scenario')
+    o_args.add_argument('-large_record_fields',
+                        type=int,
+                        default=20000,
+                        help='Number of fields in the large record used '
+                             'for compression scenario')
+    o_args.add_argument('-ssh_port',
+                        type=int,
+                        default=2222,
+                        help='Port for the mock node to listen on')
+    o_args.add_argument('-latency_ms',
+                        type=int,
+                        default=0,
+                        help='Injected latency per command / SFTP open')
+    o_args.add_argument('-bandwidth_kbps',
+                        type=int,
+                        default=0,
+                        help='Injected bandwidth cap in KB/s, 0 unlimited')
+    o_args.add_argument('-concurrency',
+                        type=int,
+                        default=4,
+                        help='Channels used by parallel transfer scenario')
+    o_args.add_argument('-skip_app_scenario',
+                        action='store_true',
+                        help='Skip XFER app functions (they poll every 5 '
+                             'seconds and dominate run time)')
+    o_args.add_argument('-msg_level', '-m',
+                        required=False,
+                        default=vseCmn.MSG_LVL_INFO,
+                        help='Specify output level: 0-DEBUG, 1-INFO, '
+                             '2-WARNING, 3-ERROR.\n INFO is default.')
+    o_args.add_argument('-full_debug',
+                        action='store_true',
+                        required=False,
+                        help='Full Debug will cause full output of '
+                             'API calls and other extra large objects')
+
+    parser.set_defaults(
+        env_settings=DEFAULT_ENV_CFG_FILE,
+        default_local_path=DEFAULT_LOCAL_PATH,
+        msg_level=vseCmn.MSG_LVL_INFO,
+        full_debug=False)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    try:
+        cmn = vseCmn(
+            "ViPR Remote Execution Benchmark",
+            int(args.msg_level),
+            args,
+            logging_mode=vseCmn.SESSION_BASED,
+            logging_value=None,
+            full_debug=args.full_debug)
+
+    except VseExceptions.VSEInitExc as e:
+        print "Basic environment initialization error: " + e.value
+        sys.exit(1)
+
+    cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                 "Printing command line arguments:",
+                 args)
+
+    exit_code = cmn.SUCCESS
+    exit_msg = None
+    node = None
+    try:
+        node = MockViprNode(os.path.join(cmn.get_session_path(), 'mock_node'),
+                            port=args.ssh_port,
+                            username=cmn.get_vipr_user(),
+                            password=cmn.get_vipr_password(),
+                            latency_ms=args.latency_ms,
+                            bandwidth_bps=args.bandwidth_kbps * 1024)
+        seed_store(cmn, node, args.records, args.large_record_fields)
+        node.start()
+        VseRemoteExecution.SSH_PORT = args.ssh_port
+
+        timings = []
+        for pooled in [False, True]:
+            VseRemoteExecution.POOL_SESSIONS = pooled
+            VseRemoteExecution(cmn).close_pooled_sessions()
+            label = 'pooled' if pooled else 'unpooled'
+
+            timings.append(('rx_cmd_simple x{0}'.format(args.records),
+                            label,
+                            bench_rx_cmd_simple(cmn, args.records)))
+            timings.append(('xfer_file_sftp x{0}'.format(args.records),
+                            label,
+                            bench_xfer_small(cmn, args.records)))
+            for compress in [False, None]:
+                timings.append((
+                    'xfer_file_sftp large, compress={0}'.format(compress),
+                    label,
+                    bench_xfer_large(cmn, compress)))
+            if not args.skip_app_scenario:
+                timings.append((
+                    'XFER app dump+load x{0}'.format(args.records),
+                    label,
+                    bench_xfer_app(cmn, args.records)))
+            timings.append(('batched dump of {0}'.format(args.records),
+                            label,
+                            bench_batched_dump(cmn, args.records)))
+            timings.append(('parallel xfer x{0} / {1} channels'.format(
+                                args.records, args.concurrency),
+                            label,
+                            bench_parallel_xfer(cmn, args.records,
+                                                args.concurrency)))
+
+        report(cmn, timings, node)
+
+    except Exception as e:
+        VseExceptions.announce_exception(cmn, e)
+        exit_code = cmn.ERROR_GENERIC
+        exit_msg = str(e)
+
+    if node is not None:
+        VseRemoteExecution(cmn).close_pooled_sessions()
+        node.stop()
+        shutil.rmtree(node.root, True)
+
+    cmn.exit(exit_code, exit_msg)
+
+
+def seed_store(cmn, node, records, large_record_fields):
+    cmn.printMsg(cmn.MSG_LVL_INFO,
+                 "Seeding mock dbcli store with {0} records...".format(
+                     records))
+    for idx in range(records):
+        node.put_record(CF_NAME, URI_TEMPLATE.format(idx), [
+            ('label', 'java.lang.String', 'bench-eg-{0}'.format(idx)),
+            ('inactive', 'java.lang.Boolean', 'false'),
+            ('varray', 'java.net.URI',
+             'urn:storageos:VirtualArray:bench:vdc1'),
+        ])
+
+    node.put_record(CF_NAME, LARGE_URI, [
+        ('volume{0}'.format(idx), 'java.net.URI',
+         URI_TEMPLATE.format(idx)) for idx in range(large_record_fields)
+    ])
+
+
+def remote_dump_path(name):
+    return '/tmp/{0}'.format(name)
+
+
+def dump_cmd(uris, name):
+    return "{0} dump -i {1} -f {2} {3}".format(
+        PATH_VIPRC_DBCLI, ','.join(uris), remote_dump_path(name), CF_NAME)
+
+
+def timed(fn):
+    started = time.time()
+    fn()
+    return time.time() - started
+
+
+def bench_rx_cmd_simple(cmn, records):
+    vse_rx = VseRemoteExecution(cmn)
+
+    def run():
+        for idx in range(records):
+            vse_rx.rx_cmd_simple(
+                cmn.get_vipr_host_name(), cmn.get_vipr_user(),
+                cmn.get_vipr_password(),
+                dump_cmd([URI_TEMPLATE.format(idx)], 'rx_{0}'.format(idx)),
+                sleepTimerSeconds=0.01)
+
+    return timed(run)
+
+
+def bench_xfer_small(cmn, records):
+    vse_rx = VseRemoteExecution(cmn)
+    bench_rx_cmd_simple(cmn, records)
+
+    def run():
+        for idx in range(records):
+            vse_rx.xfer_file_sftp(
+                vse_rx.XFER_OP_DL,
+                cmn.get_vipr_host_name(), cmn.get_vipr_user(),
+                cmn.get_vipr_password(),
+                os.path.join(cmn.get_session_path(), 'rx_{0}'.format(idx)),
+                remote_dump_path('rx_{0}'.format(idx)))
+
+    return timed(run)
+
+
+def bench_xfer_large(cmn, compress):
+    vse_rx = VseRemoteExecution(cmn)
+    vse_rx.rx_cmd_simple(
+        cmn.get_vipr_host_name(), cmn.get_vipr_user(),
+        cmn.get_vipr_password(),
+        dump_cmd([LARGE_URI], 'large'),
+        sleepTimerSeconds=0.01)
+
+    def run():
+        vse_rx.xfer_file_sftp(
+            vse_rx.XFER_OP_DL,
+            cmn.get_vipr_host_name(), cmn.get_vipr_user(),
+            cmn.get_vipr_password(),
+            os.path.join(cmn.get_session_path(), 'large'),
+            remote_dump_path('large'),
+            compress=compress)
+
+    return timed(run)
+
+
+def bench_xfer_app(cmn, records):
+    xfer_app = imp.load_source('xfer_app', PATH_XFER_APP)
+
+    def run():
+        for idx in range(records):
+            name = xfer_app.generate_xml_dump_file_name(
+                cmn, idx, CF_NAME, URI_TEMPLATE.format(idx))
+            xfer_app.obtain_xml_dump_file(cmn, name, CF_NAME,
+                                          URI_TEMPLATE.format(idx))
+            xfer_app.apply_xml_update_file(cmn, name)
+
+    return timed(run)
+
+
+def bench_batched_dump(cmn, records):
+    vse_rx = VseRemoteExecution(cmn)
+    uris = [URI_TEMPLATE.format(idx) for idx in range(records)]
+
+    def run():
+        vse_rx.rx_cmd_simple(
+            cmn.get_vipr_host_name(), cmn.get_vipr_user(),
+            cmn.get_vipr_password(),
+            dump_cmd(uris, 'batched'),
+            sleepTimerSeconds=0.01)
+        vse_rx.xfer_file_sftp(
+            vse_rx.XFER_OP_DL,
+            cmn.get_vipr_host_name(), cmn.get_vipr_user(),
+            cmn.get_vipr_password(),
+            os.path.join(cmn.get_session_path(), 'batched'),
+            remote_dump_path('batched'))
+
+    return timed(run)
+
+
+def bench_parallel_xfer(cmn, records, concurrency):
+    vse_rx = VseRemoteExecution(cmn)
+    bench_rx_cmd_simple(cmn, records)
+    file_pairs = [
+        (remote_dump_path('rx_{0}'.format(idx)),
+         os.path.join(cmn.get_session_path(), 'par_{0}'.format(idx)))
+        for idx in range(records)]
+
+    def run():
+        results = vse_rx.xfer_files_sftp_parallel(
+            vse_rx.XFER_OP_DL,
+            cmn.get_vipr_host_name(), cmn.get_vipr_user(),
+            cmn.get_vipr_password(),
+            file_pairs,
+            concurrency=concurrency)
+        failed = [r for r in results if r['status'] != vse_rx.XFER_RESULT_OK]
+        if len(failed) > 0:
+            raise VseExceptions.VSEViPRAPIExc(
+                "{0} parallel transfers failed".format(len(failed)))
+
+    return timed(run)
+
+
+def report(cmn, timings, node):
+    table = "{0:<45} {1:<10} {2:>10}\n".format('SCENARIO', 'MODE',
+                                                'SECONDS')
+    for scenario, mode, seconds in timings:
+        table += "{0:<45} {1:<10} {2:>10.3f}\n".format(scenario, mode,
+                                                      seconds)
+
+    cmn.printMsg(cmn.MSG_LVL_INFO,
+                 "Benchmark results:\n" + table +
+                 "\nMock node stats: {0}".format(node.stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+__author__ = 'belens'
+"""
+Program benchmarks vseLib/VseViprApi and the apps' data gathering against a
+local stand-in of ViPR REST API (mock_vipr_rest.py) filled with a synthetic
+inventory, so API path optimizations can be measured without a real ViPR
+instance.
+
+Example CLI:
+    -volumes 50000 -hosts 5000
+    -volumes 5000 -hosts 500 -latency_ms 20 -m 0
+
+Scenarios (each on a freshly logged in VseViprApi, so caches are cold):
+    1) get_pp_r1r2_pairs - for one project, and for all volumes
+    2) VseViprProject initialization
+    3) ingest_unmanaged_exported_volumes gather_and_bless_initial_data -
+       exclusive (host) and shared (cluster) storage owner
+    4) drop_and_ingest_volume gather_and_bless_initial_data - exclusive
+       storage owner, whole source project
+    5) get_host_initiators for -fan_out_hosts hosts, one by one and
+       through VseViprApiConcurrent
+
+env_cfg.ini VIPR_PORT/VIPR_USER/VIPR_PASSWORD are used to start the mock
+server, VseHttp is switched to plain HTTP for the benchmark session.
+"""
+
+import argparse
+import imp
+import os
+import sys
+import time
+from vseLib.vseCmn import VseExceptions, vseCmn, module_var
+from vseLib.VseHttp import VseHttp
+from vseLib.VseViprApi import VseViprApi
+from vseLib.VseViprApiConcurrent import VseViprApiConcurrent
+from vseLib.VseViprProject import VseViprProject
+from mock_vipr_rest import MockViprRest, SyntheticInventory, \
+    DEFAULT_GZIP_MIN_BYTES
+
+DEFAULT_ENV_CFG_FILE = r'./env_cfg.ini'
+DEFAULT_LOCAL_PATH = os.path.dirname(os.path.realpath(__file__))
+
+PATH_INGEST_APP = os.path.join(
+    DEFAULT_LOCAL_PATH, '..',
+    'app_IngestUnmanagedExportedVolumes',
+    'ingest_unmanaged_exported_volumes.py')
+
+PATH_DROP_AND_INGEST_APP = os.path.join(
+    DEFAULT_LOCAL_PATH, '..',
+    'app_ChangeProjectThruDBDeleteAndIngest',
+    'drop_and_ingest_volume.py')
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="%(prog)s measures VseViprApi and apps data gathering "
+                    "against a local mock ViPR REST API.")
+
+    o_args = parser.add_argument_group('Optional Arguments')
+    o_args.add_argument('-volumes',
+                        type=int,
+                        default=50000,
+                        help='Number of volumes in synthetic inventory')
+    o_args.add_argument('-hosts',
+                        type=int,
+                        default=5000,
+                        help='Number of hosts in synthetic inventory')
+    o_args.add_argument('-projects',
+                        type=int,
+                        default=50,
+                        help='Number of projects in synthetic inventory')
+    o_args.add_argument('-latency_ms',
+                        type=int,
+                        default=0,
+                        help='Injected latency per request')
+    o_args.add_argument('-bandwidth_kbps',
+                        type=int,
+                        default=0,
+                        help='Injected response bandwidth cap in KB/s, '
+                             '0 unlimited')
+    o_args.add_argument('-max_bulk_ids',
+                        type=int,
+                        default=0,
+                        help='Mock rejects bulk POSTs with more ids, '
+                             '0 unlimited')
+    o_args.add_argument('-error_rate',
+                        type=float,
+                        default=0.0,
+                        help='Share of requests mock answers with 503, '
+                             'to exercise retries, 0-1')
+    o_args.add_argument('-no_gzip',
+                        action='store_true',
+                        help='Mock ignores Accept-Encoding, responses go '
+                             'uncompressed')
+    o_args.add_argument('-fan_out_hosts',
+                        type=int,
+                        default=200,
+                        help='Number of hosts for host initiators '
+                             'scenarios')
+    o_args.add_argument('-skip_all_volumes',
+                        action='store_true',
+                        help='Skip get_pp_r1r2_pairs over all volumes (it '
+                             'pulls the whole inventory in one call)')
+    o_args.add_argument('-msg_level', '-m',
+                        required=False,
+                        default=vseCmn.MSG_LVL_INFO,
+                        help='Specify output level: 0-DEBUG, 1-INFO, '
+                             '2-WARNING, 3-ERROR.\n INFO is default.')
+    o_args.add_argument('-full_debug',
+                        action='store_true',
+                        required=False,
+                        help='Full Debug will cause full output of '
+                             'API calls and other extra large objects')
+
+    parser.set_defaults(
+        env_settings=DEFAULT_ENV_CFG_FILE,
+        default_local_path=DEFAULT_LOCAL_PATH,
+        msg_level=vseCmn.MSG_LVL_INFO,
+        full_debug=False)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    try:
+        cmn = vseCmn(
+            "ViPR API Benchmark",
+            int(args.msg_level),
+            args,
+            logging_mode=vseCmn.SESSION_BASED,
+            logging_value=None,
+            full_debug=args.full_debug)
+
+    except VseExceptions.VSEInitExc as e:
+        print "Basic environment initialization error: " + e.value
+        sys.exit(1)
+
+    cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                 "Printing command line arguments:",
+                 args)
+
+    exit_code = cmn.SUCCESS
+    exit_msg = None
+    rest = None
+    try:
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Generating synthetic inventory of {0} volumes, {1} "
+                     "hosts...".format(args.volumes, args.hosts))
+        started = time.time()
+        inventory = SyntheticInventory(volumes=args.volumes,
+                                       hosts=args.hosts,
+                                       projects=args.projects)
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Inventory generated in {0:.1f}s:".format(
+                         time.time() - started),
+                     inventory.counts())
+
+        rest = MockViprRest(inventory,
+                            port=int(cmn.get_vipr_host_port()),
+                            username=cmn.get_vipr_user(),
+                            password=cmn.get_vipr_password(),
+                            latency_ms=args.latency_ms,
+                            bandwidth_bps=args.bandwidth_kbps * 1024,
+                            max_bulk_ids=args.max_bulk_ids,
+                            error_rate=args.error_rate,
+                            gzip_min_bytes=0 if args.no_gzip else
+                            DEFAULT_GZIP_MIN_BYTES)
+        rest.start()
+
+        targets = pick_targets(inventory, args.fan_out_hosts)
+        cmn.printMsg(cmn.MSG_LVL_INFO, "Benchmark targets:",
+                     dict(targets, hosts=len(targets['hosts'])))
+
+        scenarios = [
+            ('get_pp_r1r2_pairs, one project',
+             lambda api: api.get_pp_r1r2_pairs(targets['project'])),
+            ('VseViprProject init',
+             lambda api: VseViprProject(cmn, api, targets['project'])),
+            ('ingest gather, exclusive owner',
+             lambda api: bench_ingest_gather(
+                 cmn, api, targets, api.STORAGE_TYPE_EXCLUSIVE)),
+            ('ingest gather, shared owner',
+             lambda api: bench_ingest_gather(
+                 cmn, api, targets, api.STORAGE_TYPE_SHARED)),
+            ('drop_and_ingest gather, exclusive owner',
+             lambda api: bench_drop_and_ingest_gather(cmn, api, targets)),
+            ('host initiators x{0}, one by one'.format(
+                len(targets['hosts'])),
+             lambda api: [api.get_host_initiators(name, uri)
+                          for name, uri in targets['hosts']]),
+            ('host initiators x{0}, concurrent'.format(
+                len(targets['hosts'])),
+             lambda api: VseViprApiConcurrent(cmn, api).get_host_initiators(
+                 targets['hosts'])),
+        ]
+        if not args.skip_all_volumes:
+            scenarios.insert(1, ('get_pp_r1r2_pairs, all volumes',
+                                 lambda api: api.get_pp_r1r2_pairs()))
+
+        timings = []
+        for name, fn in scenarios:
+            timings.append((name,) + run_scenario(cmn, rest, fn))
+
+        report(cmn, timings, rest)
+
+    except Exception as e:
+        VseExceptions.announce_exception(cmn, e)
+        exit_code = cmn.ERROR_GENERIC
+        exit_msg = str(e)
+
+    if rest is not None:
+        rest.stop()
+
+    cmn.exit(exit_code, exit_msg)
+
+
+#
+# names and URIs scenarios run against, derived from generated inventory
+#
+def pick_targets(inventory, fan_out_hosts):
+    project = inventory.projects[0]
+    standalone = set(host['id'] for host in inventory.standalone_hosts)
+
+    volume = None
+    for resource in inventory.project_resources[project['id']]:
+        candidate = inventory.get('volume', resource['id'])
+        if 'protection' not in candidate and \
+           inventory.volume_host.get(candidate['id']) in standalone:
+            volume = candidate
+            break
+    if volume is None:
+        raise VseExceptions.VSEViPRAPIExc(
+            "Inventory has no unprotected volume exported to a standalone "
+            "host in [{0}], increase -volumes/-hosts".format(
+                project['name']))
+
+    shared_owner = sorted(inventory.cluster_hosts.keys())[0] \
+        if inventory.cluster_hosts else None
+
+    return {
+        'project': project['name'],
+        'target_project': inventory.projects[-1]['name'],
+        'volume_host': inventory.get(
+            'host', inventory.volume_host[volume['id']])['name'],
+        'va': inventory.get('varray', volume['varray']['id'])['name'],
+        'vp': inventory.get('vpool', volume['vpool']['id'])['name'],
+        'unmanaged_host': inventory.standalone_hosts[0]['name'],
+        'unmanaged_cluster': inventory.get('cluster', shared_owner)['name']
+        if shared_owner else None,
+        'hosts': sorted((host['name'], host['id'])
+                        for host in inventory.objects['host'].values()
+                        )[:fan_out_hosts],
+    }
+
+
+def connect_vipr_api(cmn):
+    vipr_api = VseViprApi(cmn)
+    module_var(module_var(vipr_api, VseViprApi.IDX_VIPR_SESSION),
+               VseHttp.IDX_HTTP_PROTOCOL, 'http')
+    vipr_api.login()
+    return vipr_api
+
+
+def run_scenario(cmn, rest, fn):
+    vipr_api = connect_vipr_api(cmn)
+    requests_before = rest.stats['requests']
+    bytes_before = rest.stats['bytes_out']
+    wire_before = rest.stats['bytes_out_wire']
+
+    started = time.time()
+    fn(vipr_api)
+    seconds = time.time() - started
+
+    requests_made = rest.stats['requests'] - requests_before
+    mb_out = (rest.stats['bytes_out'] - bytes_before) / (1024.0 * 1024.0)
+    mb_wire = (rest.stats['bytes_out_wire'] - wire_before) / \
+        (1024.0 * 1024.0)
+    vipr_api.logout()
+    return seconds, requests_made, mb_out, mb_wire
+
+
+def bench_ingest_gather(cmn, vipr_api, targets, storage_type):
+    ingest_app = imp.load_source('ingest_app', PATH_INGEST_APP)
+    owner = targets['unmanaged_host'] \
+        if storage_type == vipr_api.STORAGE_TYPE_EXCLUSIVE \
+        else targets['unmanaged_cluster']
+    if owner is None:
+        raise VseExceptions.VSEViPRAPIExc(
+            "Inventory has no {0} storage owner".format(storage_type))
+    ingest_app.gather_and_bless_initial_data(cmn, vipr_api,
+                                             targets['target_project'],
+                                             storage_type,
+                                             owner)
+
+
+def bench_drop_and_ingest_gather(cmn, vipr_api, targets):
+    drop_app = imp.load_source('drop_and_ingest_app',
+                               PATH_DROP_AND_INGEST_APP)
+    drop_app.gather_and_bless_initial_data(cmn, vipr_api,
+                                           targets['project'],
+                                           targets['target_project'],
+                                           vipr_api.STORAGE_TYPE_EXCLUSIVE,
+                                           targets['volume_host'],
+                                           targets['va'],
+                                           targets['vp'])
+
+
+def report(cmn, timings, rest):
+    table = "{0:<45} {1:>10} {2:>10} {3:>10} {4:>10}\n".format(
+        'SCENARIO', 'SECONDS', 'REQUESTS', 'MB OUT', 'MB WIRE')
+    for scenario, seconds, requests_made, mb_out, mb_wire in timings:
+        table += "{0:<45} {1:>10.3f} {2:>10} {3:>10.1f} {4:>10.1f}\n".format(
+            scenario, seconds, requests_made, mb_out, mb_wire)
+
+    cmn.printMsg(cmn.MSG_LVL_INFO,
+                 "Benchmark results:\n" + table +
+                 "\nMock REST stats: requests {0}, rejected {1}, "
+                 "logins {2}".format(rest.stats['requests'],
+                                     rest.stats['rejected'],
+                                     rest.stats['logins']))
+    cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                 "Mock REST requests by route:",
+                 rest.stats['by_route'])
+
+
+if __name__ == '__main__':
+    main()
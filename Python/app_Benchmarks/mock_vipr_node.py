@@ -0,0 +1,486 @@
+__author__ = 'belens'
+
+"""
+Local stand-in for a ViPR node's SSH side, built on paramiko server classes.
+
+It serves:
+    - exec channel with a fake dbcli (dump/load against on-disk XML store)
+      plus the handful of shell commands vseLib/VseRemoteExecution relies on
+      (gzip -c, gzip -dc >, md5sum)
+    - SFTP subsystem, rooted in a local folder
+
+Every remote absolute path (e.g. /tmp/0001_ExportGroup_urn) is mapped under
+the SFTP root, so dumps written by fake dbcli are visible over SFTP.
+
+Latency (per command / per SFTP open) and bandwidth (bytes per second on
+exec output and SFTP reads/writes) are injectable, to approximate a WAN hop.
+
+XML store layout:
+    <store>/<column family>/<uri with ':' replaced by '-'>.xml
+    each file holds one <record> element as dbcli would dump it
+
+Can be run standalone:
+    python mock_vipr_node.py -port 2222 -root /tmp/mock_vipr_root
+"""
+
+import argparse
+import hashlib
+import os
+import shlex
+import socket
+import threading
+import time
+import zlib
+
+import paramiko
+from paramiko import ServerInterface, SFTPServerInterface, SFTPServer, \
+    SFTPAttributes, SFTPHandle, SFTP_OK, AUTH_SUCCESSFUL, AUTH_FAILED, \
+    OPEN_SUCCEEDED
+
+try:
+    import xml.etree.cElementTree as eTree
+except ImportError:
+    import xml.etree.ElementTree as eTree
+
+PATH_VIPRC_DBCLI = r'/opt/storageos/bin/dbcli'
+DEFAULT_PORT = 2222
+DEFAULT_USER = 'root'
+DEFAULT_PASSWORD = 'mock'
+
+
+class Throttle:
+    """
+    latency and bandwidth shaping shared by exec channels and SFTP handles
+    """
+    def __init__(self, latency_ms=0, bandwidth_bps=0):
+        self.latency = latency_ms / 1000.0
+        self.bandwidth = bandwidth_bps
+
+    def wait_latency(self):
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def wait_bytes(self, count):
+        if self.bandwidth > 0 and count > 0:
+            time.sleep(float(count) / self.bandwidth)
+
+
+class MockViprNode:
+    """
+    owns listening socket, XML store and SFTP root; start()/stop() run it on
+    a background thread so benchmarks can use it in-process
+    """
+    def __init__(self, root, port=DEFAULT_PORT,
+                 username=DEFAULT_USER, password=DEFAULT_PASSWORD,
+                 latency_ms=0, bandwidth_bps=0):
+        self.root = os.path.abspath(root)
+        self.store = os.path.join(self.root, '_dbcli_store')
+        self.port = port
+        self.username = username
+        self.password = password
+        self.throttle = Throttle(latency_ms, bandwidth_bps)
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.transports = []
+        self.listener = None
+        self.thread = None
+        self.running = False
+        self.stats = {'connections': 0, 'commands': 0, 'sftp_opens': 0}
+        self.stats_lock = threading.Lock()
+
+        for path in [self.root, self.store, os.path.join(self.root, 'tmp')]:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def count(self, name):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    #
+    # remote absolute path -> local path under root
+    #
+    def local_path(self, remote_path):
+        remote_path = os.path.normpath('/' + remote_path.lstrip('/'))
+        return os.path.join(self.root, remote_path.lstrip('/'))
+
+    #
+    # XML store
+    #
+    def record_path(self, cfname, uri):
+        return os.path.join(self.store, cfname,
+                            uri.replace(':', '-') + '.xml')
+
+    def put_record(self, cfname, uri, fields):
+        """
+        seed the store. fields - list of (name, type, value) tuples
+        """
+        record = eTree.Element('record', {'id': uri})
+        for name, f_type, value in fields:
+            eTree.SubElement(record, 'field',
+                             {'name': name, 'type': f_type,
+                              'value': value})
+        self.__write_record(cfname, uri, record)
+
+    def __write_record(self, cfname, uri, record):
+        path = self.record_path(cfname, uri)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as fp:
+            fp.write(eTree.tostring(record))
+
+    def dbcli_dump(self, uris, file_path, cfname):
+        output = "Initializing db client ...\n"
+        schema = eTree.Element('data_object_schema', {'name': cfname})
+        for uri in uris:
+            path = self.record_path(cfname, uri)
+            if not os.path.isfile(path):
+                output += "id: {0} [ Deleted ]\n".format(uri)
+                continue
+            schema.append(eTree.parse(path).getroot())
+        root = eTree.Element('dbschemas')
+        root.append(schema)
+        eTree.ElementTree(root).write(self.local_path(file_path),
+                                      encoding='UTF-8')
+        output += "Dump into file: {0} successfully\n".format(file_path)
+        return 0, output
+
+    def dbcli_load(self, file_path):
+        output = "Initializing db client ...\n"
+        try:
+            doc = eTree.parse(self.local_path(file_path))
+        except Exception as e:
+            return 1, output + "Load failed: {0}\n".format(e)
+        for schema in doc.getroot().iter('data_object_schema'):
+            cfname = schema.attrib.get('name')
+            for record in schema.findall('record'):
+                self.__write_record(cfname, record.attrib.get('id'), record)
+                output += "id: {0} loaded\n".format(record.attrib.get('id'))
+        output += "Load from file: {0} successfully\n".format(file_path)
+        return 0, output
+
+    #
+    # socket plumbing
+    #
+    def start(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', self.port))
+        self.listener.listen(100)
+        self.listener.settimeout(0.5)
+        self.running = True
+        self.thread = threading.Thread(target=self.__accept_loop,
+                                       name='mock-vipr-node')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        self.listener.close()
+        for transport in self.transports:
+            transport.close()
+
+    def __accept_loop(self):
+        while self.running:
+            try:
+                sock, addr = self.listener.accept()
+            except socket.timeout:
+                continue
+            self.count('connections')
+            t = threading.Thread(target=self.__serve_connection,
+                                 args=(sock,))
+            t.daemon = True
+            t.start()
+
+    def __serve_connection(self, sock):
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler('sftp', SFTPServer,
+                                        MockSFTPServer, node=self)
+        self.transports.append(transport)
+        transport.start_server(server=MockSSHServer(self))
+
+
+class MockSSHServer(ServerInterface):
+    def __init__(self, node):
+        self.node = node
+
+    def check_auth_password(self, username, password):
+        if username == self.node.username and \
+           password == self.node.password:
+            return AUTH_SUCCESSFUL
+        return AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        t = threading.Thread(target=run_command,
+                             args=(self.node, channel, command))
+        t.daemon = True
+        t.start()
+        return True
+
+
+#
+# exec channel: fake dbcli plus gzip/md5sum used by VseRemoteExecution
+#
+#
+# paramiko replies to exec request only after check_channel_exec_request
+# returns, and a channel closed before that reply fails on client side -
+# so quick commands hold the close back for a short grace period
+#
+EXEC_REPLY_GRACE_SECONDS = 0.05
+
+def run_command(node, channel, command):
+    started = time.time()
+    node.count('commands')
+    node.throttle.wait_latency()
+    try:
+        exit_code = dispatch_command(node, channel, command)
+    except Exception as e:
+        send_throttled(node, channel, "mock node error: {0}\n".format(e))
+        exit_code = 1
+    remaining = EXEC_REPLY_GRACE_SECONDS - (time.time() - started)
+    if remaining > 0:
+        time.sleep(remaining)
+    channel.send_exit_status(exit_code)
+    channel.close()
+
+
+def dispatch_command(node, channel, command):
+    redirect = None
+    if '>' in command:
+        command, redirect = command.split('>', 1)
+        redirect = shlex.split(redirect)[0]
+    argv = shlex.split(command)
+
+    if len(argv) >= 2 and argv[0] == PATH_VIPRC_DBCLI and argv[1] == 'dump':
+        opts = parse_dbcli_args(argv[2:])
+        exit_code, output = node.dbcli_dump(opts['-i'].split(','),
+                                            opts['-f'], opts['cf'])
+        send_throttled(node, channel, output)
+        return exit_code
+
+    if len(argv) >= 2 and argv[0] == PATH_VIPRC_DBCLI and argv[1] == 'load':
+        opts = parse_dbcli_args(argv[2:])
+        exit_code, output = node.dbcli_load(opts['-f'])
+        send_throttled(node, channel, output)
+        return exit_code
+
+    if argv == ['gzip', '-c', argv[-1]] and redirect is None:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        with open(node.local_path(argv[-1]), 'rb') as fp:
+            while True:
+                data = fp.read(64 * 1024)
+                if not data:
+                    break
+                send_throttled(node, channel, compressor.compress(data))
+        send_throttled(node, channel, compressor.flush())
+        return 0
+
+    if argv == ['gzip', '-dc'] and redirect is not None:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        with open(node.local_path(redirect), 'wb') as fp:
+            while True:
+                chunk = channel.recv(64 * 1024)
+                if not chunk:
+                    break
+                node.throttle.wait_bytes(len(chunk))
+                fp.write(decompressor.decompress(chunk))
+            fp.write(decompressor.flush())
+        return 0
+
+    if len(argv) == 2 and argv[0] == 'md5sum':
+        md5 = hashlib.md5()
+        with open(node.local_path(argv[1]), 'rb') as fp:
+            md5.update(fp.read())
+        send_throttled(node, channel,
+                       "{0}  {1}\n".format(md5.hexdigest(), argv[1]))
+        return 0
+
+    send_throttled(node, channel, "{0}: command not found\n".format(argv[0]))
+    return 127
+
+
+def parse_dbcli_args(args):
+    opts = {}
+    idx = 0
+    while idx < len(args):
+        if args[idx] in ['-i', '-f']:
+            opts[args[idx]] = args[idx + 1]
+            idx += 2
+        else:
+            opts['cf'] = args[idx]
+            idx += 1
+    return opts
+
+
+def send_throttled(node, channel, data):
+    if len(data) == 0:
+        return
+    node.throttle.wait_bytes(len(data))
+    channel.sendall(data)
+
+
+#
+# SFTP subsystem, rooted at node.root
+#
+class MockSFTPHandle(SFTPHandle):
+    def __init__(self, node, flags=0):
+        SFTPHandle.__init__(self, flags)
+        self.node = node
+
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+    def read(self, offset, length):
+        data = SFTPHandle.read(self, offset, length)
+        if isinstance(data, str):
+            self.node.throttle.wait_bytes(len(data))
+        return data
+
+    def write(self, offset, data):
+        self.node.throttle.wait_bytes(len(data))
+        return SFTPHandle.write(self, offset, data)
+
+
+class MockSFTPServer(SFTPServerInterface):
+    def __init__(self, server, node=None, *args, **kwargs):
+        SFTPServerInterface.__init__(self, server, *args, **kwargs)
+        self.node = node
+
+    def list_folder(self, path):
+        local = self.node.local_path(path)
+        try:
+            out = []
+            for name in os.listdir(local):
+                attr = SFTPAttributes.from_stat(
+                    os.stat(os.path.join(local, name)))
+                attr.filename = name
+                out.append(attr)
+            return out
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(
+                os.stat(self.node.local_path(path)))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def lstat(self, path):
+        try:
+            return SFTPAttributes.from_stat(
+                os.lstat(self.node.local_path(path)))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+    def open(self, path, flags, attr):
+        self.node.count('sftp_opens')
+        self.node.throttle.wait_latency()
+        local = self.node.local_path(path)
+        try:
+            fd = os.open(local, flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        try:
+            f = os.fdopen(fd, mode)
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+
+        handle = MockSFTPHandle(self.node, flags)
+        handle.filename = local
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self.node.local_path(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(self.node.local_path(oldpath),
+                      self.node.local_path(newpath))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self.node.local_path(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(self.node.local_path(path))
+        except OSError as e:
+            return SFTPServer.convert_errno(e.errno)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        return SFTP_OK
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="%(prog)s runs a local stand-in for ViPR node SSH/SFTP "
+                    "services with a fake dbcli.")
+
+    o_args = parser.add_argument_group('Optional Arguments')
+    o_args.add_argument('-port', type=int, default=DEFAULT_PORT,
+                        help='Port to listen on, default {0}'.format(
+                            DEFAULT_PORT))
+    o_args.add_argument('-root', default='./mock_vipr_root',
+                        help='Folder serving as remote file system root')
+    o_args.add_argument('-latency_ms', type=int, default=0,
+                        help='Delay added to every command and SFTP open')
+    o_args.add_argument('-bandwidth_kbps', type=int, default=0,
+                        help='Bandwidth cap in KB/s, 0 for unlimited')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    node = MockViprNode(args.root, port=args.port,
+                        latency_ms=args.latency_ms,
+                        bandwidth_bps=args.bandwidth_kbps * 1024)
+    node.start()
+    print "Mock ViPR node listening on 127.0.0.1:{0}, user {1}/{2}, " \
+          "root {3}. Ctrl-C to stop.".format(args.port, node.username,
+                                              node.password, node.root)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        node.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1102 @@
+__author__ = 'belens'
+
+"""
+Local stand-in for a ViPR controller's REST API, filled with a synthetic
+inventory, so vseLib/VseViprApi and the apps can be measured without a real
+ViPR instance.
+
+It serves (HTTP, not HTTPS - point VseHttp protocol at 'http'):
+    - /login, /logout, /user/whoami
+    - bulk endpoints: GET returns {"id": [...]}, POST {"id": [...]} returns
+      full objects under the same key VseViprApi expects
+        /block/volumes/bulk, /block/volumes/exports/bulk,
+        /vdc/unmanaged/volumes/bulk (+ GET /vdc/unmanaged/bulk),
+        /compute/hosts/bulk, /compute/clusters/bulk,
+        /compute/initiators/bulk, /vdc/storage-ports/bulk,
+        /vdc/storage-pools/bulk, /catalog/services/bulk
+    - <collection>/search?name= (substring match, as ViPR does)
+    - /projects/{id}/resources, single object GETs, host/cluster
+      initiators and unmanaged volumes, volume protection and tags
+    - host/cluster/initiator creation, returning completed tasks
+    - /vdc/tasks/{id}, /catalog/orders (orders complete immediately)
+    - /backupset/backup create/delete, /backupset/download with Range
+      support; backups are backup_bytes of random data that changes a
+      little from one backup to the next, like a real one does
+
+Latency (per request) and bandwidth (response bytes per second) are
+injectable, as are payload limits - max ids per bulk POST and max request
+body size - answered with ViPR style error bodies, and a rate of transient
+503 Service Unavailable answers. The first backup download can be cut
+off after cut_download_after bytes, to exercise resume - closed cleanly,
+or with a TCP reset (reset_download) like a dropped link. Responses of
+gzip_min_bytes or more are gzip/deflate encoded when the client accepts it (0 - never, like a server
+that ignores Accept-Encoding).
+
+Inventory layout (deterministic for a given set of sizes):
+    - volumes are spread over projects in blocks of SRDF_EVERY, the last
+      two volumes of every block form an SRDF R1/R2 pair on different
+      storage systems
+    - volume i is exported to host i; a clustered host's exports cover
+      every host of its cluster
+    - unmanaged volumes belong to standalone hosts (exclusive) and to
+      clusters (shared)
+
+Can be run standalone:
+    python mock_vipr_rest.py -port 4443 -volumes 50000 -hosts 5000
+"""
+
+import argparse
+import base64
+import BaseHTTPServer
+import json
+import os
+import random
+import re
+import socket
+import SocketServer
+import struct
+import threading
+import time
+import urlparse
+import uuid
+import zlib
+
+from mock_vipr_node import Throttle
+
+DEFAULT_PORT = 4443
+DEFAULT_USER = 'root'
+DEFAULT_PASSWORD = 'mock'
+DEFAULT_GZIP_MIN_BYTES = 1024
+DEFAULT_BACKUP_BYTES = 8 * 1024 * 1024
+VIPR_AUTH_HEADER = 'X-SDS-AUTH-TOKEN'
+
+SRDF_EVERY = 10
+UNMANAGED_SNAPSHOT_EVERY = 7
+
+CATALOG_SERVICES = ['Remove Block Volumes',
+                    'Discover Unmanaged Volumes',
+                    'Ingest Exported Unmanaged Volumes',
+                    'Create Block Volume',
+                    'Export Volume to a Host',
+                    'Unexport Volume',
+                    'Expand Block Volume',
+                    'Create Block Snapshot']
+
+
+def urn(kind, idx, vdc='vdc1'):
+    return 'urn:storageos:{0}:mock-{1:08d}:{2}'.format(kind, idx, vdc)
+
+
+def link(path, uri):
+    return {'rel': 'self', 'href': '{0}/{1}'.format(path, uri)}
+
+
+class SyntheticInventory:
+    """
+    objects[key][uri] -> full object dict, key being the one VseViprApi
+    reads from bulk responses (volume, host, cluster, ...)
+    """
+    def __init__(self, volumes=50000, hosts=5000, projects=50,
+                 storage_systems=4, hosts_per_cluster=4,
+                 initiators_per_host=2, unmanaged_per_owner=2,
+                 ports_per_system=8, pools_per_system=2):
+        self.objects = {}
+        self.project_resources = {}
+        self.host_initiators = {}
+        self.cluster_hosts = {}
+        self.volume_itls = {}
+        self.volume_host = {}
+        self.unmanaged_by_owner = {}
+        self.tags = {}
+        self.tasks = {}
+        self.orders = {}
+        self.lock = threading.RLock()
+        self.sequence = 0
+
+        self.tenant = 'urn:storageos:TenantOrg:mock-root:global'
+
+        self.__generate_arrays(storage_systems, ports_per_system,
+                               pools_per_system)
+        self.__generate_virtual(storage_systems)
+        self.__generate_projects(projects)
+        self.__generate_compute(hosts, hosts_per_cluster,
+                                initiators_per_host)
+        self.__generate_volumes(volumes)
+        self.__generate_unmanaged(unmanaged_per_owner)
+        self.__generate_catalog()
+
+    def add(self, key, obj):
+        self.objects.setdefault(key, {})[obj['id']] = obj
+        return obj
+
+    def get(self, key, uri):
+        return self.objects.get(key, {}).get(uri)
+
+    def ids(self, key):
+        return self.objects.get(key, {}).keys()
+
+    def next_sequence(self):
+        with self.lock:
+            self.sequence += 1
+            return self.sequence
+
+    def counts(self):
+        return dict((key, len(objs)) for key, objs in self.objects.items())
+
+    #
+    # generation
+    #
+    def __generate_arrays(self, storage_systems, ports_per_system,
+                          pools_per_system):
+        for s_idx in range(storage_systems):
+            serial = '00019670{0:04d}'.format(s_idx)
+            ss = self.add('storage_system', {
+                'id': urn('StorageSystem', s_idx),
+                'name': 'SYMMETRIX+' + serial,
+                'serial_number': serial,
+                'system_type': 'vmax',
+                'smis_provider_ip': '10.0.0.{0}'.format(s_idx + 1),
+                'native_guid': 'SYMMETRIX+' + serial,
+                'registration_status': 'REGISTERED',
+                'inactive': False,
+                'link': link('/vdc/storage-systems',
+                             urn('StorageSystem', s_idx))})
+            for p_idx in range(pools_per_system):
+                idx = s_idx * pools_per_system + p_idx
+                self.add('storage_pool', {
+                    'id': urn('StoragePool', idx),
+                    'name': 'SYMMETRIX+{0}+POOL+SRP_{1}'.format(serial,
+                                                               p_idx),
+                    'pool_name': 'SRP_{0}'.format(p_idx),
+                    'storage_system': {'id': ss['id']},
+                    'free_gb': 100000,
+                    'usable_gb': 200000,
+                    'inactive': False,
+                    'link': link('/vdc/storage-pools',
+                                 urn('StoragePool', idx))})
+            for p_idx in range(ports_per_system):
+                idx = s_idx * ports_per_system + p_idx
+                self.add('storage_port', {
+                    'id': urn('StoragePort', idx),
+                    'name': 'FA-{0}E:{1}'.format(p_idx + 1, p_idx % 2),
+                    'port_network_id': '50:00:09:73:00:{0:02X}:{1:02X}:'
+                                       '{2:02X}'.format(s_idx, p_idx,
+                                                        idx % 256),
+                    'storage_system': {'id': ss['id']},
+                    'transport_type': 'FC',
+                    'inactive': False,
+                    'link': link('/vdc/storage-ports',
+                                 urn('StoragePort', idx))})
+
+    def __generate_virtual(self, storage_systems):
+        self.varrays = []
+        self.vpools = []
+        for idx in range(max(storage_systems, 1)):
+            self.varrays.append(self.add('varray', {
+                'id': urn('VirtualArray', idx),
+                'name': 'mock-va-{0:02d}'.format(idx),
+                'inactive': False,
+                'link': link('/vdc/varrays', urn('VirtualArray', idx))}))
+        for idx in range(len(self.varrays) * 2):
+            self.vpools.append(self.add('vpool', {
+                'id': urn('VirtualPool', idx),
+                'name': 'mock-vp-{0:02d}'.format(idx),
+                'type': 'block',
+                'protocols': ['FC'],
+                'varrays': [{'id': self.varrays[idx % len(self.varrays)][
+                    'id']}],
+                'inactive': False,
+                'link': link('/block/vpools', urn('VirtualPool', idx))}))
+
+    def __generate_projects(self, projects):
+        self.projects = []
+        for idx in range(projects):
+            project = self.add('project', {
+                'id': urn('Project', idx, 'global'),
+                'name': 'mock-project-{0:03d}'.format(idx),
+                'tenant': {'id': self.tenant},
+                'owner': 'root',
+                'inactive': False,
+                'link': link('/projects', urn('Project', idx, 'global'))})
+            self.projects.append(project)
+            self.project_resources[project['id']] = []
+
+    def __generate_compute(self, hosts, hosts_per_cluster,
+                           initiators_per_host):
+        self.hosts = []
+        self.standalone_hosts = []
+        clusters = hosts / (2 * hosts_per_cluster) if hosts_per_cluster \
+            else 0
+        for c_idx in range(clusters):
+            cluster = self.add('cluster', {
+                'id': urn('Cluster', c_idx),
+                'name': 'mock-cluster-{0:05d}'.format(c_idx),
+                'tenant': {'id': self.tenant},
+                'inactive': False,
+                'link': link('/compute/clusters', urn('Cluster', c_idx))})
+            self.cluster_hosts[cluster['id']] = []
+
+        for h_idx in range(hosts):
+            name = 'mock-host-{0:05d}'.format(h_idx)
+            host = self.add('host', {
+                'id': urn('Host', h_idx),
+                'name': name,
+                'host_name': name + '.mock.local',
+                'type': 'Linux',
+                'tenant': {'id': self.tenant},
+                'discoverable': False,
+                'inactive': False,
+                'link': link('/compute/hosts', urn('Host', h_idx))})
+            self.hosts.append(host)
+            self.host_initiators[host['id']] = []
+            c_idx = h_idx / hosts_per_cluster if hosts_per_cluster else 0
+            if c_idx < clusters:
+                host['cluster'] = {'id': urn('Cluster', c_idx)}
+                self.cluster_hosts[host['cluster']['id']].append(host['id'])
+            else:
+                self.standalone_hosts.append(host)
+
+            for i_idx in range(initiators_per_host):
+                idx = h_idx * initiators_per_host + i_idx
+                wwn = '10:00:00:00:{0:02X}:{1:02X}:{2:02X}:{3:02X}'.format(
+                    (idx >> 24) & 0xff, (idx >> 16) & 0xff,
+                    (idx >> 8) & 0xff, idx & 0xff)
+                self.add_initiator(host['id'], 'FC', wwn, wwn,
+                                   '{0}-hba{1}'.format(name, i_idx),
+                                   urn('Initiator', idx))
+
+    def add_initiator(self, host_uri, protocol, node, port, name, uri=None):
+        if uri is None:
+            uri = urn('Initiator', 10000000 + self.next_sequence())
+        initiator = self.add('initiator', {
+            'id': uri,
+            'name': name,
+            'protocol': protocol,
+            'initiator_node': node,
+            'initiator_port': port,
+            'hostname': self.get('host', host_uri)['host_name'],
+            'host': {'id': host_uri},
+            'registration_status': 'REGISTERED',
+            'inactive': False,
+            'link': link('/compute/initiators', uri)})
+        self.host_initiators[host_uri].append(uri)
+        return initiator
+
+    def __generate_volumes(self, volumes):
+        systems = sorted(self.ids('storage_system'))
+        ports = sorted(self.ids('storage_port'))
+        for v_idx in range(volumes):
+            v_uri = urn('Volume', v_idx)
+            project = self.projects[(v_idx / SRDF_EVERY) %
+                                    len(self.projects)]
+            vpool = self.vpools[v_idx % len(self.vpools)]
+            name = 'mock-vol-{0:06d}'.format(v_idx)
+            volume = self.add('volume', {
+                'id': v_uri,
+                'name': name,
+                'device_label': name,
+                'native_id': '{0:05X}'.format(v_idx % 0xfffff),
+                'wwn': '6000097000019670{0:04d}533{1:05X}'.format(
+                    v_idx % len(systems), v_idx % 0xfffff),
+                'storage_controller': systems[v_idx % len(systems)],
+                'system_type': 'vmax',
+                'project': {'id': project['id']},
+                'tenant': {'id': self.tenant},
+                'varray': vpool['varrays'][0],
+                'vpool': {'id': vpool['id']},
+                'protocols': ['FC'],
+                'provisioned_capacity_gb': '10.00',
+                'allocated_capacity_gb': '0.00',
+                'thinly_provisioned': True,
+                'inactive': False,
+                'link': link('/block/volumes', v_uri)})
+            self.project_resources[project['id']].append(
+                {'id': v_uri, 'name': name, 'resource_type': 'volume'})
+
+            #
+            # last two volumes of each block are an SRDF pair
+            #
+            position = v_idx % SRDF_EVERY
+            if position == SRDF_EVERY - 2 and v_idx + 1 < volumes:
+                volume['protection'] = {'srdf': {
+                    'personality': 'SOURCE',
+                    'volumes': [{'id': urn('Volume', v_idx + 1)}]}}
+            elif position == SRDF_EVERY - 1 and v_idx > 0:
+                volume['protection'] = {'srdf': {
+                    'personality': 'TARGET',
+                    'associated_source_volume': {
+                        'id': urn('Volume', v_idx - 1)},
+                    'srdf_group_uri': urn('RemoteDirectorGroup',
+                                          v_idx % len(systems))}}
+
+            #
+            # exports - every initiator of the owner (cluster wide)
+            #
+            host = self.hosts[v_idx % len(self.hosts)] if self.hosts \
+                else None
+            if host is None:
+                continue
+            self.volume_host[v_uri] = host['id']
+            owners = self.cluster_hosts[host['cluster']['id']] \
+                if 'cluster' in host else [host['id']]
+            itls = []
+            for h_uri in owners:
+                for i_uri in self.host_initiators[h_uri]:
+                    initiator = self.get('initiator', i_uri)
+                    itls.append({
+                        'hlu': v_idx % 4096,
+                        'device': {'id': v_uri, 'wwn': volume['wwn']},
+                        'initiator': {'id': i_uri,
+                                      'port': initiator['initiator_port']},
+                        'target': {'id': ports[v_idx % len(ports)]},
+                        'export': {'id': urn('ExportGroup', v_idx)}})
+            self.volume_itls[v_uri] = itls
+
+    def __generate_unmanaged(self, unmanaged_per_owner):
+        systems = sorted(self.ids('storage_system'))
+        owners = [host['id'] for host in self.standalone_hosts] + \
+            sorted(self.cluster_hosts.keys())
+        idx = 0
+        for owner in owners:
+            self.unmanaged_by_owner[owner] = []
+            for u_idx in range(unmanaged_per_owner):
+                uri = urn('UnManagedVolume', idx)
+                vpool = self.vpools[idx % len(self.vpools)]
+                name = 'mock-umv-{0:06d}'.format(idx)
+                native = '{0:05X}'.format(idx % 0xfffff)
+                is_snap = 'true' if idx % UNMANAGED_SNAPSHOT_EVERY == 0 \
+                    else 'false'
+                self.add('unmanaged_volume', {
+                    'id': uri,
+                    'name': name,
+                    'native_guid': 'SYMMETRIX+{0}+VOLUME+{1}'.format(
+                        systems[idx % len(systems)], native),
+                    'storage_system': {'id': systems[idx % len(systems)]},
+                    'supported_virtual_pools': [vpool['id']],
+                    'wwn': '600009700001967153300{0:05X}'.format(idx),
+                    'unmanaged_volumes_characterstics': [
+                        {'name': 'IS_SNAP_SHOT', 'value': is_snap},
+                        {'name': 'IS_RECOVERPOINT_ENABLED',
+                         'value': 'false'},
+                        {'name': 'IS_FULL_COPY', 'value': 'false'},
+                        {'name': 'REMOTE_MIRRORING', 'value': 'false'},
+                        {'name': 'HAS_REPLICAS', 'value': 'false'},
+                        {'name': 'IS_VOLUME_EXPORTED', 'value': 'true'}],
+                    'unmanaged_volumes_info': [
+                        {'name': 'NATIVE_ID', 'value': native},
+                        {'name': 'PROVISIONED_CAPACITY',
+                         'value': '10737418240'}],
+                    'link': link('/vdc/unmanaged/volumes', uri)})
+                self.unmanaged_by_owner[owner].append(uri)
+                idx += 1
+
+    def __generate_catalog(self):
+        for idx, title in enumerate(CATALOG_SERVICES):
+            self.add('catalog_service', {
+                'id': urn('CatalogService', idx, 'global'),
+                'name': title.replace(' ', ''),
+                'title': title,
+                'inactive': False,
+                'link': link('/catalog/services',
+                             urn('CatalogService', idx, 'global'))})
+
+    #
+    # tasks and orders complete immediately
+    #
+    def completed_task(self, name, resource, uri=None):
+        task_uri = uri or urn('Task', self.next_sequence())
+        task = {
+            'id': task_uri,
+            'name': name,
+            'description': name.lower(),
+            'state': 'ready',
+            'message': 'Operation completed successfully',
+            'resource': resource,
+            'tenant': {'id': self.tenant},
+            'link': link('/vdc/tasks', task_uri)}
+        self.tasks[task_uri] = task
+        return task
+
+
+class RawPayload(str):
+    """
+    handler result sent as is, not JSON encoded
+    """
+    pass
+
+
+class ViprRestError(Exception):
+    def __init__(self, status, code, description, details=None):
+        self.status = status
+        self.body = {'code': code,
+                     'retryable': status in [503],
+                     'description': description,
+                     'details': details or description}
+
+
+class MockViprRest:
+    """
+    owns the inventory, auth tokens and HTTP listener; start()/stop() run
+    it on a background thread so benchmarks can use it in-process
+    """
+
+    #
+    # bulk POST url -> (inventory key, response key VseViprApi reads)
+    #
+    BULK = {
+        '/block/volumes/bulk': ('volume', 'volume'),
+        '/vdc/unmanaged/volumes/bulk': ('unmanaged_volume',
+                                        'unmanaged_volume'),
+        '/compute/hosts/bulk': ('host', 'host'),
+        '/compute/clusters/bulk': ('cluster', 'cluster'),
+        '/compute/initiators/bulk': ('initiator', 'initiators'),
+        '/vdc/storage-ports/bulk': ('storage_port', 'storage_port'),
+        '/vdc/storage-pools/bulk': ('storage_pool', 'storage_pool'),
+        '/catalog/services/bulk': ('catalog_service', 'catalog_service'),
+    }
+
+    #
+    # search collection -> inventory key
+    #
+    SEARCH = {
+        '/compute/hosts': 'host',
+        '/compute/clusters': 'cluster',
+        '/projects': 'project',
+        '/block/volumes': 'volume',
+        '/vdc/varrays': 'varray',
+        '/block/vpools': 'vpool',
+    }
+
+    #
+    # single object GET prefix -> inventory key
+    #
+    SINGLE = {
+        '/block/volumes': 'volume',
+        '/vdc/varrays': 'varray',
+        '/block/vpools': 'vpool',
+        '/projects': 'project',
+        '/vdc/storage-systems': 'storage_system',
+        '/vdc/storage-pools': 'storage_pool',
+        '/vdc/storage-ports': 'storage_port',
+        '/compute/hosts': 'host',
+        '/compute/clusters': 'cluster',
+        '/compute/initiators': 'initiator',
+        '/vdc/unmanaged/volumes': 'unmanaged_volume',
+    }
+
+    PROTECTION_KEYS = {
+        'snapshots': 'snapshot',
+        'snapshot-sessions': 'snapshot_session',
+        'continuous-copies': 'mirror',
+        'full-copies': 'volume',
+    }
+
+    def __init__(self, inventory, port=DEFAULT_PORT,
+                 username=DEFAULT_USER, password=DEFAULT_PASSWORD,
+                 latency_ms=0, bandwidth_bps=0,
+                 max_bulk_ids=0, max_request_bytes=0, error_rate=0.0,
+                 gzip_min_bytes=DEFAULT_GZIP_MIN_BYTES,
+                 backup_bytes=DEFAULT_BACKUP_BYTES, cut_download_after=0,
+                 reset_download=False):
+        self.inventory = inventory
+        self.port = port
+        self.username = username
+        self.password = password
+        self.throttle = Throttle(latency_ms, bandwidth_bps)
+        self.max_bulk_ids = max_bulk_ids
+        self.max_request_bytes = max_request_bytes
+        self.error_rate = error_rate
+        self.gzip_min_bytes = gzip_min_bytes
+        self.backup_bytes = backup_bytes
+        self.cut_download_after = cut_download_after
+        self.reset_download = reset_download
+        self.backup_base = None
+        self.backups = {}
+        self.tokens = set()
+        self.httpd = None
+        self.thread = None
+        self.stats = {'requests': 0, 'rejected': 0, 'bytes_in': 0,
+                      'bytes_out': 0, 'bytes_out_wire': 0, 'logins': 0,
+                      'by_route': {}}
+        self.stats_lock = threading.Lock()
+
+        self.routes = [
+            ('GET', r'^/login$', self.login),
+            ('GET', r'^/logout$', self.logout),
+            ('GET', r'^/user/whoami$', self.whoami),
+            ('GET', r'^/vdc/unmanaged/bulk$', self.bulk_ids_unmanaged),
+            ('GET', r'^(?P<path>/[a-z/-]+)/bulk$', self.bulk_ids),
+            ('POST', r'^/block/volumes/exports/bulk$', self.bulk_exports),
+            ('POST', r'^(?P<path>/[a-z/-]+)/bulk$', self.bulk_details),
+            ('GET', r'^(?P<path>/[a-z/-]+)/search$', self.search),
+            ('GET', r'^/projects/(?P<uri>[^/]+)/resources$',
+             self.project_resources),
+            ('GET', r'^/compute/hosts/(?P<uri>[^/]+)/initiators$',
+             self.host_initiators),
+            ('POST', r'^/compute/hosts/(?P<uri>[^/]+)/initiators$',
+             self.create_initiator),
+            ('GET', r'^/compute/clusters/(?P<uri>[^/]+)/hosts$',
+             self.cluster_hosts),
+            ('GET', r'^/compute/(?:hosts|clusters)/(?P<uri>[^/]+)/'
+                    r'unmanaged-volumes$', self.unmanaged_by_owner),
+            ('POST', r'^/compute/hosts$', self.create_host),
+            ('PUT', r'^/compute/hosts/(?P<uri>[^/]+)$', self.update_host),
+            ('POST', r'^/tenants/(?P<uri>[^/]+)/clusters$',
+             self.create_cluster),
+            ('GET', r'^/block/volumes/(?P<uri>[^/]+)/protection/'
+                    r'(?P<kind>[a-z-]+)$', self.volume_protection),
+            ('GET', r'^/block/volumes/(?P<uri>[^/]+)/tags$', self.get_tags),
+            ('PUT', r'^/block/volumes/(?P<uri>[^/]+)/tags$', self.put_tags),
+            ('GET', r'^/vdc/storage-systems$', self.storage_systems),
+            ('GET', r'^/vdc/storage-systems/(?P<uri>[^/]+)/storage-pools$',
+             self.storage_system_pools),
+            ('GET', r'^/vdc/storage-systems/(?P<uri>[^/]+)/storage-ports$',
+             self.storage_system_ports),
+            ('GET', r'^/vdc/storage-systems/(?P<uri>[^/]+)/rdf-groups/'
+                    r'(?P<rdfg>[^/]+)$', self.rdf_group),
+            ('GET', r'^/vdc/tasks/(?P<uri>[^/]+)$', self.task),
+            ('POST', r'^/backupset/backup$', self.backup_create),
+            ('DELETE', r'^/backupset/backup$', self.backup_delete),
+            ('GET', r'^/backupset/download$', self.backup_download),
+            ('POST', r'^/catalog/orders$', self.create_order),
+            ('GET', r'^/catalog/orders/(?P<uri>[^/]+)$', self.order),
+            ('GET', r'^(?P<path>/[a-z/-]+)/(?P<uri>urn:[^/]+)$',
+             self.single),
+        ]
+        self.routes = [(method, re.compile(pattern), handler)
+                       for method, pattern, handler in self.routes]
+
+    def count(self, route, bytes_in, bytes_out, rejected=False):
+        with self.stats_lock:
+            self.stats['requests'] += 1
+            self.stats['bytes_in'] += bytes_in
+            self.stats['bytes_out'] += bytes_out
+            if rejected:
+                self.stats['rejected'] += 1
+            self.stats['by_route'][route] = \
+                self.stats['by_route'].get(route, 0) + 1
+
+    def count_wire(self, bytes_out):
+        with self.stats_lock:
+            self.stats['bytes_out_wire'] += bytes_out
+
+    #
+    # content encoding, returns (encoding or None, payload)
+    #
+    def encode(self, accept_encoding, payload):
+        if not self.gzip_min_bytes or len(payload) < self.gzip_min_bytes:
+            return None, payload
+        accepted = [e.split(';')[0].strip()
+                    for e in (accept_encoding or '').split(',')]
+        if 'gzip' in accepted:
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            return 'gzip', compressor.compress(payload) + compressor.flush()
+        if 'deflate' in accepted:
+            return 'deflate', zlib.compress(payload, 6)
+        return None, payload
+
+    #
+    # socket plumbing
+    #
+    def start(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', self.port),
+                                         MockViprRestHandler)
+        self.httpd.rest = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       kwargs={'poll_interval': 0.5},
+                                       name='mock-vipr-rest')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    #
+    # request dispatch, returns (status, headers dict, body string)
+    #
+    def dispatch(self, method, raw_path, headers, body):
+        parsed = urlparse.urlparse(raw_path)
+        query = urlparse.parse_qs(parsed.query)
+        route = '{0} {1}'.format(method, 'unknown')
+        self.throttle.wait_latency()
+
+        try:
+            if self.max_request_bytes and len(body) > self.max_request_bytes:
+                raise ViprRestError(413, 1013, 'Request body too large',
+                                    '{0} bytes exceeds {1}'.format(
+                                        len(body), self.max_request_bytes))
+
+            for r_method, pattern, handler in self.routes:
+                match = pattern.match(parsed.path)
+                if r_method != method or match is None:
+                    continue
+                route = '{0} {1}'.format(method, pattern.pattern)
+                if handler != self.login and \
+                   headers.get(VIPR_AUTH_HEADER) not in self.tokens:
+                    raise ViprRestError(401, 1009, 'Unauthorized')
+                if self.error_rate and \
+                   handler not in [self.login, self.logout] and \
+                   random.random() < self.error_rate:
+                    raise ViprRestError(503, 1011, 'Service unavailable',
+                                        'Injected transient failure')
+                status, rsp_headers, payload = handler(
+                    headers=headers, query=query,
+                    body=json.loads(body) if body and
+                    body.lstrip().startswith('{') else body,
+                    **match.groupdict())
+                rsp = payload if isinstance(payload, RawPayload) \
+                    else json.dumps(payload)
+                self.count(route, len(body), len(rsp))
+                return status, rsp_headers, rsp
+
+            raise ViprRestError(404, 1006, 'Resource not found',
+                                '{0} {1} is not served by mock'.format(
+                                    method, parsed.path))
+
+        except ViprRestError as e:
+            rsp = json.dumps(e.body)
+            self.count(route, len(body), len(rsp), rejected=True)
+            return e.status, {}, rsp
+
+    def __object(self, key, uri):
+        obj = self.inventory.get(key, uri)
+        if obj is None:
+            raise ViprRestError(404, 1006, 'Unable to find entity',
+                                'Unable to find entity specified in URL: '
+                                '{0}'.format(uri))
+        return obj
+
+    def __requested_ids(self, body):
+        ids = body.get('id') if isinstance(body, dict) else None
+        if ids is None:
+            raise ViprRestError(400, 1008, 'Parameter was missing',
+                                'Required parameter id was missing')
+        if self.max_bulk_ids and len(ids) > self.max_bulk_ids:
+            raise ViprRestError(400, 1008, 'Parameter was invalid',
+                                'Number of ids {0} exceeds bulk limit '
+                                '{1}'.format(len(ids), self.max_bulk_ids))
+        return ids
+
+    #
+    # auth
+    #
+    def login(self, headers, **kwargs):
+        auth = headers.get('Authorization', '')
+        if auth.startswith('Basic '):
+            user, pwd = base64.b64decode(auth[6:]).split(':', 1)
+            if user == self.username and pwd == self.password:
+                token = uuid.uuid4().hex
+                with self.stats_lock:
+                    self.tokens.add(token)
+                    self.stats['logins'] += 1
+                return 200, {VIPR_AUTH_HEADER: token}, {'user': user}
+        raise ViprRestError(401, 1009, 'Unauthorized')
+
+    def logout(self, headers, **kwargs):
+        with self.stats_lock:
+            self.tokens.discard(headers.get(VIPR_AUTH_HEADER))
+        return 200, {}, {'user': self.username}
+
+    def whoami(self, **kwargs):
+        return 200, {}, {'common_name': self.username,
+                         'tenant': self.inventory.tenant,
+                         'roles': ['SYSTEM_ADMIN', 'TENANT_ADMIN']}
+
+    #
+    # bulk
+    #
+    def bulk_ids(self, path, **kwargs):
+        bulk = self.BULK.get(path + '/bulk')
+        if bulk is None:
+            raise ViprRestError(404, 1006, 'Resource not found')
+        return 200, {}, {'id': self.inventory.ids(bulk[0])}
+
+    def bulk_ids_unmanaged(self, **kwargs):
+        return 200, {}, {'id': self.inventory.ids('unmanaged_volume')}
+
+    def bulk_details(self, path, body, **kwargs):
+        bulk = self.BULK.get(path + '/bulk')
+        if bulk is None:
+            raise ViprRestError(404, 1006, 'Resource not found')
+        objects = []
+        for uri in self.__requested_ids(body):
+            obj = self.inventory.get(bulk[0], uri)
+            if obj is not None:
+                objects.append(obj)
+        return 200, {}, {bulk[1]: objects}
+
+    def bulk_exports(self, body, **kwargs):
+        itls = []
+        for uri in self.__requested_ids(body):
+            itls.extend(self.inventory.volume_itls.get(uri, []))
+        return 200, {}, {'itl': itls}
+
+    #
+    # search
+    #
+    def search(self, path, query, **kwargs):
+        key = self.SEARCH.get(path)
+        names = query.get('name')
+        if key is None or not names:
+            raise ViprRestError(400, 1008, 'Parameter was invalid',
+                                'Unsupported search on {0}'.format(path))
+        needle = names[0].lower()
+        resources = []
+        for obj in self.inventory.objects.get(key, {}).itervalues():
+            if needle in obj['name'].lower():
+                resources.append({'id': obj['id'], 'match': obj['name'],
+                                  'link': obj['link']})
+        return 200, {}, {'resource': resources}
+
+    #
+    # relations
+    #
+    def project_resources(self, uri, **kwargs):
+        self.__object('project', uri)
+        return 200, {}, {
+            'project_resource': self.inventory.project_resources[uri]}
+
+    def host_initiators(self, uri, **kwargs):
+        self.__object('host', uri)
+        return 200, {}, {'initiator': [
+            {'id': i_uri,
+             'name': self.inventory.get('initiator', i_uri)['name'],
+             'link': link('/compute/initiators', i_uri)}
+            for i_uri in self.inventory.host_initiators[uri]]}
+
+    def cluster_hosts(self, uri, **kwargs):
+        self.__object('cluster', uri)
+        return 200, {}, {'host': [
+            {'id': h_uri,
+             'name': self.inventory.get('host', h_uri)['name'],
+             'link': link('/compute/hosts', h_uri)}
+            for h_uri in self.inventory.cluster_hosts[uri]]}
+
+    def unmanaged_by_owner(self, uri, **kwargs):
+        return 200, {}, {
+            'unmanaged_volume': [
+                {'id': u_uri, 'link': link('/vdc/unmanaged/volumes', u_uri)}
+                for u_uri in self.inventory.unmanaged_by_owner.get(uri, [])],
+            'named_unmanaged_volume': []}
+
+    def volume_protection(self, uri, kind, **kwargs):
+        self.__object('volume', uri)
+        if kind not in self.PROTECTION_KEYS:
+            raise ViprRestError(404, 1006, 'Resource not found')
+        return 200, {}, {self.PROTECTION_KEYS[kind]: []}
+
+    def get_tags(self, uri, **kwargs):
+        self.__object('volume', uri)
+        return 200, {}, {'tag': sorted(self.inventory.tags.get(uri, set()))}
+
+    def put_tags(self, uri, body, **kwargs):
+        self.__object('volume', uri)
+        with self.inventory.lock:
+            tags = self.inventory.tags.setdefault(uri, set())
+            tags.update(body.get('add') or [])
+            tags.difference_update(body.get('remove') or [])
+            return 200, {}, {'tag': sorted(tags)}
+
+    def storage_systems(self, **kwargs):
+        return 200, {}, {'storage_system': [
+            {'id': ss['id'], 'name': ss['name'], 'link': ss['link']}
+            for ss in self.inventory.objects['storage_system'].values()]}
+
+    def storage_system_pools(self, uri, **kwargs):
+        return 200, {}, {'storage_pool': [
+            {'id': sp['id'], 'name': sp['name'], 'link': sp['link']}
+            for sp in self.inventory.objects['storage_pool'].values()
+            if sp['storage_system']['id'] == uri]}
+
+    def storage_system_ports(self, uri, **kwargs):
+        return 200, {}, {'storage_port': [
+            {'id': sp['id'], 'name': sp['name'], 'link': sp['link']}
+            for sp in self.inventory.objects['storage_port'].values()
+            if sp['storage_system']['id'] == uri]}
+
+    def rdf_group(self, uri, rdfg, **kwargs):
+        self.__object('storage_system', uri)
+        return 200, {}, {'id': rdfg,
+                         'name': 'mock-rdfg',
+                         'remote_group_id': '10',
+                         'source_group_id': '10',
+                         'storage_system': {'id': uri}}
+
+    def single(self, path, uri, **kwargs):
+        key = self.SINGLE.get(path)
+        if key is None:
+            raise ViprRestError(404, 1006, 'Resource not found')
+        return 200, {}, self.__object(key, uri)
+
+    #
+    # mutations - all complete immediately
+    #
+    #
+    # duplicate checks run under the inventory lock, so concurrent creates
+    # see each other, as they would on ViPR
+    #
+    def create_host(self, body, **kwargs):
+        name = body.get('name')
+        with self.inventory.lock:
+            for host in self.inventory.objects['host'].itervalues():
+                if host['name'] == name:
+                    raise ViprRestError(400, 1008, 'Parameter was invalid',
+                                        'A host with the same name already '
+                                        'exists: {0}'.format(name))
+            uri = urn('Host', 10000000 + self.inventory.next_sequence())
+            host = self.inventory.add('host', {
+                'id': uri,
+                'name': name,
+                'host_name': body.get('host_name'),
+                'type': body.get('type'),
+                'tenant': {'id': body.get('tenant')},
+                'discoverable': body.get('discoverable', 'true') != 'false',
+                'inactive': False,
+                'link': link('/compute/hosts', uri)})
+            self.inventory.host_initiators[uri] = []
+            if body.get('cluster'):
+                host['cluster'] = {'id': body.get('cluster')}
+                self.inventory.cluster_hosts.setdefault(
+                    body.get('cluster'), []).append(uri)
+        return 202, {}, self.inventory.completed_task(
+            'CREATE HOST', {'id': uri, 'name': name})
+
+    def update_host(self, uri, body, **kwargs):
+        host = self.__object('host', uri)
+        for key in ['name', 'host_name', 'type']:
+            if key in body:
+                host[key] = body[key]
+        return 202, {}, self.inventory.completed_task(
+            'UPDATE HOST', {'id': uri, 'name': host['name']})
+
+    def create_cluster(self, uri, body, **kwargs):
+        with self.inventory.lock:
+            c_uri = urn('Cluster', 10000000 + self.inventory.next_sequence())
+            cluster = self.inventory.add('cluster', {
+                'id': c_uri,
+                'name': body.get('name'),
+                'tenant': {'id': uri},
+                'inactive': False,
+                'link': link('/compute/clusters', c_uri)})
+            self.inventory.cluster_hosts[c_uri] = []
+        return 200, {}, cluster
+
+    def create_initiator(self, uri, body, **kwargs):
+        self.__object('host', uri)
+        port = body.get('initiator_port', '').lower()
+        with self.inventory.lock:
+            for initiator in self.inventory.objects['initiator'].itervalues():
+                if initiator['initiator_port'].lower() == port:
+                    raise ViprRestError(400, 1008, 'Parameter was invalid',
+                                        'An initiator with the same port '
+                                        'already exists: {0}'.format(port))
+            initiator = self.inventory.add_initiator(
+                uri, body.get('protocol'), body.get('initiator_node'),
+                body.get('initiator_port'), body.get('name'))
+        return 202, {}, self.inventory.completed_task(
+            'ADD HOST INITIATOR', {'id': initiator['id'],
+                                   'name': initiator['name']})
+
+    def task(self, uri, **kwargs):
+        task = self.inventory.tasks.get(uri)
+        if task is None:
+            task = self.inventory.completed_task('MOCK TASK', {}, uri)
+        return 200, {}, task
+
+    def create_order(self, body, **kwargs):
+        match = re.search(r'<catalog_service>\s*([^<\s]+)\s*<', body or '')
+        service = self.inventory.get('catalog_service',
+                                     match.group(1) if match else None)
+        number = self.inventory.next_sequence()
+        order = {
+            'id': urn('Order', number, 'global'),
+            'order_number': str(number),
+            'summary': service['title'] if service else 'unknown',
+            'order_status': 'SUCCESS' if service else 'ERROR',
+            'message': '' if service else 'Unknown catalog service',
+            'link': link('/catalog/orders', urn('Order', number, 'global'))}
+        self.inventory.orders[order['id']] = order
+        return 200, {}, order
+
+    def order(self, uri, **kwargs):
+        order = self.inventory.orders.get(uri)
+        if order is None:
+            raise ViprRestError(404, 1006, 'Unable to find entity')
+        return 200, {}, order
+
+
+    #
+    # backups - one random base, every backup gets its name inserted up
+    # front (shifting everything after it) and a few blocks rewritten
+    #
+    def backup_create(self, query, **kwargs):
+        name = query.get('tag', [''])[0]
+        with self.stats_lock:
+            if self.backup_base is None:
+                self.backup_base = os.urandom(self.backup_bytes)
+            content = bytearray(self.backup_base)
+            rnd = random.Random(len(self.backups))
+            for i in range(4):
+                offset = rnd.randint(0, max(0, len(content) - 4096))
+                content[offset:offset + 4096] = os.urandom(4096)
+            self.backups[name] = \
+                '{0} {1}\n'.format(name, time.time()) + str(content)
+        return 200, {}, {'name': name}
+
+    def backup_delete(self, query, **kwargs):
+        with self.stats_lock:
+            self.backups.pop(query.get('tag', [''])[0], None)
+        return 200, {}, {}
+
+    def backup_download(self, headers, query, **kwargs):
+        content = self.backups.get(query.get('tag', [''])[0])
+        if content is None:
+            raise ViprRestError(404, 1006, 'Unable to find entity')
+        rsp_headers = {'Content-Type': 'application/octet-stream',
+                       'Accept-Ranges': 'bytes'}
+        status = 200
+        match = re.match(r'bytes=(\d+)-$', headers.get('Range') or '')
+        if match is not None:
+            start = int(match.group(1))
+            if start >= len(content):
+                raise ViprRestError(416, 1008, 'Range not satisfiable')
+            rsp_headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+                start, len(content) - 1, len(content))
+            content = content[start:]
+            status = 206
+        with self.stats_lock:
+            cut = self.cut_download_after
+            self.cut_download_after = 0
+        if cut:
+            rsp_headers['X-Mock-Cut-After'] = str(cut)
+            if self.reset_download:
+                rsp_headers['X-Mock-Reset'] = '1'
+        return status, rsp_headers, RawPayload(content)
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                          BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class MockViprRestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    #
+    # keep-alive like ViPR; buffered writes without Nagle, otherwise status
+    # line, headers and body go out as separate segments and delayed ACKs
+    # add ~40ms to every request, swamping what is being measured
+    #
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def __handle(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length > 0 else ''
+        rest = self.server.rest
+        status, headers, payload = rest.dispatch(
+            self.command, self.path, self.headers, body)
+        encoding, payload = rest.encode(
+            self.headers.get('Accept-Encoding'), payload)
+        rest.count_wire(len(payload))
+        rest.throttle.wait_bytes(len(payload))
+
+        #
+        # X-Mock-Cut-After - drop the connection part way through the body,
+        # X-Mock-Reset - with RST (SO_LINGER 0) rather than a clean close
+        #
+        cut = int(headers.pop('X-Mock-Cut-After', 0))
+        reset = headers.pop('X-Mock-Reset', None) is not None
+        self.send_response(status)
+        self.send_header('Content-Type',
+                         headers.pop('Content-Type', 'application/json'))
+        self.send_header('Content-Length', str(len(payload)))
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if cut:
+            self.wfile.write(payload[:cut])
+            self.wfile.flush()
+            self.close_connection = 1
+            if reset:
+                self.connection.setsockopt(socket.SOL_SOCKET,
+                                           socket.SO_LINGER,
+                                           struct.pack('ii', 1, 0))
+                self.connection.close()
+            return
+        self.wfile.write(payload)
+
+    do_GET = __handle
+    do_POST = __handle
+    do_PUT = __handle
+    do_DELETE = __handle
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="%(prog)s runs a local stand-in for ViPR REST API "
+                    "with a synthetic inventory.")
+
+    o_args = parser.add_argument_group('Optional Arguments')
+    o_args.add_argument('-port', type=int, default=DEFAULT_PORT,
+                        help='Port to listen on, default {0}'.format(
+                            DEFAULT_PORT))
+    o_args.add_argument('-volumes', type=int, default=50000,
+                        help='Number of volumes to generate')
+    o_args.add_argument('-hosts', type=int, default=5000,
+                        help='Number of hosts to generate')
+    o_args.add_argument('-projects', type=int, default=50,
+                        help='Number of projects to generate')
+    o_args.add_argument('-latency_ms', type=int, default=0,
+                        help='Delay added to every request')
+    o_args.add_argument('-bandwidth_kbps', type=int, default=0,
+                        help='Response bandwidth cap in KB/s, 0 unlimited')
+    o_args.add_argument('-max_bulk_ids', type=int, default=0,
+                        help='Reject bulk POSTs with more ids, 0 unlimited')
+    o_args.add_argument('-max_request_kb', type=int, default=0,
+                        help='Reject larger request bodies, 0 unlimited')
+    o_args.add_argument('-error_rate', type=float, default=0.0,
+                        help='Share of requests answered with 503, 0-1')
+    o_args.add_argument('-gzip_min_bytes', type=int,
+                        default=DEFAULT_GZIP_MIN_BYTES,
+                        help='Compress responses this large, 0 never')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    started = time.time()
+    inventory = SyntheticInventory(volumes=args.volumes, hosts=args.hosts,
+                                   projects=args.projects)
+    rest = MockViprRest(inventory, port=args.port,
+                        latency_ms=args.latency_ms,
+                        bandwidth_bps=args.bandwidth_kbps * 1024,
+                        max_bulk_ids=args.max_bulk_ids,
+                        max_request_bytes=args.max_request_kb * 1024,
+                        error_rate=args.error_rate,
+                        gzip_min_bytes=args.gzip_min_bytes)
+    rest.start()
+    print "Mock ViPR REST listening on http://127.0.0.1:{0}, user {1}/{2}, " \
+          "inventory {3} generated in {4:.1f}s. Ctrl-C to stop.".format(
+              args.port, rest.username, rest.password, inventory.counts(),
+              time.time() - started)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        rest.stop()
+
+
+if __name__ == '__main__':
+    main()
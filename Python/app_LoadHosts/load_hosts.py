@@ -6,25 +6,37 @@ CSV export of an Excel spreadsheet or another report type (maybe ViPR SRM)
 Example CLI:
     -f [file name located in same path as the script] -m 1 -full_debug
     -f [file name located in same path as the script] -m 1 -full_debug -register_hosts
+    -f [file name located in same path as the script] -m 1 -register_hosts -workers 8
+    -f [file name located in same path as the script] -m 1 -register_hosts -resume 2016-01-05_10-20-30_pid1234
 
 Assumptions:
     all hosts will be loaded to the same tenant as username provided (and it must be Tenant Admin)
 
 High level steps:
-    1) read in external input data
-    2) for each row - issue API call to create a host
+    1) read in external input data (CSV - quote fields with commas in them), validate all of it
+    1a) pull all hosts, clusters and initiators from ViPR once, through bulk
+        endpoints, and index them (ComputeIndex) - rows resolve locally
+    2) for each row - issue API call to create a host. hosts are loaded by a
+       pool of -workers threads (default 1 - one row at a time); rows of one
+       host run in file order, a cluster is created once, by the first of
+       its hosts, before any of them is registered
     3) for the tenant at hand, report on how discovery of hosts is ongoing
     4) when number of successfully discovered hosts doesn't change, offer to quit.
 
+Every run journals the outcome of each row (VseJournal) into its session folder;
+-resume <session> skips rows that session (or the sessions it resumed) loaded successfully.
+
 Executing script AGAIN on same arguments (or when some clusters/hosts/initiators are already in ViPR)
 - for discovered hosts the script will update all provided fields (except for Human Host Name - it searches by that, so update would provide the same value back)
 - for registered hosts it will use the cluster/hosts it found, and will not register WWNs 2nd time
 """
 
 import argparse
+import csv
 import os
 import sys
-from vseLib.vseCmn import VseExceptions, vseCmn
+import threading
+from vseLib.vseCmn import VseExceptions, vseCmn, module_var
 from vseLib.VseViprApi import VseViprApi
 
 DEFAULT_ENV_CFG_FILE = r'./env_cfg.ini'
@@ -51,6 +63,14 @@ REG_H_WWNS  = 4
 REG_WWN_NAME = 0
 REG_WWN_PROT = 1
 REG_WWN_PWWN = 2
+
+#
+# input files may escape a comma as \, (how passwords with commas used to
+# be written), any other backslash is part of the value
+#
+ESCAPED_COMMA = '\\,'
+COMMA_PLACEHOLDER = '\x1f'
+
 register_hosts_headers = 'Cluster Name,Host Human Name,Host FQDN or IP,Host Type,' \
                          'WWNs Semicolon Separated Keys (Name/Protocol(FC|iSCSI)/WWN;Name/Protocol(FC|iSCSI)/WWN;)'
 
@@ -86,13 +106,25 @@ def parse_arguments():
                              'the input headers and each line body must change. See description '
                              'of script or error message for how exactly. The script will now load hosts '
                              'but not discover them, as well as follow up with WWN load')
+    o_args.add_argument('-resume', '-r',
+                        required=False,
+                        help='Session name (or path) of an earlier run of the same file, '
+                             'rows that run loaded successfully are skipped. Every run '
+                             'journals its rows into its session folder')
+    o_args.add_argument('-workers', '-w',
+                        required=False,
+                        help='How many hosts to load concurrently, 1 (default) '
+                             'loads them one at a time. Keep VseHttp HTTP_POOL_SIZE '
+                             'in env_cfg.ini at or above it')
 
     parser.set_defaults(
         env_settings=DEFAULT_ENV_CFG_FILE,
         default_local_path=DEFAULT_LOCAL_PATH,
         msg_level=vseCmn.MSG_LVL_INFO,
         full_debug=False,
-        register_hosts=False)
+        register_hosts=False,
+        resume=None,
+        workers=1)
 
     return parser.parse_args()
 
@@ -124,11 +156,16 @@ def main():
     exit_code = cmn.SUCCESS
     exit_msg = None
     try:
-        # read/parse/validate input data, stuff it into a data structure I find useful
-        l_of_host_info_lists = parse_input_file(
-            cmn,
-            os.path.join(DEFAULT_LOCAL_PATH, args.file),
-            args.register_hosts)
+        # validate input data up front - nothing is loaded from a dirty
+        # file. rows are not kept, they are read again as they get loaded
+        input_file_path = os.path.join(DEFAULT_LOCAL_PATH, args.file)
+        row_count = validate_input_file(cmn, input_file_path,
+                                        args.register_hosts)
+
+        # row outcomes go to the journal of this session, rows done in the
+        # session being resumed are not loaded again
+        from vseLib.VseJournal import VseJournal
+        journal = VseJournal(cmn, resume_session=args.resume)
 
         # instantiate VseViprApi and login to ViPR
         from vseLib.VseViprApi import VseViprApi
@@ -140,165 +177,63 @@ def main():
         about_me = vipr_api.get_who_am_i()
         tenant_uri = about_me.get('tenant')
 
-        # prepare for summary output
-        discovery_accepted_count = 0
-        discovery_failed_count = 0
-        discovery_host_existing_pwd_update_success_count = 0
-        discovery_host_existing_pwd_update_failure_count = 0
-        register_cluster_existing_count = 0
-        register_cluster_new_count = 0
-        register_cluster_fail_count = 0
-        register_host_existing_count = 0
-        register_host_new_count = 0
-        register_host_fail_count = 0
-        register_wwn_existing_count = 0
-        register_wwn_new_count = 0
-        register_wwn_fail_count = 0
-        status_chain = {}
-        # for each host - send in API call, and output appropriate message whether task was accepted or rejected. Keep tally of totals to print out.
-        for host_info_list in l_of_host_info_lists:
-            #
-            # discovering hosts
-            #
-            if not args.register_hosts:
-                # does host exist? update password! else discover anew
-                host_ids = vipr_api.search_by_name(
-                    vipr_api.IDX_SEARCH_TYPE_HOST,
-                    host_info_list[IDX_H_H_N].strip(),
-                    exact_match=True
-                )
-                # host exists, we update all we have but the name of it
-                if len(host_ids) == 1:
-                    host_uri = host_ids[0]
-                    (ret_code, details) = vipr_api.update_host(
-                        host_uri,
-                        fqdn=host_info_list[IDX_H_N_N].strip(),
-                        h_type=host_info_list[IDX_H_T].strip(),
-                        use_ssl=host_info_list[IDX_D_SSL].strip(),
-                        port=host_info_list[IDX_D_P_N].strip(),
-                        uname=host_info_list[IDX_H_U_N].strip(),
-                        pwd=host_info_list[IDX_H_PWD].strip()
-                    )
-
-                    if ret_code not in [200, 202]:
-                        discovery_host_existing_pwd_update_failure_count += 1
-                        status_chain[host_info_list[IDX_H_N_N]] = details
-                    else:
-                        discovery_host_existing_pwd_update_success_count += 1
-                # host doesn't exist, we attempt to create it
-                else:
-                    (ret_code, details) = vipr_api.discover_host(
-                        tenant_uri,
-                        host_info_list[IDX_H_H_N].strip(),
-                        host_info_list[IDX_H_N_N].strip(),
-                        host_info_list[IDX_H_T].strip(),
-                        host_info_list[IDX_D_SSL].strip(),
-                        host_info_list[IDX_D_P_N].strip(),
-                        host_info_list[IDX_H_U_N].strip(),
-                        host_info_list[IDX_H_PWD].strip(),
-                    )
-
-                    if ret_code not in [200, 202]:
-                        discovery_failed_count += 1
-                        status_chain[host_info_list[IDX_H_N_N]] = details
-                    else:
-                        discovery_accepted_count += 1
-
-            #
-            # registering clusters/hosts/initiators
-            #
-            if args.register_hosts:
-                # is cluster required? does cluster exist? if yes, get its ID. if not, create.
-                # On failure can exit handling
-                cluster_uri = ''
-                if len(host_info_list[REG_CLUSTER]) > 0:
-                    cluster_ids = vipr_api.search_by_name(
-                        vipr_api.IDX_SEARCH_TYPE_CLUSTER,
-                        host_info_list[REG_CLUSTER].strip(),
-                        exact_match=True
-                    )
-                    if len(cluster_ids) == 1:
-                        register_cluster_existing_count += 1
-                        cluster_uri = cluster_ids[0]
-                    else:
-                        (ret_code, details) = vipr_api.create_cluster(tenant_uri,
-                                                                      host_info_list[REG_CLUSTER])
-                        if ret_code not in [200, 202]:
-                            status_chain["{0}/{1}".format(host_info_list[REG_CLUSTER],
-                                                          host_info_list[REG_H_N_N])] = details
-                            register_cluster_fail_count += 1
-                            register_host_fail_count += 1
-                            register_wwn_fail_count += len(host_info_list[REG_H_WWNS])
-                            continue
-                        else:
-                            register_cluster_new_count += 1
-                            cluster_uri = details.get('id')
-
-                # does host exist? if yes, get its ID. if not, create.
-                # On failure can exit handling.
-                host_uri = ''
-                host_ids = vipr_api.search_by_name(
-                    vipr_api.IDX_SEARCH_TYPE_HOST,
-                    host_info_list[REG_H_H_N].strip(),
-                    exact_match=True
-                )
-                if len(host_ids) == 1:
-                    register_host_existing_count += 1
-                    host_uri = host_ids[0]
-                else:
-                    (ret_code, details) = vipr_api.register_host(
-                        tenant_uri,
-                        host_info_list[REG_H_H_N].strip(),
-                        host_info_list[REG_H_N_N].strip(),
-                        host_info_list[REG_H_T].strip(),
-                        cluster_urn=cluster_uri
-                    )
-                    if ret_code not in [200, 202]:
-                        status_chain[host_info_list[REG_H_N_N]] = details
-                        register_host_fail_count += 1
-                        register_wwn_fail_count += len(host_info_list[REG_H_WWNS])
-                        continue
-                    else:
-                        register_host_new_count += 1
-                        host_uri = details.get('resource').get('id')
-
-
-                # does host already have initiator? if yes, do nothing; else - register attempt
-                # for each WWN: api.register_initiator
-                vc_host_inits_info_lists = vipr_api.get_host_initiators(host_info_list[REG_H_N_N],
-                                                                        host_uri)
-                vc_host_init_wwn_list = list(
-                    init_dict.get('initiator_port').lower() for init_dict in vc_host_inits_info_lists)
-
-                host_wwns_info_lists = host_info_list[REG_H_WWNS]
-                for host_wwn_info_list in host_wwns_info_lists:
-                    if host_wwn_info_list[REG_WWN_PWWN].strip().lower() in vc_host_init_wwn_list:
-                        # we are done, initiator is already in the host
-                        register_wwn_existing_count += 1
-                        continue;
-
-                    # we only make user submit 1 wwn (the wwn of HBA card)
-                    # but the API takes init_node and init_port that can be same wwn...
-                    # so whatever. I don't mind submitting it twice to keep flexibility in ViPRAPI lib.
-                    (ret_code, details) = vipr_api.register_initiator(
-                        host_uri,
-                        host_wwn_info_list[REG_WWN_NAME].strip(),
-                        host_wwn_info_list[REG_WWN_PROT].strip(),
-                        host_wwn_info_list[REG_WWN_PWWN].strip(),
-                        host_wwn_info_list[REG_WWN_PWWN].strip(),
-                    )
-
-                    if ret_code not in [200, 202]:
-                        status_chain["{0}/{1}".format(host_info_list[REG_H_N_N],
-                                                      host_wwn_info_list[REG_WWN_PWWN])] = details
-                        register_wwn_fail_count += 1
-                        continue
-
-                    register_wwn_new_count += 1
-
+        # what ViPR already has - one bulk pass instead of lookups per row
+        compute_index = ComputeIndex(cmn, vipr_api, args.register_hosts)
+
+        # WWNs that belong to another host - nothing is loaded until the
+        # file is fixed, same as for dirty rows
+        if args.register_hosts:
+            validate_wwn_ownership(cmn, compute_index, input_file_path)
+
+        # rows stream from the file to the workers. rows of the same host
+        # go to the same worker, in file order, so a host is created once
+        # and before its initiators. different hosts are loaded
+        # concurrently, over at most args.workers threads
+        h_h_n_idx = REG_H_H_N if args.register_hosts else IDX_H_H_N
+
+        load_row = register_host_row if args.register_hosts \
+            else discover_host_row
+        load_step = 'register host' if args.register_hosts \
+            else 'discover host'
+        tally = LoadTally()
+
+        def load_one_row(host_info_list):
+            # rows that went through in the resumed session are skipped
+            row_key = journal.make_key(load_step, host_info_list)
+            if journal.is_done(row_key):
+                tally.add('resumed_row_skipped_count')
+                return
+            row_done = load_row(vipr_api, concurrent_api, compute_index,
+                                tenant_uri, tally, host_info_list)
+            journal.record(row_key,
+                           journal.OUTCOME_DONE if row_done
+                           else journal.OUTCOME_FAILED,
+                           host_info_list[h_h_n_idx].strip())
+
+        # rows over args.workers, the calls a row fans out (initiators)
+        # over the default number of workers
+        from vseLib.VseViprApiConcurrent import VseViprApiConcurrent
+        rows_api = VseViprApiConcurrent(cmn, vipr_api,
+                                        workers=int(args.workers))
+        concurrent_api = VseViprApiConcurrent(cmn, vipr_api)
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Loading {0} rows over {1} workers...".format(
+                         row_count, args.workers))
+        load_error = None
+        try:
+            rows_api.fan_out_by_key(
+                "load hosts", load_one_row,
+                ((host_info_list,) for host_info_list in read_input_file(
+                    cmn, input_file_path, args.register_hosts,
+                    DirtyRows())),
+                lambda row_args: row_args[0][h_h_n_idx].strip())
+        except VseExceptions.VSEViPRAPIExc as e:
+            # rows that went through are still worth a summary
+            load_error = e
 
         cmn.printMsg(cmn.MSG_LVL_INFO, '\n'
                      'Total host loads attempted: {0}\n'
+                     'Total host loads skipped, done in resumed session: {14}\n'
                      'Total host discoveries accepted : {1}\n'
                      'Total host discoveries rejected : {2}\n'
                      'Total host update succeeded/failed: {12},{13}\n'
@@ -306,22 +241,27 @@ def main():
                      'Total host registrations existed/succeeded/failed: {6},{7},{8}\n'
                      'Total initiator registrations existed/succeeded/failed: {9},{10},{11}\n'
                      'Listing failed Cluster/Host/Initiator loads:'.format(
-                         len(l_of_host_info_lists),
-                         discovery_accepted_count,
-                         discovery_failed_count,
-                         register_cluster_existing_count,
-                         register_cluster_new_count,
-                         register_cluster_fail_count,
-                         register_host_existing_count,
-                         register_host_new_count,
-                         register_host_fail_count,
-                         register_wwn_existing_count,
-                         register_wwn_new_count,
-                         register_wwn_fail_count,
-                         discovery_host_existing_pwd_update_success_count,
-                         discovery_host_existing_pwd_update_failure_count,
+                         row_count,
+                         tally.get('discovery_accepted_count'),
+                         tally.get('discovery_failed_count'),
+                         tally.get('register_cluster_existing_count'),
+                         tally.get('register_cluster_new_count'),
+                         tally.get('register_cluster_fail_count'),
+                         tally.get('register_host_existing_count'),
+                         tally.get('register_host_new_count'),
+                         tally.get('register_host_fail_count'),
+                         tally.get('register_wwn_existing_count'),
+                         tally.get('register_wwn_new_count'),
+                         tally.get('register_wwn_fail_count'),
+                         tally.get('discovery_host_existing_pwd_update_success_count'),
+                         tally.get('discovery_host_existing_pwd_update_failure_count'),
+                         tally.get('resumed_row_skipped_count'),
                      ),
-                     status_chain)
+                     tally.get_status_chain())
+
+        journal.close()
+        if load_error is not None:
+            raise load_error
 
         vipr_api.logout()
 
@@ -334,7 +274,227 @@ def main():
     cmn.exit(exit_code, exit_msg)
 
 
-def parse_input_file(cmn, file_path, register_hosts):
+#
+# discovering hosts
+# returns True when row went through
+#
+def discover_host_row(vipr_api, concurrent_api, compute_index, tenant_uri,
+                      tally, host_info_list):
+    # does host exist? update password! else discover anew
+    host_ids = compute_index.find_hosts(host_info_list[IDX_H_H_N].strip())
+    # host exists, we update all we have but the name of it
+    if len(host_ids) == 1:
+        host_uri = host_ids[0]
+        (ret_code, details) = vipr_api.update_host(
+            host_uri,
+            fqdn=host_info_list[IDX_H_N_N].strip(),
+            h_type=host_info_list[IDX_H_T].strip(),
+            use_ssl=host_info_list[IDX_D_SSL].strip(),
+            port=host_info_list[IDX_D_P_N].strip(),
+            uname=host_info_list[IDX_H_U_N].strip(),
+            pwd=host_info_list[IDX_H_PWD].strip()
+        )
+
+        if ret_code not in [200, 202]:
+            tally.add('discovery_host_existing_pwd_update_failure_count')
+            tally.add_failure(host_info_list[IDX_H_N_N], details)
+            return False
+        else:
+            tally.add('discovery_host_existing_pwd_update_success_count')
+    # host doesn't exist, we attempt to create it
+    else:
+        (ret_code, details) = vipr_api.discover_host(
+            tenant_uri,
+            host_info_list[IDX_H_H_N].strip(),
+            host_info_list[IDX_H_N_N].strip(),
+            host_info_list[IDX_H_T].strip(),
+            host_info_list[IDX_D_SSL].strip(),
+            host_info_list[IDX_D_P_N].strip(),
+            host_info_list[IDX_H_U_N].strip(),
+            host_info_list[IDX_H_PWD].strip(),
+        )
+
+        if ret_code not in [200, 202]:
+            tally.add('discovery_failed_count')
+            tally.add_failure(host_info_list[IDX_H_N_N], details)
+            return False
+        else:
+            tally.add('discovery_accepted_count')
+            # later rows for this host update it instead of discovering again
+            compute_index.add_host(host_info_list[IDX_H_H_N].strip(),
+                                   details.get('resource').get('id'))
+
+    return True
+
+
+#
+# registering clusters/hosts/initiators
+# returns True when row went through, with all of its initiators
+#
+def register_host_row(vipr_api, concurrent_api, compute_index, tenant_uri,
+                      tally, host_info_list):
+    # is cluster required? does cluster exist? if yes, get its ID. if not, create.
+    # On failure can exit handling. cluster lock - rows of other hosts in
+    # the same cluster wait for it to be created, instead of creating it again
+    cluster_uri = ''
+    if len(host_info_list[REG_CLUSTER]) > 0:
+        cluster_name = host_info_list[REG_CLUSTER].strip()
+        with compute_index.get_cluster_lock(cluster_name):
+            cluster_ids = compute_index.find_clusters(cluster_name)
+            if len(cluster_ids) == 1:
+                tally.add('register_cluster_existing_count')
+                cluster_uri = cluster_ids[0]
+            else:
+                (ret_code, details) = vipr_api.create_cluster(tenant_uri,
+                                                              host_info_list[REG_CLUSTER])
+                if ret_code not in [200, 202]:
+                    tally.add_failure("{0}/{1}".format(host_info_list[REG_CLUSTER],
+                                                       host_info_list[REG_H_N_N]), details)
+                    tally.add('register_cluster_fail_count')
+                    tally.add('register_host_fail_count')
+                    tally.add('register_wwn_fail_count', len(host_info_list[REG_H_WWNS]))
+                    return False
+                else:
+                    tally.add('register_cluster_new_count')
+                    cluster_uri = details.get('id')
+                    compute_index.add_cluster(cluster_name, cluster_uri)
+
+    # does host exist? if yes, get its ID. if not, create.
+    # On failure can exit handling.
+    host_uri = ''
+    host_ids = compute_index.find_hosts(host_info_list[REG_H_H_N].strip())
+    if len(host_ids) == 1:
+        tally.add('register_host_existing_count')
+        host_uri = host_ids[0]
+    else:
+        (ret_code, details) = vipr_api.register_host(
+            tenant_uri,
+            host_info_list[REG_H_H_N].strip(),
+            host_info_list[REG_H_N_N].strip(),
+            host_info_list[REG_H_T].strip(),
+            cluster_urn=cluster_uri
+        )
+        if ret_code not in [200, 202]:
+            tally.add_failure(host_info_list[REG_H_N_N], details)
+            tally.add('register_host_fail_count')
+            tally.add('register_wwn_fail_count', len(host_info_list[REG_H_WWNS]))
+            return False
+        else:
+            tally.add('register_host_new_count')
+            host_uri = details.get('resource').get('id')
+            compute_index.add_host(host_info_list[REG_H_H_N].strip(), host_uri)
+
+    # does host already have initiator? if yes, do nothing; else - register attempt
+    missing_wwns_info_lists = []
+    for host_wwn_info_list in host_info_list[REG_H_WWNS]:
+        if compute_index.get_wwn_host(host_wwn_info_list[REG_WWN_PWWN]) == host_uri:
+            # we are done, initiator is already in the host
+            tally.add('register_wwn_existing_count')
+        else:
+            missing_wwns_info_lists.append(host_wwn_info_list)
+
+    # missing ones are registered concurrently
+    # we only make user submit 1 wwn (the wwn of HBA card)
+    # but the API takes init_node and init_port that can be same wwn...
+    # so whatever. I don't mind submitting it twice to keep flexibility in ViPRAPI lib.
+    results = concurrent_api.fan_out(
+        "register {0} initiators".format(host_info_list[REG_H_N_N]),
+        vipr_api.register_initiator,
+        [(host_uri,
+          host_wwn_info_list[REG_WWN_NAME].strip(),
+          host_wwn_info_list[REG_WWN_PROT].strip(),
+          host_wwn_info_list[REG_WWN_PWWN].strip(),
+          host_wwn_info_list[REG_WWN_PWWN].strip())
+         for host_wwn_info_list in missing_wwns_info_lists])
+
+    all_wwns_registered = True
+    for host_wwn_info_list, (ret_code, details) in zip(missing_wwns_info_lists,
+                                                       results):
+        if ret_code not in [200, 202]:
+            tally.add_failure("{0}/{1}".format(host_info_list[REG_H_N_N],
+                                               host_wwn_info_list[REG_WWN_PWWN]), details)
+            tally.add('register_wwn_fail_count')
+            all_wwns_registered = False
+            continue
+
+        tally.add('register_wwn_new_count')
+        compute_index.add_initiator(host_uri,
+                                    host_wwn_info_list[REG_WWN_PWWN],
+                                    (details.get('resource') or {}).get('id'))
+
+    return all_wwns_registered
+
+
+def validate_input_file(cmn, file_path, register_hosts):
+    """
+    reads file_path through, keeping only dirty rows (a sample of them)
+    :return: number of clean rows
+    raises VSEViPRAPIExc if file is missing or has dirty rows
+    """
+    dirty_rows = DirtyRows()
+    row_count = 0
+    for host_info_list in read_input_file(cmn, file_path, register_hosts,
+                                          dirty_rows):
+        row_count += 1
+
+    if dirty_rows.get_count() > 0:
+        cmn.printMsg(cmn.MSG_LVL_WARNING,
+                     "Below data lines are dirty - they didn't pass the filters "
+                     "({0} dirty, {1} listed):".format(
+                         dirty_rows.get_count(),
+                         len(dirty_rows.get_sample())),
+                     dirty_rows.get_sample())
+        raise VseExceptions.VSEViPRAPIExc('Invalid data submitted, not running any load until data is cleaned up')
+
+    return row_count
+
+
+def validate_wwn_ownership(cmn, compute_index, file_path):
+    """
+    reads registration file_path through, checks every WWN is registered
+    to no host or to the host of its row, and that no two hosts of the
+    file claim the same WWN
+    raises VSEViPRAPIExc if any of them do not
+    """
+    conflicts = DirtyRows()
+    wwn_rows = {}
+    for host_info_list in read_input_file(cmn, file_path, True, DirtyRows()):
+        host_name = host_info_list[REG_H_H_N].strip()
+        host_ids = compute_index.find_hosts(host_name)
+        host_uri = host_ids[0] if len(host_ids) == 1 else None
+
+        for host_wwn_info_list in host_info_list[REG_H_WWNS]:
+            wwn = host_wwn_info_list[REG_WWN_PWWN].strip().lower()
+            owner_uri = compute_index.get_wwn_host(wwn)
+            if owner_uri is not None and owner_uri != host_uri:
+                conflicts.add("host " + host_name, [
+                    wwn, 'registered to host',
+                    compute_index.get_host_name(owner_uri) or owner_uri])
+
+            other_host_name = wwn_rows.setdefault(wwn, host_name)
+            if other_host_name != host_name:
+                conflicts.add("host " + host_name, [
+                    wwn, 'also in file for host', other_host_name])
+
+    if conflicts.get_count() > 0:
+        cmn.printMsg(cmn.MSG_LVL_WARNING,
+                     "Below WWNs belong to another host ({0} conflicts, {1} "
+                     "listed):".format(conflicts.get_count(),
+                                       len(conflicts.get_sample())),
+                     conflicts.get_sample())
+        raise VseExceptions.VSEViPRAPIExc('WWNs of other hosts submitted, not running any load until data is cleaned up')
+
+
+def read_input_file(cmn, file_path, register_hosts, dirty_rows):
+    """
+    generator - yields validated rows of file_path one at a time, as they
+    are read. dirty rows are not yielded, they go to dirty_rows.
+
+    CSV the way Excel writes it: fields with commas (passwords...) in
+    double quotes, a double quote in a quoted field doubled. backslashes
+    are data (CORP\\admin), the only escape is the legacy backslash-comma
+    (pass\\,word), which reads as a comma
+    """
     cmn.printMsg(cmn.MSG_LVL_DEBUG,
                  'Reading file [{0}]...'.format(file_path))
 
@@ -343,49 +503,48 @@ def parse_input_file(cmn, file_path, register_hosts):
         cmn.printMsg(cmn.MSG_LVL_WARNING, msg)
         raise VseExceptions.VSEViPRAPIExc(msg)
 
-    l_of_host_info_lists = []
+    expected_headers = register_hosts_headers if register_hosts \
+        else discover_hosts_headers
+
+    with open(file_path, 'rb') as contents:
+        # legacy \, is swapped for a placeholder before csv sees the line,
+        # and back to a plain comma in the parsed fields
+        reader = csv.reader(line.replace(ESCAPED_COMMA, COMMA_PLACEHOLDER)
+                            for line in contents)
 
-    with open(file_path, 'r') as contents:
         #
         # qualify headers
         # check that headers are in the right order and the right names
         # whether each entry is 'required' will be checking contents.
         #
-        headers = contents.readline().strip()
-        if not register_hosts and headers != discover_hosts_headers:
-            msg = 'Expected headers are: {0}'.format(discover_hosts_headers)
-            cmn.printMsg(cmn.MSG_LVL_ERROR, msg)
-            raise VseExceptions.VSEViPRAPIExc(msg)
-        elif register_hosts and headers != register_hosts_headers:
-            msg = 'Expected headers are: {0}'.format(register_hosts_headers)
+        headers = next(reader, [])
+        if [header.strip() for header in headers] != \
+                expected_headers.split(','):
+            msg = 'Expected headers are: {0}'.format(expected_headers)
             cmn.printMsg(cmn.MSG_LVL_ERROR, msg)
             raise VseExceptions.VSEViPRAPIExc(msg)
 
         # remember how many data elements in each data line are required
-        data_element_count = len(discover_hosts_headers.split(',')) if not register_hosts \
-            else len(register_hosts_headers.split(','))
-        offending_data_rows = []
+        data_element_count = len(expected_headers.split(','))
 
-        for line in contents:
-            # this is nice and clean, but what if the password has a comma in it?
-            # we are hosed... would need to change password on 1,000s of hosts.
-            #
+        for values in reader:
+            values = [value.replace(COMMA_PLACEHOLDER, ',')
+                      for value in values]
 
-            # http://stackoverflow.com/questions/18092354/python-split-string-without-splitting-escaped-character
-            #   There is a much easier way using a regex with a negative lookbehind assertion:
-            # solution: re.split(r'(?<!\\):', str)
-            values = line.strip().split(',')
+            # blank line
+            if len(values) == 0:
+                continue
 
             # protect against wrong element count, jump to next row
             if len(values) != data_element_count:
-                offending_data_rows.append(line)
+                dirty_rows.add("line {0}".format(reader.line_num), values)
                 continue
 
-            invalid_wwns_format = False
             if register_hosts:
                 wwns_element = values[REG_H_WWNS]
                 wwn_keys = wwns_element.strip().split(';')
                 wwns_info = []
+                invalid_wwns_format = False
                 for wwn_key in wwn_keys:
                     # just skip over it if it is an empty string - probably last semicolon
                     if len(wwn_key) == 0:
@@ -397,24 +556,203 @@ def parse_input_file(cmn, file_path, register_hosts):
                         continue
                     wwns_info.append(wwn_data)
 
+                # but if there was a problem with 1 of user provided wwn strings, kill the whole thing
+                if invalid_wwns_format:
+                    dirty_rows.add("line {0}".format(reader.line_num), values)
+                    continue
+
                 # in-place sub user provided string with list of lists on host WWNs.
                 values[REG_H_WWNS] = wwns_info
 
-            # but if there was a problem with 1 of user provided wwn strings, kill the whole thing
-            if invalid_wwns_format:
-                offending_data_rows.append(line)
-                continue
-
-            # save data to be returned
-            l_of_host_info_lists.append(values)
-
-        if len(offending_data_rows) > 0:
-            cmn.printMsg(cmn.MSG_LVL_WARNING,
-                         "Below data lines are dirty - they didn't pass the filters:",
-                         offending_data_rows)
-            raise VseExceptions.VSEViPRAPIExc('Invalid data submitted, not running any load until data is cleaned up')
+            yield values
 
-    return l_of_host_info_lists
+
+class DirtyRows:
+    """
+    dirty rows of an input file - how many, and the first SAMPLE_SIZE of
+    them with where they are (line number...), for the report
+    """
+
+    SAMPLE_SIZE = 100
+
+    IDX_COUNT = "dirty row count"
+    IDX_SAMPLE = "first dirty rows"
+
+    def __init__(self):
+        self.data = {}
+        module_var(self, self.IDX_COUNT, 0)
+        module_var(self, self.IDX_SAMPLE, [])
+
+    def add(self, where, values):
+        module_var(self, self.IDX_COUNT, module_var(self, self.IDX_COUNT) + 1)
+        if len(module_var(self, self.IDX_SAMPLE)) < self.SAMPLE_SIZE:
+            module_var(self, self.IDX_SAMPLE).append(
+                "{0}: {1}".format(where, ','.join(values)))
+
+    def get_count(self):
+        return module_var(self, self.IDX_COUNT)
+
+    def get_sample(self):
+        return module_var(self, self.IDX_SAMPLE)
+
+
+class LoadTally:
+    """
+    summary counters and status_chain (failed load => ViPR details),
+    updated by every worker
+    """
+
+    IDX_LOCK = "tally_lock"
+    IDX_COUNTERS = "counters"
+    IDX_STATUS_CHAIN = "status_chain"
+
+    def __init__(self):
+        self.data = {}
+        module_var(self, self.IDX_LOCK, threading.Lock())
+        module_var(self, self.IDX_COUNTERS, {})
+        module_var(self, self.IDX_STATUS_CHAIN, {})
+
+    def add(self, name, value=1):
+        with module_var(self, self.IDX_LOCK):
+            counters = module_var(self, self.IDX_COUNTERS)
+            counters[name] = counters.get(name, 0) + value
+
+    def add_failure(self, key, details):
+        with module_var(self, self.IDX_LOCK):
+            module_var(self, self.IDX_STATUS_CHAIN)[key] = details
+
+    def get(self, name):
+        with module_var(self, self.IDX_LOCK):
+            return module_var(self, self.IDX_COUNTERS).get(name, 0)
+
+    def get_status_chain(self):
+        with module_var(self, self.IDX_LOCK):
+            return dict(module_var(self, self.IDX_STATUS_CHAIN))
+
+
+class ComputeIndex:
+    """
+    hosts, clusters and initiators ViPR has, pulled once through the bulk
+    endpoints and indexed, so every CSV row resolves locally - what is
+    left on the network is the creates that are actually needed.
+
+    names map to lists of URNs, same as an exact match search would
+    return, so duplicates in ViPR still show up as "not exactly one".
+    objects created during the run are added as they are created.
+
+    discovery only looks hosts up, clusters and initiators are loaded for
+    registration only.
+    """
+
+    IDX_CMN = "lib_cmn"
+    IDX_LOCK = "index_lock"
+    IDX_HOSTS_BY_NAME = "host name => host urns"
+    IDX_CLUSTERS_BY_NAME = "cluster name => cluster urns"
+    IDX_HOST_NAMES = "host urn => host name"
+    IDX_INITIATORS_BY_WWN = "lowercase port wwn => (initiator urn, host urn)"
+    IDX_CLUSTER_LOCKS = "cluster name => creation lock"
+
+    def __init__(self, cmn, vipr_api, register_hosts):
+        from vseLib.VseViprApiConcurrent import VseViprApiConcurrent
+
+        self.data = {}
+        module_var(self, self.IDX_CMN, cmn)
+        module_var(self, self.IDX_LOCK, threading.Lock())
+        module_var(self, self.IDX_HOSTS_BY_NAME, {})
+        module_var(self, self.IDX_CLUSTERS_BY_NAME, {})
+        module_var(self, self.IDX_HOST_NAMES, {})
+        module_var(self, self.IDX_INITIATORS_BY_WWN, {})
+        module_var(self, self.IDX_CLUSTER_LOCKS, {})
+
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Loading hosts{0} from ViPR...".format(
+                         ", clusters and initiators" if register_hosts
+                         else ""))
+        concurrent_api = VseViprApiConcurrent(cmn, vipr_api)
+
+        def load_all(get_api, post_api):
+            return [info for info in concurrent_api.get_bulk_info_by_list_of_ids(
+                post_api, vipr_api.get_list_of_all_uris(get_api))
+                if not info.get('inactive')]
+
+        for host_info in load_all(vipr_api.API_GET_ALL_HOST_URNS,
+                                  vipr_api.API_PST_HOST_BULK_INFO):
+            self.add_host(host_info.get('name'), host_info.get('id'))
+
+        initiator_count = 0
+        if register_hosts:
+            for cluster_info in load_all(vipr_api.API_GET_ALL_CLUSTER_URNS,
+                                         vipr_api.API_PST_CLUSTER_BULK_INFO):
+                self.add_cluster(cluster_info.get('name'),
+                                 cluster_info.get('id'))
+
+            for init_info in load_all(vipr_api.API_GET_ALL_INIT_URNS,
+                                      vipr_api.API_PST_INIT_BULK_INFO):
+                if init_info.get('host') is None or \
+                   init_info.get('initiator_port') is None:
+                    continue
+                self.add_initiator(init_info.get('host').get('id'),
+                                   init_info.get('initiator_port'),
+                                   init_info.get('id'))
+                initiator_count += 1
+
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Indexed {0} hosts, {1} clusters, {2} initiators".format(
+                         sum(len(uris) for uris in module_var(
+                             self, self.IDX_HOSTS_BY_NAME).values()),
+                         sum(len(uris) for uris in module_var(
+                             self, self.IDX_CLUSTERS_BY_NAME).values()),
+                         initiator_count))
+
+    def find_hosts(self, name):
+        with module_var(self, self.IDX_LOCK):
+            return list(module_var(self, self.IDX_HOSTS_BY_NAME).get(name, []))
+
+    def find_clusters(self, name):
+        with module_var(self, self.IDX_LOCK):
+            return list(module_var(self, self.IDX_CLUSTERS_BY_NAME).get(name,
+                                                                        []))
+
+    #
+    # held by whoever looks a cluster up and creates it when missing
+    #
+    def get_cluster_lock(self, name):
+        with module_var(self, self.IDX_LOCK):
+            return module_var(self, self.IDX_CLUSTER_LOCKS).setdefault(
+                name, threading.Lock())
+
+    #
+    # returns urn of host port wwn is registered to, None if it is not
+    #
+    def get_wwn_host(self, wwn):
+        with module_var(self, self.IDX_LOCK):
+            initiator = module_var(self, self.IDX_INITIATORS_BY_WWN).get(
+                wwn.strip().lower())
+            return initiator[1] if initiator is not None else None
+
+    def get_host_name(self, host_uri):
+        with module_var(self, self.IDX_LOCK):
+            return module_var(self, self.IDX_HOST_NAMES).get(host_uri)
+
+    def add_host(self, name, uri):
+        with module_var(self, self.IDX_LOCK):
+            uris = module_var(self, self.IDX_HOSTS_BY_NAME).setdefault(name,
+                                                                       [])
+            if uri not in uris:
+                uris.append(uri)
+            module_var(self, self.IDX_HOST_NAMES)[uri] = name
+
+    def add_cluster(self, name, uri):
+        with module_var(self, self.IDX_LOCK):
+            uris = module_var(self, self.IDX_CLUSTERS_BY_NAME).setdefault(
+                name, [])
+            if uri not in uris:
+                uris.append(uri)
+
+    def add_initiator(self, host_uri, wwn, initiator_uri):
+        with module_var(self, self.IDX_LOCK):
+            module_var(self, self.IDX_INITIATORS_BY_WWN)[
+                wwn.strip().lower()] = (initiator_uri, host_uri)
 
 
 if __name__ == '__main__':
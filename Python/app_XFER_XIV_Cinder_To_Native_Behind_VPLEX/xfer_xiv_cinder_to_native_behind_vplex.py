@@ -1259,18 +1259,7 @@ class DataRepo:
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "Confirming TargetStoragePool [{0}] is "
                      "ok...".format(tsp_name))
-        spools_uri_list = vipr_api.get_storage_pool_uris_by_ss_uri(tss_uri)
-        tspool_info = None
-        for spool_uri_info in spools_uri_list:
-            spool_info = vipr_api.get_storage_pool_info_by_uri(
-                spool_uri_info.get('id'))
-            if spool_info is None or \
-               'id' not in spool_info.keys() or \
-               spool_info.get('pool_name') != tsp_name or \
-               spool_info.get('inactive') == 'true':
-                continue
-            tspool_info = spool_info
-            break
+        tspool_info = vipr_api.find_storage_pool_by_name(tss_uri, tsp_name)
         if tspool_info is None:
             cmn.printMsg(cmn.MSG_LVL_WARNING,
                          "Target Storage Pool [{0}] - unable to find"
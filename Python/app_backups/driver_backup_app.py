@@ -17,8 +17,10 @@ DEFAULT_LOCAL_PATH = os.path.dirname(os.path.realpath(__file__))
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description="%(prog)s will take backup of a targeted ViPR "
-                    "environment. Backup files will be saved locally and  "
-                    "retained per settings in configuration file."
+                    "environment (or of every controller listed in "
+                    "BACKUP_CONTROLLERS, in parallel). Backup files will be "
+                    "saved locally and retained per settings in "
+                    "configuration file."
     )
 
     optional_args = parser.add_argument_group('optional arguments')
@@ -26,6 +28,19 @@ def parse_arguments():
                                required=False,
                                help='Specify a config file, default is ' +
                                     DEFAULT_ENV_CFG_FILE)
+    optional_args.add_argument('-restore',
+                               required=False,
+                               help='Instead of taking a backup, put named '
+                                    'backup zip file back together from '
+                                    'repository')
+    optional_args.add_argument('-controller',
+                               required=False,
+                               help='Only this one of BACKUP_CONTROLLERS - '
+                                    'to back up or restore from')
+    optional_args.add_argument('-restore_path',
+                               required=False,
+                               help='Directory to restore into, default is '
+                                    'session log folder')
 
     return parser.parse_args()
 
@@ -61,8 +76,17 @@ def main():
     exit_msg = None
     try:
         from vseLib.VseViprBackups import VseViprBackups
-        vse_bkp_obj = VseViprBackups(cmn)
-        vse_bkp_obj.take_bckp()
+        vse_bkp_obj = VseViprBackups(cmn, args.controller)
+        if args.restore is not None:
+            vse_bkp_obj.restore_bckp(
+                args.restore,
+                args.restore_path if args.restore_path is not None
+                else cmn.get_session_path())
+        elif args.controller is None and \
+                len(vse_bkp_obj.get_controllers()) > 0:
+            vse_bkp_obj.take_bckps()
+        else:
+            vse_bkp_obj.take_bckp()
 
     except Exception as e:
         VseExceptions.announce_exception(cmn, e)
@@ -0,0 +1,367 @@
+__author__ = 'belens'
+
+"""
+content addressed file repository, used by VseViprBackups to keep many
+backups that are mostly the same from one day to the next.
+
+every stored file is split into content defined chunks, each distinct
+chunk is kept once, zlib compressed, under chunks/<2 hex>/<sha256>.z and
+the file itself becomes a small manifest under manifests/<name>.manifest
+(JSON - name, bytes, sha256, created, list of [chunk sha256, length]).
+
+chunk boundaries follow the content, not the offset: a cut is made after
+an anchor byte pattern (once every ~256KB of compressed data), within
+CHUNK_MIN_BYTES..CHUNK_MAX_BYTES. bytes inserted or removed near the start
+of a file shift every offset after them, but the anchors move with the
+content, so chunks past the change still match the previous backup.
+python 2 is far too slow for a per byte rolling hash over multi GB files,
+anchors are found by the regex engine instead.
+
+a file can be stored from a path, or fed as it is produced (new_store(),
+VseDedupStore) - a download is chunked as it streams in.
+
+chunks and manifests are written to a temp file and renamed, manifest
+last - a crash leaves unreferenced chunks, never a manifest pointing at
+missing ones. unreferenced chunks are removed by gc().
+
+throws exceptions that should be handled above
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+import zlib
+
+from vseCmn import module_var
+
+
+class VseDedupRepo:
+    IDX_CMN = "Module_Ref_Common"
+    IDX_REPO_PATH = "Dedup_Repository_Path"
+
+    CHUNKS_DIR_NAME = "chunks"
+    MANIFESTS_DIR_NAME = "manifests"
+    CHUNK_SUFFIX = ".z"
+    MANIFEST_SUFFIX = ".manifest"
+    TEMP_SUFFIX = ".tmp"
+
+    #
+    # anchor matches once per 2^18 bytes of random (compressed) data
+    #
+    CHUNK_ANCHOR = re.compile(r'\xa7[\x00-\x0f][\x00-\x03]')
+    CHUNK_MIN_BYTES = 64 * 1024
+    CHUNK_MAX_BYTES = 1024 * 1024
+    READ_BYTES = 8 * 1024 * 1024
+    COMPRESSION_LEVEL = 6
+
+
+    def __init__(self, cmn, repo_path):
+        self.data = {}
+        module_var(self, self.IDX_CMN, cmn)
+        module_var(self, self.IDX_REPO_PATH, repo_path)
+
+        for dir_name in [self.CHUNKS_DIR_NAME, self.MANIFESTS_DIR_NAME]:
+            path = os.path.join(repo_path, dir_name)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "VseDedupRepo module initialization is complete, "
+                     "repository " + repo_path)
+
+
+    def __get_chunks_path(self):
+        return os.path.join(module_var(self, self.IDX_REPO_PATH),
+                            self.CHUNKS_DIR_NAME)
+
+
+    def __get_manifests_path(self):
+        return os.path.join(module_var(self, self.IDX_REPO_PATH),
+                            self.MANIFESTS_DIR_NAME)
+
+
+    def __get_chunk_path(self, digest):
+        return os.path.join(self.__get_chunks_path(), digest[:2],
+                            digest + self.CHUNK_SUFFIX)
+
+
+    def get_manifest_path(self, name):
+        return os.path.join(self.__get_manifests_path(),
+                            name + self.MANIFEST_SUFFIX)
+
+
+    #
+    # returns dictionary of stored name => manifest path
+    #
+    def list_manifests(self):
+        manifests = {}
+        for file_name in os.listdir(self.__get_manifests_path()):
+            if file_name.endswith(self.MANIFEST_SUFFIX):
+                manifests[file_name[:-len(self.MANIFEST_SUFFIX)]] = \
+                    os.path.join(self.__get_manifests_path(), file_name)
+        return manifests
+
+
+    def read_manifest(self, name):
+        with open(self.get_manifest_path(name), 'rb') as fp:
+            return json.load(fp)
+
+
+    def cut_chunks(self, buf, eof):
+        """
+        cuts content defined chunks off the start of buf
+        :param eof: buf is all that is left of the file, cut all of it
+        :return: (list of chunks, rest of buf - less than a max sized
+                 chunk, so an anchor is never missed at the end of what is
+                 read so far)
+        """
+        chunks = []
+        pos = 0
+        while len(buf) - pos >= self.CHUNK_MAX_BYTES or \
+                (eof and pos < len(buf)):
+            match = self.CHUNK_ANCHOR.search(buf,
+                                             pos + self.CHUNK_MIN_BYTES,
+                                             pos + self.CHUNK_MAX_BYTES)
+            if match is not None:
+                cut = match.end()
+            else:
+                cut = min(len(buf), pos + self.CHUNK_MAX_BYTES)
+
+            chunks.append(buf[pos:cut])
+            pos = cut
+
+        return chunks, buf[pos:]
+
+
+    def iter_chunks(self, fp):
+        """
+        reads fp to the end, yields content defined chunks
+        """
+        buf = ''
+        while True:
+            data = fp.read(self.READ_BYTES)
+            chunks, buf = self.cut_chunks(buf + data, not data)
+            for chunk in chunks:
+                yield chunk
+            if not data:
+                return
+
+
+    def __write_atomically(self, path, data):
+        tmp_path = path + self.TEMP_SUFFIX
+        with open(tmp_path, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        if os.name == 'nt' and os.path.isfile(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+
+    def put_chunk(self, chunk):
+        """
+        keeps chunk in repository, unless it already is
+        :return: (sha256 of chunk, compressed bytes added - 0 if known)
+        """
+        digest = hashlib.sha256(chunk).hexdigest()
+        chunk_path = self.__get_chunk_path(digest)
+        if os.path.isfile(chunk_path):
+            return digest, 0
+        if not os.path.isdir(os.path.dirname(chunk_path)):
+            os.makedirs(os.path.dirname(chunk_path))
+        data = zlib.compress(chunk, self.COMPRESSION_LEVEL)
+        self.__write_atomically(chunk_path, data)
+        return digest, len(data)
+
+
+    def put_manifest(self, manifest):
+        self.__write_atomically(self.get_manifest_path(manifest['name']),
+                                json.dumps(manifest))
+
+
+    def new_store(self, name):
+        """
+        :return: VseDedupStore - file name is chunked into repository as it
+                 is fed, manifest is written on close()
+        """
+        return VseDedupStore(self, name)
+
+
+    def store(self, name, src_path):
+        """
+        chunks src_path into repository as name, src_path is left alone
+        :return: see VseDedupStore.close()
+        """
+        dedup_store = self.new_store(name)
+        with open(src_path, 'rb') as fp:
+            for data in iter(lambda: fp.read(self.READ_BYTES), ''):
+                dedup_store.update(data)
+        return dedup_store.close()
+
+
+    def restore(self, name, tgt_path):
+        """
+        reassembles name into tgt_path (via a temp file), verifies its
+        length and sha256 against manifest
+        :return: dictionary - bytes, sha256, seconds, mb_per_sec
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        started = time.time()
+        manifest = self.read_manifest(name)
+
+        hasher = hashlib.sha256()
+        size = 0
+        tmp_path = tgt_path + self.TEMP_SUFFIX
+        with open(tmp_path, 'wb') as fp:
+            for digest, length in manifest['chunks']:
+                with open(self.__get_chunk_path(digest), 'rb') as chunk_fp:
+                    chunk = zlib.decompress(chunk_fp.read())
+                if len(chunk) != length:
+                    raise RuntimeError(
+                        "Chunk {0} of {1} is {2} bytes, expected "
+                        "{3}".format(digest, name, len(chunk), length))
+                hasher.update(chunk)
+                size += len(chunk)
+                fp.write(chunk)
+
+        if size != manifest['bytes'] or \
+           hasher.hexdigest() != manifest['sha256']:
+            os.remove(tmp_path)
+            raise RuntimeError(
+                "Restored {0} does not match its manifest: {1} bytes, "
+                "sha256 {2}, expected {3} bytes, sha256 {4}".format(
+                    name, size, hasher.hexdigest(), manifest['bytes'],
+                    manifest['sha256']))
+
+        if os.name == 'nt' and os.path.isfile(tgt_path):
+            os.remove(tgt_path)
+        os.rename(tmp_path, tgt_path)
+
+        seconds = time.time() - started
+        stats = {
+            'bytes': size,
+            'sha256': manifest['sha256'],
+            'seconds': seconds,
+            'mb_per_sec': size / 1024.0 / 1024.0 / max(seconds, 0.001)
+        }
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Restored {0} into {1}: {2:.1f} MB in {3:.1f}s, "
+                     "{4:.1f} MB/s".format(name, tgt_path,
+                                           size / 1024.0 / 1024.0, seconds,
+                                           stats['mb_per_sec']))
+        return stats
+
+
+    #
+    # drops manifest only, chunks go with the next gc()
+    #
+    def delete(self, name):
+        cmn = module_var(self, self.IDX_CMN)
+        cmn.deleteFile(self.get_manifest_path(name))
+
+
+    def gc(self):
+        """
+        removes chunks no manifest refers to, and temp files left behind
+        :return: (chunks removed, bytes freed)
+        """
+        cmn = module_var(self, self.IDX_CMN)
+
+        referenced = set()
+        for name in self.list_manifests().keys():
+            for digest, length in self.read_manifest(name)['chunks']:
+                referenced.add(digest)
+
+        removed = 0
+        freed = 0
+        for dir_path, dir_names, file_names in os.walk(
+                self.__get_chunks_path()):
+            for file_name in file_names:
+                digest = file_name[:-len(self.CHUNK_SUFFIX)] \
+                    if file_name.endswith(self.CHUNK_SUFFIX) else None
+                if digest in referenced:
+                    continue
+                path = os.path.join(dir_path, file_name)
+                freed += os.path.getsize(path)
+                removed += 1
+                os.remove(path)
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Deduplicated repository gc: {0} unreferenced chunks "
+                     "removed, {1:.1f} MB freed, {2} chunks in use".format(
+                         removed, freed / 1024.0 / 1024.0,
+                         len(referenced)))
+        return removed, freed
+
+
+class VseDedupStore:
+    """
+    one file stored into VseDedupRepo as it is produced - e.g. as a download
+    streams in, so it is never read back to be chunked. hashlib style
+    update()/hexdigest(), it can stand in for the sha256 hasher of
+    VseHttp.download(). close() writes the manifest
+    """
+    def __init__(self, repo, name):
+        self.repo = repo
+        self.name = name
+        self.hasher = hashlib.sha256()
+        self.buf = ''
+        self.size = 0
+        self.chunks = []
+        self.new_chunks = 0
+        self.new_bytes = 0
+        self.started = time.time()
+
+    def __put(self, chunks):
+        for chunk in chunks:
+            digest, new_bytes = self.repo.put_chunk(chunk)
+            self.chunks.append([digest, len(chunk)])
+            if new_bytes > 0:
+                self.new_chunks += 1
+                self.new_bytes += new_bytes
+
+    def update(self, data):
+        self.hasher.update(data)
+        self.size += len(data)
+        chunks, self.buf = self.repo.cut_chunks(self.buf + data, False)
+        self.__put(chunks)
+
+    def hexdigest(self):
+        return self.hasher.hexdigest()
+
+    def close(self):
+        """
+        :return: dictionary - bytes, sha256, chunks, new_chunks,
+                 new_bytes (compressed bytes added to repository), seconds
+        """
+        cmn = module_var(self.repo, self.repo.IDX_CMN)
+        chunks, self.buf = self.repo.cut_chunks(self.buf, True)
+        self.__put(chunks)
+
+        manifest = {
+            'name': self.name,
+            'bytes': self.size,
+            'sha256': self.hasher.hexdigest(),
+            'created': time.time(),
+            'chunks': self.chunks
+        }
+        self.repo.put_manifest(manifest)
+
+        stats = {
+            'bytes': self.size,
+            'sha256': manifest['sha256'],
+            'chunks': len(self.chunks),
+            'new_chunks': self.new_chunks,
+            'new_bytes': self.new_bytes,
+            'seconds': time.time() - self.started
+        }
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Stored {0} in deduplicated repository: {1:.1f} MB in "
+                     "{2} chunks, {3} of them new, {4:.1f} MB added, "
+                     "{5:.1f}s".format(self.name, self.size / 1024.0 / 1024.0,
+                                       len(self.chunks), self.new_chunks,
+                                       self.new_bytes / 1024.0 / 1024.0,
+                                       stats['seconds']))
+        return stats
@@ -36,6 +36,14 @@ class VSEViPRAPIExc(Exception):
         return repr(self.value)
 
 
+class VSEHttpExc(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
 #
 # log exception nicely, control where readable message goes,
 # while saving stack trace in the log file
@@ -0,0 +1,145 @@
+__author__ = 'belens'
+
+"""
+small JSON index of the entries of a folder that is subject to retention
+(backup repository, logs tree): entry name => created, bytes, sha256.
+
+retention becomes a query over the index instead of a stat of every file
+or folder on every run. entries are ordered by (created, name), so two
+entries created the same second are still two entries.
+
+the index is reconciled against a plain directory listing (names only,
+no stat): entries that are gone are dropped, names the index does not
+know - written before the index existed, or by a process that lost a race
+to save it - are described once by the caller and added.
+"""
+
+import json
+import os
+import threading
+import time
+
+from vseCmn import module_var
+
+
+class VseFileIndex:
+    IDX_CMN = "Module_Ref_Common"
+    IDX_INDEX_FILE = "Index_File_Path"
+    IDX_ENTRIES = "Index_Entries"
+    IDX_LOCK = "Index_Lock"
+
+    #
+    # starts with a dot - listings that skip dotted names skip it too
+    #
+    INDEX_FILE_NAME = ".index.json"
+    TEMP_SUFFIX = ".tmp"
+
+    FIELD_CREATED = "created"
+    FIELD_BYTES = "bytes"
+    FIELD_SHA256 = "sha256"
+
+
+    def __init__(self, cmn, path):
+        self.data = {}
+        module_var(self, self.IDX_CMN, cmn)
+        module_var(self, self.IDX_INDEX_FILE,
+                   os.path.join(path, self.INDEX_FILE_NAME))
+        module_var(self, self.IDX_LOCK, threading.Lock())
+        module_var(self, self.IDX_ENTRIES, self.__load())
+
+
+    def __load(self):
+        cmn = module_var(self, self.IDX_CMN)
+        index_file = module_var(self, self.IDX_INDEX_FILE)
+        if not os.path.isfile(index_file):
+            return {}
+        try:
+            with open(index_file, 'rb') as fp:
+                return json.load(fp)
+        except ValueError as e:
+            #
+            # damaged index is rebuilt by reconcile(), not fatal
+            #
+            cmn.printMsg(cmn.MSG_LVL_WARNING,
+                         "Index {0} could not be read ({1}), rebuilding "
+                         "it...".format(index_file, e))
+            return {}
+
+
+    def save(self):
+        index_file = module_var(self, self.IDX_INDEX_FILE)
+        tmp_file = index_file + self.TEMP_SUFFIX
+        with module_var(self, self.IDX_LOCK):
+            data = json.dumps(module_var(self, self.IDX_ENTRIES), indent=1,
+                              sort_keys=True)
+        with open(tmp_file, 'wb') as fp:
+            fp.write(data)
+        if os.name == 'nt' and os.path.isfile(index_file):
+            os.remove(index_file)
+        os.rename(tmp_file, index_file)
+
+
+    def add(self, name, created=None, size=None, sha256=None):
+        with module_var(self, self.IDX_LOCK):
+            module_var(self, self.IDX_ENTRIES)[name] = {
+                self.FIELD_CREATED: created if created is not None
+                else time.time(),
+                self.FIELD_BYTES: size,
+                self.FIELD_SHA256: sha256
+            }
+
+
+    def remove(self, name):
+        with module_var(self, self.IDX_LOCK):
+            module_var(self, self.IDX_ENTRIES).pop(name, None)
+
+
+    def get(self, name):
+        with module_var(self, self.IDX_LOCK):
+            return module_var(self, self.IDX_ENTRIES).get(name)
+
+
+    def reconcile(self, names, describe):
+        """
+        :param names: entry names present on disk now
+        :param describe: fn(name) => (created, bytes, sha256) for a name
+                         the index does not know
+        :return: True if index changed (and needs a save())
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        names = set(names)
+        with module_var(self, self.IDX_LOCK):
+            entries = module_var(self, self.IDX_ENTRIES)
+            gone = [name for name in entries.keys() if name not in names]
+            unknown = [name for name in names if name not in entries]
+            for name in gone:
+                del entries[name]
+
+        for name in unknown:
+            created, size, sha256 = describe(name)
+            self.add(name, created, size, sha256)
+
+        if len(gone) > 0 or len(unknown) > 0:
+            cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                         "Index {0} reconciled: {1} entries dropped, {2} "
+                         "added".format(module_var(self, self.IDX_INDEX_FILE),
+                                        len(gone), len(unknown)))
+        return len(gone) > 0 or len(unknown) > 0
+
+
+    def expired(self, retain_days, keep_at_least=0, exclude=None):
+        """
+        :return: names created more than retain_days ago, oldest first,
+                 leaving keep_at_least most recent entries alone
+        """
+        exclude = exclude or []
+        with module_var(self, self.IDX_LOCK):
+            ordered = sorted(
+                [(entry[self.FIELD_CREATED], name) for name, entry in
+                 module_var(self, self.IDX_ENTRIES).items()
+                 if name not in exclude])
+
+        if keep_at_least > 0:
+            ordered = ordered[:-keep_at_least]
+        cutoff = time.time() - float(retain_days) * 86400
+        return [name for created, name in ordered if created < cutoff]
@@ -10,15 +10,72 @@ ViPR instances by instantiating HTTP to multiple ViPRs and negotiating
 logon to each separately.
 
 Default protocol is HTTPS, always
-"""
 
-# TODO: cookie timeout is 2 hours, need to manage timestamp of a cookie
-# TODO: idea - need_to_refresh_login function ?
+Optional [VseHttp] section of env_cfg.ini switches transport mode:
+    LIVE   - talk to ViPR (default)
+    RECORD - talk to ViPR, and save every request/response (auth tokens and
+             passwords redacted) into http_archive.jsonl.gz in session folder
+    REPLAY - serve responses from HTTP_ARCHIVE, ViPR is never contacted
+and sizes connection pool and timeouts (HTTP_POOL_SIZE,
+HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT).
+
+One instance is safe to share between threads: session is never mutated
+per request (headers, auth token go with each call), and connections come
+from a pool of HTTP_POOL_SIZE that callers block on once exhausted.
+
+ViPR auth tokens live 2 hours. Token issue time is tracked, and a token
+close to expiry is refreshed before the next call; a call rejected with
+401 triggers one re-login and is replayed once. Re-login is single
+flight - threads that hit expiry together wait for one login and reuse
+its token.
+
+With HTTP_TOKEN_CACHE ON (LIVE mode only), token is kept in a 0600 file
+under PATH_LOGS, keyed by host/port/user. Next process validates it with
+whoami and reuses it instead of logging in, and vipr_logout() leaves it
+alive on the server for the next run.
+
+Server errors (5xx) and connection errors are retried with exponential
+backoff (HTTP_RETRIES, HTTP_RETRY_BACKOFF) for calls that are safe to
+repeat - GETs and bulk lookup POSTs. Anything else that changes ViPR
+state is not retried, unless caller says it is retry_safe.
+
+Calls to a ViPR host go through one HttpThrottle shared by all instances:
+an optional token bucket (HTTP_RATE_LIMIT requests per second) and an
+adaptive (AIMD) limit on calls in flight, that backs off when ViPR answers
+503/429, drops connections or (optionally) gets slower than
+HTTP_LATENCY_TARGET, and creeps back up while it is healthy. Any [VseHttp]
+variable can be overridden for one host in a [VseHttp:<host>] section.
+
+Responses are asked for gzip/deflate encoded (HTTP_COMPRESSION), and are
+decoded as they stream in, file downloads included. A server that ignores
+Accept-Encoding just answers plain; one that sends something undecodable
+gets asked again for plain content. Bytes on the wire vs decoded bytes go
+to http_bytes_wire/http_bytes_decoded counters.
+
+Large files (backups) go through download(): streamed into a .part file
+next to the target and renamed into place when complete, hashed on the
+way, and resumed with a Range request after a dropped connection.
+"""
 
 from vseCmn import module_var
 # from requests import codes, Session, Request, Response, __version__
 import requests
+import atexit
+import base64
+import gzip
+import hashlib
 import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from StringIO import StringIO
+from requests.structures import CaseInsensitiveDict
+from requests.packages.urllib3.exceptions import DecodeError, \
+    ProtocolError, ReadTimeoutError
+from VseExceptions import VSEHttpExc
 
 # suppress annoying insecure HTTPS warnings
 # shows an error in Editor, but actually works in practice.
@@ -35,16 +92,99 @@ class VseHttp:
     IDX_SESSION = "HTTP_Session"
     IDX_VIPR_AUTH_COOKIE = "ViPR_C_Auth_Cookie"
     IDX_HTTP_PROTOCOL = "HTTP Protocol"
+    IDX_HTTP_ARCHIVE_REF = "HTTP_Archive_Ref"
+    IDX_VIPR_AUTH_ISSUED = "ViPR_C_Auth_Cookie_Issued"
+    IDX_LOGIN_LOCK = "Login_Lock"
+
+    #
+    # optional config variables
+    #
+    IDX_HTTP_MODE = "HTTP_MODE"
+    IDX_HTTP_ARCHIVE = "HTTP_ARCHIVE"
+    IDX_HTTP_POOL_SIZE = "HTTP_POOL_SIZE"
+    IDX_HTTP_CONNECT_TIMEOUT = "HTTP_CONNECT_TIMEOUT"
+    IDX_HTTP_READ_TIMEOUT = "HTTP_READ_TIMEOUT"
+    IDX_HTTP_TOKEN_CACHE = "HTTP_TOKEN_CACHE"
+    IDX_HTTP_RETRIES = "HTTP_RETRIES"
+    IDX_HTTP_RETRY_BACKOFF = "HTTP_RETRY_BACKOFF"
+    IDX_HTTP_RATE_LIMIT = "HTTP_RATE_LIMIT"
+    IDX_HTTP_RATE_BURST = "HTTP_RATE_BURST"
+    IDX_HTTP_MIN_CONCURRENCY = "HTTP_MIN_CONCURRENCY"
+    IDX_HTTP_MAX_CONCURRENCY = "HTTP_MAX_CONCURRENCY"
+    IDX_HTTP_LATENCY_TARGET = "HTTP_LATENCY_TARGET"
+    IDX_HTTP_COMPRESSION = "HTTP_COMPRESSION"
+    OPTIONAL_VARS = [IDX_HTTP_MODE, IDX_HTTP_ARCHIVE, IDX_HTTP_POOL_SIZE,
+                     IDX_HTTP_CONNECT_TIMEOUT, IDX_HTTP_READ_TIMEOUT,
+                     IDX_HTTP_TOKEN_CACHE, IDX_HTTP_RETRIES,
+                     IDX_HTTP_RETRY_BACKOFF, IDX_HTTP_RATE_LIMIT,
+                     IDX_HTTP_RATE_BURST, IDX_HTTP_MIN_CONCURRENCY,
+                     IDX_HTTP_MAX_CONCURRENCY, IDX_HTTP_LATENCY_TARGET,
+                     IDX_HTTP_COMPRESSION]
+    IDX_HTTP_THROTTLE_REF = "HTTP_Throttle_Ref"
+
+    #
+    # bulk calls over a large inventory legitimately take minutes, so read
+    # timeout is generous; it is there to stop a hung controller from
+    # blocking forever, not to police slow calls
+    #
+    DEFAULT_POOL_SIZE = 16
+    DEFAULT_CONNECT_TIMEOUT = 10
+    DEFAULT_READ_TIMEOUT = 600
+
+    #
+    # backoff doubles from HTTP_RETRY_BACKOFF seconds per attempt: 1, 2, 4..
+    #
+    DEFAULT_RETRIES = 3
+    DEFAULT_RETRY_BACKOFF = 1.0
+    RETRY_MAX_DELAY_SECONDS = 60
+    RETRY_BULK_POST_SUFFIX = "/bulk"
+
+    LOG_BODY_PREVIEW_CHARS = 200
+
+    #
+    # download() streams into <path>.part and renames it into place
+    #
+    DOWNLOAD_PART_SUFFIX = ".part"
+    DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+    ACCEPT_ENCODING_COMPRESSED = "gzip, deflate"
+    ACCEPT_ENCODING_IDENTITY = "identity"
+
+    HTTP_MODE_LIVE = "LIVE"
+    HTTP_MODE_RECORD = "RECORD"
+    HTTP_MODE_REPLAY = "REPLAY"
+    HTTP_ARCHIVE_FILE_NAME = "http_archive.jsonl.gz"
+    TOKEN_CACHE_DIR_NAME = ".vipr_token_cache"
+    TOKEN_CACHE_VALIDATE_API = "/user/whoami"
 
     VIPR_AUTH_HEADER = "X-SDS-AUTH-TOKEN"
+
+    #
+    # ViPR expires auth tokens 2 hours after login, refresh a bit earlier
+    # so a long call started near expiry does not get cut off
+    #
+    VIPR_AUTH_TOKEN_LIFETIME_SECONDS = 2 * 60 * 60
+    VIPR_AUTH_TOKEN_REFRESH_MARGIN_SECONDS = 10 * 60
     PROTOCOL_HTTPS = "https"
 
     def __init__(self, cmn, ip, port, vipr_user=None, vipr_password=None):
+        #
+        # [VseHttp] first, then [VseHttp:<host>] overrides for this host
+        #
+        for section in [self.__class__.__name__,
+                        "{0}:{1}".format(self.__class__.__name__, ip)]:
+            cmn.read_config_file_for_module(self,
+                                            cmn.get_env_settings_file(),
+                                            section,
+                                            [],
+                                            optional_vars=self.OPTIONAL_VARS)
         module_var(self, self.IDX_CMN, cmn)
         module_var(self, self.IDX_HTTP_PROTOCOL, self.PROTOCOL_HTTPS)
         module_var(self, self.IDX_IP, ip)
         module_var(self, self.IDX_PORT, port)
-        module_var(self, self.IDX_SESSION, requests.Session())
+        module_var(self, self.IDX_SESSION, self.__create_session())
+        module_var(self, self.IDX_HTTP_THROTTLE_REF, self.__get_throttle())
+        module_var(self, self.IDX_LOGIN_LOCK, threading.RLock())
 
         if vipr_user is not None:
             module_var(self, self.IDX_VIPR_USER, vipr_user)
@@ -52,16 +192,125 @@ class VseHttp:
         if vipr_password is not None:
             module_var(self, self.IDX_VIPR_PASSWORD, vipr_password)
 
+        #
+        # record and replay share one archive per path across instances
+        #
+        mode = self.get_http_mode()
+        if mode == self.HTTP_MODE_RECORD:
+            module_var(self, self.IDX_HTTP_ARCHIVE_REF, HttpArchive.open(
+                cmn,
+                os.path.join(cmn.get_session_path(),
+                             self.HTTP_ARCHIVE_FILE_NAME),
+                mode))
+        elif mode == self.HTTP_MODE_REPLAY:
+            archive_path = module_var(self, self.IDX_HTTP_ARCHIVE)
+            if archive_path is None or not os.path.isfile(archive_path):
+                raise RuntimeError(
+                    "HTTP_MODE is {0}, but HTTP_ARCHIVE [{1}] is not a "
+                    "file".format(mode, archive_path))
+            module_var(self, self.IDX_HTTP_ARCHIVE_REF,
+                       HttpArchive.open(cmn, archive_path, mode))
+        elif mode != self.HTTP_MODE_LIVE:
+            raise RuntimeError("Unknown HTTP_MODE [{0}], expected one of "
+                               "{1}".format(mode, [self.HTTP_MODE_LIVE,
+                                                   self.HTTP_MODE_RECORD,
+                                                   self.HTTP_MODE_REPLAY]))
+
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "VseHttp module initialization is complete for [{0}:{"
-                     "1}]".format(ip, port))
+                     "1}], mode {2}".format(ip, port, mode))
+
+
+    def __create_session(self):
+        pool_size = self.__get_pool_size()
+
+        #
+        # one host per session, so a single pool sized for concurrent
+        # callers. pool_block - threads beyond pool size wait for a
+        # connection, instead of opening throwaway ones
+        #
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1,
+                                                pool_maxsize=pool_size,
+                                                pool_block=True)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+
+    def __get_pool_size(self):
+        return int(module_var(self, self.IDX_HTTP_POOL_SIZE) or
+                   self.DEFAULT_POOL_SIZE)
+
+
+    def __get_throttle(self):
+        """
+        one per host:port, first instance's settings win
+        """
+        def optional_float(idx, default):
+            value = module_var(self, idx)
+            return default if value is None else float(value)
+
+        rate = optional_float(self.IDX_HTTP_RATE_LIMIT, 0)
+        max_limit = int(optional_float(self.IDX_HTTP_MAX_CONCURRENCY,
+                                       self.__get_pool_size()))
+        return HttpThrottle.get(
+            module_var(self, self.IDX_CMN),
+            "{0}:{1}".format(module_var(self, self.IDX_IP),
+                             module_var(self, self.IDX_PORT)),
+            rate,
+            optional_float(self.IDX_HTTP_RATE_BURST, max(rate, 1)),
+            int(optional_float(self.IDX_HTTP_MIN_CONCURRENCY, 1)),
+            max_limit,
+            optional_float(self.IDX_HTTP_LATENCY_TARGET, 0))
+
+
+    def get_timeouts(self):
+        """
+        :return: (connect, read) timeouts in seconds, as requests takes them
+        """
+        return (float(module_var(self, self.IDX_HTTP_CONNECT_TIMEOUT) or
+                      self.DEFAULT_CONNECT_TIMEOUT),
+                float(module_var(self, self.IDX_HTTP_READ_TIMEOUT) or
+                      self.DEFAULT_READ_TIMEOUT))
+
+
+    def get_http_mode(self):
+        mode = module_var(self, self.IDX_HTTP_MODE)
+        return self.HTTP_MODE_LIVE if mode is None else mode.upper()
+
+
+    def get_accept_encoding(self):
+        value = module_var(self, self.IDX_HTTP_COMPRESSION)
+        if value is not None and value.upper() == 'OFF':
+            return self.ACCEPT_ENCODING_IDENTITY
+        return self.ACCEPT_ENCODING_COMPRESSED
+
+
+    def token_cache_enabled(self):
+        """
+        recorded sessions need a real login in the archive, so only LIVE
+        """
+        value = module_var(self, self.IDX_HTTP_TOKEN_CACHE)
+        return value is not None and value.upper() == 'ON' and \
+            self.get_http_mode() == self.HTTP_MODE_LIVE
+
+
+    def __full_url(self, resource):
+        return "{0}://{1}:{2}{3}".format(
+            module_var(self, self.IDX_HTTP_PROTOCOL),
+            module_var(self, self.IDX_IP),
+            module_var(self, self.IDX_PORT),
+            resource
+        )
 
 
     def request(self, method, resource, body=None,
                 content_type='application/json',
                 filename=None,
                 custom_headers=None,
-                vipr_request=True):
+                vipr_request=True,
+                retry_safe=None):
         """
         Assumptions:
             - returns JSON body always
@@ -74,6 +323,7 @@ class VseHttp:
         :param filename: if file is to be uploaded to downloaded into
         :param custom_headers: a dictionary of additional headers if required
         :param vipr_request: defaults to True, set to False if not
+        :param retry_safe: True/False to override is_retry_safe() policy
 
         :return: HTTP response object
         """
@@ -82,27 +332,30 @@ class VseHttp:
         if vipr_request and not self.vipr_logged_in():
             raise RuntimeError("Not logged into ViPR")
 
-        session = module_var(self, self.IDX_SESSION)
+        if vipr_request and self.need_to_refresh_login():
+            self.__refresh_login(module_var(self, self.IDX_VIPR_AUTH_COOKIE))
 
         #
-        # setup basic headers
-        # ViPR authorization header is cached in session
+        # setup headers for this call only - session is shared by threads
+        # ViPR authorization header comes from the saved token
         # add custom headers if any come in
         #
-        session.headers.update({
+        headers = {
             'Content-Type': content_type,
-            'ACCEPT': 'application/json, application/octet-stream'
-        })
+            'ACCEPT': 'application/json, application/octet-stream',
+            'Accept-Encoding': self.get_accept_encoding()
+        }
 
         if custom_headers is not None:
-            session.headers.update(custom_headers)
+            headers.update(custom_headers)
 
-        full_url = "{0}://{1}:{2}{3}".format(
-            module_var(self, self.IDX_HTTP_PROTOCOL),
-            module_var(self, self.IDX_IP),
-            module_var(self, self.IDX_PORT),
-            resource
-        )
+        log_headers = dict(headers)
+
+        if vipr_request:
+            headers[self.VIPR_AUTH_HEADER] = module_var(
+                self, self.IDX_VIPR_AUTH_COOKIE)
+
+        full_url = self.__full_url(resource)
 
         if method not in ['GET', 'PUT', 'POST', 'DELETE']:
             raise RuntimeError(
@@ -130,73 +383,587 @@ class VseHttp:
         #
 
         #
-        # Print what we are trying to do
+        # Print what we are trying to do. bulk bodies run to tens of
+        # thousands of URNs - only full debug mode gets them whole, others
+        # get one line with size and the start of the body
         #
-        msg = ""
-        msg += "Executing ViPR API Call:\n"
-        msg += "\tHTTP Method: {0}\n".format(method)
-        msg += "\tURL        : {0}\n".format(full_url)
-        msg += "\tHeaders    : {0}\n".format(session.headers)
-        msg += "\tFile       : {0}\n".format(
-            filename if filename is not None else "")
-        msg += "\tBody       : {0}\n".format(
-            body if body is not None else "")
-        cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     msg,
-                     None,
-                     print_only_in_full_debug_mode=True)
+        if cmn.is_full_debug():
+            msg = ""
+            msg += "Executing ViPR API Call:\n"
+            msg += "\tHTTP Method: {0}\n".format(method)
+            msg += "\tURL        : {0}\n".format(full_url)
+            msg += "\tHeaders    : {0}\n".format(log_headers)
+            msg += "\tFile       : {0}\n".format(
+                filename if filename is not None else "")
+            msg += "\tBody       : {0}\n".format(
+                body if body is not None else "")
+        else:
+            msg = "Executing ViPR API Call: {0} {1}".format(method, full_url)
+            if filename is not None:
+                msg += ", file {0}".format(filename)
+            if body:
+                msg += ", body {0} bytes: {1}{2}".format(
+                    len(body),
+                    body[:self.LOG_BODY_PREVIEW_CHARS],
+                    "..." if len(body) > self.LOG_BODY_PREVIEW_CHARS
+                    else "")
+        cmn.printMsg(cmn.MSG_LVL_DEBUG, msg)
+
+
+        if retry_safe is None:
+            retry_safe = self.is_retry_safe(method, resource)
+
+        response = self.__send_with_retries(method, resource, full_url,
+                                            headers, body, filename,
+                                            retry_safe)
+
+        #
+        # token expired or got revoked under us - login once, replay once
+        #
+        if vipr_request and \
+           response.status_code == requests.codes['unauthorized']:
+            cmn.printMsg(cmn.MSG_LVL_WARNING,
+                         "ViPR rejected auth token for {0} {1}, logging in "
+                         "again and retrying...".format(method, resource))
+            self.__refresh_login(headers[self.VIPR_AUTH_HEADER])
+            headers[self.VIPR_AUTH_HEADER] = module_var(
+                self, self.IDX_VIPR_AUTH_COOKIE)
+            response = self.__send_with_retries(method, resource, full_url,
+                                                headers, body, filename,
+                                                retry_safe)
+
+        if response.status_code == requests.codes['ok'] or \
+           response.status_code == requests.codes['accepted']:
+            return response.status_code, response.text
+
+        else:
+            cmn.printMsg(
+                cmn.MSG_LVL_ERROR,
+                "Request failed, message:\n {0}".format(response.text))
+            response.raise_for_status()
+
+
+    def is_retry_safe(self, method, resource):
+        """
+        GETs and bulk lookups (POST of ids to .../bulk) can be repeated
+        without side effects, nothing else is assumed to
+        """
+        if method == 'GET':
+            return True
+        return method == 'POST' and \
+            resource.split('?')[0].endswith(self.RETRY_BULK_POST_SUFFIX)
+
+
+    @staticmethod
+    def get_endpoint_name(method, resource):
+        """
+        method and resource with ids and query dropped, e.g.
+        GET /compute/hosts/{id}/initiators - for per endpoint counters
+        """
+        return "{0} {1}".format(
+            method, re.sub(r'urn:[^/]+', '{id}', resource.split('?')[0]))
+
+
+    def __send_with_retries(self, method, resource, full_url, headers, body,
+                            filename, retry_safe):
+        cmn = module_var(self, self.IDX_CMN)
+        retries = int(module_var(self, self.IDX_HTTP_RETRIES) or
+                      self.DEFAULT_RETRIES) if retry_safe else 0
+        backoff = float(module_var(self, self.IDX_HTTP_RETRY_BACKOFF) or
+                        self.DEFAULT_RETRY_BACKOFF)
+        throttle = module_var(self, self.IDX_HTTP_THROTTLE_REF)
+        throttled = self.get_http_mode() != self.HTTP_MODE_REPLAY
+
+        attempt = 0
+        while True:
+            retry_after = None
+            response = None
+            error = None
+            decode_error = None
+            if throttled:
+                throttle.acquire()
+            started = time.time()
+            try:
+                response = self.__send(method, resource, full_url, headers,
+                                       body, filename)
+            #
+            # reset part way through the body - ChunkedEncodingError, or
+            # raw urllib3 errors when a GET streams into a file
+            #
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout,
+                    ProtocolError,
+                    ReadTimeoutError) as e:
+                error = e
+            except (requests.exceptions.ContentDecodingError,
+                    DecodeError) as e:
+                decode_error = e
+            finally:
+                if throttled:
+                    throttle.release(
+                        time.time() - started,
+                        error is not None or
+                        (response is not None and response.status_code in
+                         HttpThrottle.OVERLOAD_STATUS_CODES))
+
+            #
+            # compressed answer that can not be decoded - ask for it plain,
+            # does not count as a retry
+            #
+            if decode_error is not None:
+                if headers.get('Accept-Encoding') == \
+                   self.ACCEPT_ENCODING_IDENTITY:
+                    raise decode_error
+                cmn.add_to_counter('http_decoding_fallbacks')
+                cmn.printMsg(cmn.MSG_LVL_WARNING,
+                             "{0} {1} response could not be decoded ({2}), "
+                             "asking for it uncompressed...".format(
+                                 method, resource, decode_error))
+                headers['Accept-Encoding'] = self.ACCEPT_ENCODING_IDENTITY
+                continue
+
+            if error is not None:
+                if attempt >= retries:
+                    raise error
+                reason = "{0}: {1}".format(error.__class__.__name__, error)
+            else:
+                if response.status_code < 500 or attempt >= retries:
+                    return response
+                reason = "HTTP {0}".format(response.status_code)
+                retry_after = response.headers.get('Retry-After')
+
+            attempt += 1
+
+            #
+            # GET into a file - whatever the failed attempt left in it goes
+            #
+            if method == 'GET' and filename is not None and \
+               os.path.isfile(filename):
+                open(filename, 'wb').close()
+
+            #
+            # honor Retry-After (503) when ViPR sends one, jitter keeps
+            # concurrent workers from retrying in lock step.
+            # replayed archive already has the outcome, no point waiting
+            #
+            if retry_after is not None and retry_after.isdigit():
+                delay = float(retry_after)
+            else:
+                delay = backoff * 2 ** (attempt - 1) + \
+                    random.uniform(0, backoff)
+            delay = min(delay, self.RETRY_MAX_DELAY_SECONDS)
+            if self.get_http_mode() == self.HTTP_MODE_REPLAY:
+                delay = 0
+
+            cmn.add_to_counter('http_retries')
+            cmn.add_to_counter('http_retries: ' +
+                               self.get_endpoint_name(method, resource))
+            cmn.printMsg(cmn.MSG_LVL_WARNING,
+                         "{0} {1} failed ({2}), retry {3} of {4} in "
+                         "{5:.1f}s...".format(method, resource, reason,
+                                              attempt, retries, delay))
+            time.sleep(delay)
+
+
+    def __send(self, method, resource, full_url, headers, body, filename):
+        """
+        one exchange with ViPR (or the archive), see request()
+        """
+        session = module_var(self, self.IDX_SESSION)
+        timeouts = self.get_timeouts()
+        archive = module_var(self, self.IDX_HTTP_ARCHIVE_REF)
+        mode = self.get_http_mode()
+        if method == 'POST' and filename is not None:
+            with open(filename, 'rb') as fp:
+                body_key = fp.read()
+        else:
+            body_key = body
+        started = time.time()
 
+        #
+        # REPLAY - ViPR is not contacted, file downloads get recorded content
+        #
+        if mode == self.HTTP_MODE_REPLAY:
+            response = archive.replay(method, resource, body_key)
+            if method == 'GET' and filename is not None:
+                with open(filename, 'wb') as fp:
+                    fp.write(response.content)
 
         #
         # GET into a file...
         #
-        if method == 'GET' and filename is not None:
+        elif method == 'GET' and filename is not None:
             #
             # depending on library versions different settings are required
             #
             if requests.__version__.startswith('0'):
                 response = session.request(
-                    method, full_url, verify=False, prefetch=False)
+                    method, full_url, headers=headers, verify=False,
+                    prefetch=False)
 
             else:
                 response = session.request(
-                    method, full_url, verify=False, stream=True)
+                    method, full_url, headers=headers, verify=False,
+                    stream=True, timeout=timeouts)
 
+            #
+            # raw stream is as it came over the wire, decode gzip/deflate
+            # chunk by chunk on the way into the file
+            #
+            decoded_bytes = 0
             with open(filename, 'wb') as fp:
                 while True:
-                    chunk = response.raw.read(1024 * 1024)
+                    chunk = response.raw.read(1024 * 1024,
+                                              decode_content=True)
                     if not chunk:
                         break
+                    decoded_bytes += len(chunk)
                     fp.write(chunk)
         #
         # GET plain vanilla
         #
         elif method == 'GET':
-            response = session.request(method, full_url, verify=False)
+            response = session.request(method, full_url, headers=headers,
+                                       verify=False, timeout=timeouts)
 
         #
         # POST a file
         #
         elif method == 'POST' and filename is not None:
-            response = session.request(
-                method, full_url, data=open(filename, "rb"), verify=False)
+            with open(filename, "rb") as fp:
+                response = session.request(
+                    method, full_url, data=fp, headers=headers,
+                    verify=False, timeout=timeouts)
 
         #
         # POST vanilla, PUT, DELETE
         #
         else:
             response = session.request(
-                method, full_url, data=body, verify=False)
+                method, full_url, data=body, headers=headers, verify=False,
+                timeout=timeouts)
+
+        if mode != self.HTTP_MODE_REPLAY:
+            self.__count_bytes(
+                response,
+                decoded_bytes if method == 'GET' and filename is not None
+                else len(response.content))
+
+        if mode == self.HTTP_MODE_RECORD:
+            if method == 'GET' and filename is not None:
+                with open(filename, 'rb') as fp:
+                    content = fp.read()
+            else:
+                content = response.content
+            archive.record(method, resource, body_key, response, content,
+                           time.time() - started)
 
-        if response.status_code == requests.codes['ok'] or \
-           response.status_code == requests.codes['accepted']:
-            return response.status_code, response.text
+        return response
+
+
+    def __count_bytes(self, response, decoded_bytes):
+        """
+        urllib3 tell() is body bytes pulled off the wire, before decoding
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        tell = getattr(response.raw, 'tell', None)
+        wire_bytes = tell() if tell is not None else decoded_bytes
+
+        cmn.add_to_counter('http_bytes_wire', wire_bytes)
+        cmn.add_to_counter('http_bytes_decoded', decoded_bytes)
+        if response.headers.get('Content-Encoding') in ['gzip', 'deflate']:
+            cmn.add_to_counter('http_compressed_responses')
+
+
+    def download(self, resource, path, resume=True, new_hasher=None):
+        """
+        GETs resource into path. content streams into path + .part that is
+        renamed into place once complete, so path never holds a partial
+        file, and is hashed as it streams. a transfer cut short picks up
+        where .part stopped with a Range request when ViPR answers 206,
+        and starts over when it does not.
+
+        RECORD/REPLAY go through request(), the archive keeps whole
+        responses only.
+
+        :param resume: False to throw away .part left by an earlier run
+        :param new_hasher: returns a fresh hashlib style object (update,
+                           hexdigest), fed every byte of the file in order -
+                           a new one each time the file starts over.
+                           hashlib.sha256 by default
+        :return: dictionary - bytes, sha256, seconds, mb_per_sec and
+                 resumed_bytes (bytes that did not have to be fetched again)
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        new_hasher = new_hasher or hashlib.sha256
+
+        if not self.vipr_logged_in():
+            raise RuntimeError("Not logged into ViPR")
 
+        part_path = path + self.DOWNLOAD_PART_SUFFIX
+        if os.path.isfile(part_path) and not resume:
+            os.remove(part_path)
+
+        started = time.time()
+        resumed_bytes = 0
+
+        if self.get_http_mode() != self.HTTP_MODE_LIVE:
+            self.request('GET', resource, filename=part_path)
+            hasher = new_hasher()
+            with open(part_path, 'rb') as fp:
+                for chunk in iter(
+                        lambda: fp.read(self.DOWNLOAD_CHUNK_BYTES), ''):
+                    hasher.update(chunk)
         else:
-            cmn.printMsg(
-                cmn.MSG_LVL_ERROR,
-                "Request failed, message:\n {0}".format(response.text))
-            response.raise_for_status()
+            hasher, resumed_bytes = self.__download_part(resource,
+                                                         part_path,
+                                                         new_hasher)
+
+        #
+        # rename is atomic on posix, windows refuses to replace a file
+        #
+        if os.name == 'nt' and os.path.isfile(path):
+            os.remove(path)
+        os.rename(part_path, path)
+
+        seconds = time.time() - started
+        size = os.path.getsize(path)
+        stats = {
+            'bytes': size,
+            'sha256': hasher.hexdigest(),
+            'seconds': seconds,
+            'mb_per_sec': size / 1024.0 / 1024.0 / max(seconds, 0.001),
+            'resumed_bytes': resumed_bytes
+        }
+        cmn.add_to_counter('http_download_bytes', size)
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Downloaded {0} into {1}: {2:.1f} MB in {3:.1f}s, "
+                     "{4:.1f} MB/s, {5} bytes resumed, sha256 {6}".format(
+                         resource, path, size / 1024.0 / 1024.0, seconds,
+                         stats['mb_per_sec'], resumed_bytes,
+                         stats['sha256']))
+        return stats
+
+
+    def __download_part(self, resource, part_path, new_hasher):
+        """
+        LIVE side of download(): fills part_path, resuming what is in it
+        :return: (sha256 hasher over the whole file, resumed bytes)
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        session = module_var(self, self.IDX_SESSION)
+        throttle = module_var(self, self.IDX_HTTP_THROTTLE_REF)
+        full_url = self.__full_url(resource)
+        retries = int(module_var(self, self.IDX_HTTP_RETRIES) or
+                      self.DEFAULT_RETRIES)
+        backoff = float(module_var(self, self.IDX_HTTP_RETRY_BACKOFF) or
+                        self.DEFAULT_RETRY_BACKOFF)
+
+        #
+        # hasher covers hashed_bytes of .part - a resume within this call
+        # carries on with it, a .part from an earlier run is read once
+        #
+        hasher = None
+        hashed_bytes = 0
+        resumed_bytes = 0
+        attempt = 0
+        reauthenticated = False
+        can_resume = True
+
+        while True:
+            if self.need_to_refresh_login():
+                self.__refresh_login(
+                    module_var(self, self.IDX_VIPR_AUTH_COOKIE))
+
+            #
+            # ViPR did not honor a Range once - every retry starts over
+            #
+            if not can_resume and os.path.isfile(part_path):
+                os.remove(part_path)
+                hasher = None
+
+            offset = os.path.getsize(part_path) \
+                if os.path.isfile(part_path) else 0
+
+            #
+            # ranges are over the encoded body - ask for it plain, backups
+            # are zip files and do not compress anyway
+            #
+            headers = {
+                'ACCEPT': 'application/octet-stream',
+                'Accept-Encoding': self.ACCEPT_ENCODING_IDENTITY,
+                self.VIPR_AUTH_HEADER: module_var(
+                    self, self.IDX_VIPR_AUTH_COOKIE)
+            }
+            if offset > 0:
+                headers['Range'] = "bytes={0}-".format(offset)
+
+            cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                         "Executing ViPR API Call: GET {0}, into {1}{2}"
+                         .format(full_url, part_path,
+                                 ", from byte {0}".format(offset)
+                                 if offset > 0 else ""))
+
+            response = None
+            status = None
+            file_mode = None
+            error = None
+            received = 0
+            throttle.acquire()
+            started = time.time()
+            try:
+                response = session.request(
+                    'GET', full_url, headers=headers, verify=False,
+                    stream=True, timeout=self.get_timeouts())
+                status = response.status_code
+
+                if status == requests.codes['partial_content'] and \
+                   response.headers.get('Content-Range', '').startswith(
+                       "bytes {0}-".format(offset)):
+                    if hasher is None or hashed_bytes != offset:
+                        hasher = new_hasher()
+                        with open(part_path, 'rb') as fp:
+                            for chunk in iter(
+                                    lambda: fp.read(
+                                        self.DOWNLOAD_CHUNK_BYTES), ''):
+                                hasher.update(chunk)
+                    hashed_bytes = offset
+                    resumed_bytes += offset
+                    expected = response.headers['Content-Range'].split(
+                        '/')[-1]
+                    file_mode = 'ab'
+                elif status == requests.codes['ok']:
+                    if offset > 0:
+                        cmn.printMsg(cmn.MSG_LVL_WARNING,
+                                     "{0} does not support resume, "
+                                     "downloading from the start..."
+                                     .format(resource))
+                        can_resume = False
+                    hasher = new_hasher()
+                    hashed_bytes = 0
+                    offset = 0
+                    expected = response.headers.get('Content-Length')
+                    if response.headers.get('Content-Encoding') \
+                       not in [None, self.ACCEPT_ENCODING_IDENTITY]:
+                        expected = None
+                    file_mode = 'wb'
+                elif status == requests.codes['partial_content']:
+                    # not the range asked for - left unread, closed below
+                    pass
+                else:
+                    # error body is small, read it so connection is freed
+                    response.content
+
+                if file_mode is not None:
+                    with open(part_path, file_mode) as fp:
+                        while True:
+                            chunk = response.raw.read(
+                                self.DOWNLOAD_CHUNK_BYTES,
+                                decode_content=True)
+                            if not chunk:
+                                break
+                            fp.write(chunk)
+                            hasher.update(chunk)
+                            received += len(chunk)
+                            hashed_bytes += len(chunk)
+                        fp.flush()
+                        os.fsync(fp.fileno())
+
+                    #
+                    # a dropped connection can look like a clean end of
+                    # stream, length tells them apart
+                    #
+                    if expected is not None and expected.isdigit() and \
+                       offset + received != int(expected):
+                        raise requests.exceptions.ConnectionError(
+                            "download stopped at {0} of {1} bytes".format(
+                                offset + received, expected))
+            #
+            # body is read off response.raw - a reset or stall part way
+            # through it raises urllib3 errors, requests does not wrap them
+            #
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout,
+                    ProtocolError,
+                    ReadTimeoutError) as e:
+                error = e
+            finally:
+                throttle.release(
+                    time.time() - started,
+                    error is not None or
+                    (response is not None and response.status_code in
+                     HttpThrottle.OVERLOAD_STATUS_CODES))
+                if response is not None:
+                    self.__count_bytes(response, received)
+                    response.close()
+
+            if error is None and file_mode is not None:
+                return hasher, resumed_bytes
+
+            if error is None and \
+               status == requests.codes['unauthorized'] and \
+               not reauthenticated:
+                cmn.printMsg(cmn.MSG_LVL_WARNING,
+                             "ViPR rejected auth token for GET {0}, logging "
+                             "in again and retrying...".format(resource))
+                self.__refresh_login(headers[self.VIPR_AUTH_HEADER])
+                reauthenticated = True
+                continue
+
+            #
+            # ViPR ignored or misread the Range (206 of some other range),
+            # or .part no longer matches what it has (416 - range past the
+            # end) - start over, with plain GETs from now on
+            #
+            if error is None and offset > 0 and status in [
+                    requests.codes['partial_content'],
+                    requests.codes['requested_range_not_satisfiable']]:
+                cmn.printMsg(cmn.MSG_LVL_WARNING,
+                             "ViPR can not resume {0} from byte {1} (HTTP "
+                             "{2}), downloading from the start...".format(
+                                 resource, offset, status))
+                can_resume = False
+                continue
+
+            if error is None and status < 500:
+                if status >= 400:
+                    cmn.printMsg(cmn.MSG_LVL_ERROR,
+                                 "Request failed, message:\n {0}".format(
+                                     response.text))
+                    response.raise_for_status()
+                raise VSEHttpExc(
+                    "GET {0} answered HTTP {1}, expected {2} or {3}".format(
+                        resource, status, requests.codes['ok'],
+                        requests.codes['partial_content']))
+
+            #
+            # transfer that moved forward earns a fresh set of retries,
+            # as long as the next one carries on from where it stopped
+            #
+            if received > 0 and can_resume:
+                attempt = 0
+            if attempt >= retries:
+                if error is not None:
+                    raise error
+                raise VSEHttpExc(
+                    "GET {0} failed with HTTP {1} after {2} retries".format(
+                        resource, status, retries))
+            attempt += 1
+
+            delay = min(backoff * 2 ** (attempt - 1) +
+                        random.uniform(0, backoff),
+                        self.RETRY_MAX_DELAY_SECONDS)
+            cmn.add_to_counter('http_download_resumes')
+            cmn.printMsg(cmn.MSG_LVL_WARNING,
+                         "GET {0} interrupted at {1} bytes ({2}), retry {3} "
+                         "of {4} in {5:.1f}s...".format(
+                             resource, offset + received,
+                             error if error is not None
+                             else "HTTP {0}".format(status),
+                             attempt, retries, delay))
+            time.sleep(delay)
 
 
     def vipr_login(self):
@@ -209,7 +976,6 @@ class VseHttp:
         :return: nothing. if no exception thrown then login succeeded
         """
         cmn = module_var(self, self.IDX_CMN)
-        protocol = module_var(self, self.IDX_HTTP_PROTOCOL)
         ip = module_var(self, self.IDX_IP)
         port = module_var(self, self.IDX_PORT)
         user = module_var(self, self.IDX_VIPR_USER)
@@ -218,11 +984,26 @@ class VseHttp:
         if user is None or pwd is None:
             raise RuntimeError("Username or password for ViPR are undefined")
 
-        if self.vipr_logged_in():
-            cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                         "User {0} @ {1}:{2} is already logged in, need to "
-                         "logout first...".format(user, ip, port))
-            self.vipr_logout()
+        with module_var(self, self.IDX_LOGIN_LOCK):
+            if self.vipr_logged_in():
+                cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                             "User {0} @ {1}:{2} is already logged in, need "
+                             "to logout first...".format(user, ip, port))
+                self.vipr_logout()
+
+            if self.token_cache_enabled() and self.__login_from_token_cache():
+                return
+
+            self.__login()
+
+
+    def __login(self):
+        cmn = module_var(self, self.IDX_CMN)
+        protocol = module_var(self, self.IDX_HTTP_PROTOCOL)
+        ip = module_var(self, self.IDX_IP)
+        port = module_var(self, self.IDX_PORT)
+        user = module_var(self, self.IDX_VIPR_USER)
+        pwd = module_var(self, self.IDX_VIPR_PASSWORD)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "Logging into ViPR - {0} @ {1}:{2}...".format(
@@ -230,25 +1011,153 @@ class VseHttp:
                      ))
 
         session = module_var(self, self.IDX_SESSION)
-        response = session.get(
-            "{0}://{1}:{2}/login".format(protocol, ip, port),
-            auth=(user, pwd),
-            verify=False)
+        response = self.__auth_call(
+            '/login',
+            lambda: session.get(
+                "{0}://{1}:{2}/login".format(protocol, ip, port),
+                auth=(user, pwd),
+                verify=False,
+                timeout=self.get_timeouts()))
 
         if response.status_code != requests.codes['ok']:
             cmn.printMsg(cmn.MSG_LVL_ERROR,
                          "Login failed, message:\n {0}".format(response.text))
             response.raise_for_status()
 
-        # save authorization header
+        # save authorization header, request() attaches it to every call
         module_var(self,
                    self.IDX_VIPR_AUTH_COOKIE,
                    response.headers[self.VIPR_AUTH_HEADER])
+        module_var(self, self.IDX_VIPR_AUTH_ISSUED, time.time())
+
+        if self.token_cache_enabled():
+            self.__save_token_cache()
+
+
+    def __get_token_cache_file(self):
+        key = "{0}:{1}:{2}".format(module_var(self, self.IDX_IP),
+                                   module_var(self, self.IDX_PORT),
+                                   module_var(self, self.IDX_VIPR_USER))
+        cmn = module_var(self, self.IDX_CMN)
+        return os.path.join(cmn.get_vipr_logs_path(),
+                            self.TOKEN_CACHE_DIR_NAME,
+                            hashlib.sha1(key).hexdigest())
+
+
+    def __save_token_cache(self):
+        cmn = module_var(self, self.IDX_CMN)
+        path = self.__get_token_cache_file()
+
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path), 0700)
+
+            #
+            # token is as good as a password - owner only, from the start
+            #
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+            os.fchmod(fd, 0600)
+            with os.fdopen(fd, 'w') as fp:
+                json.dump({
+                    'host': module_var(self, self.IDX_IP),
+                    'port': module_var(self, self.IDX_PORT),
+                    'user': module_var(self, self.IDX_VIPR_USER),
+                    'token': module_var(self, self.IDX_VIPR_AUTH_COOKIE),
+                    'issued': module_var(self, self.IDX_VIPR_AUTH_ISSUED)
+                }, fp)
+
+        except (IOError, OSError) as e:
+            cmn.printMsg(cmn.MSG_LVL_WARNING,
+                         "Could not save ViPR auth token cache [{0}]: "
+                         "{1}".format(path, e))
+
+
+    def __drop_token_cache(self):
+        path = self.__get_token_cache_file()
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+    def __login_from_token_cache(self):
+        """
+        :return: True if cached token was still good and is now in use
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        path = self.__get_token_cache_file()
+
+        try:
+            with open(path, 'r') as fp:
+                cached = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return False
+
+        if cached.get('user') != module_var(self, self.IDX_VIPR_USER) or \
+           cached.get('token') is None or cached.get('issued') is None:
+            self.__drop_token_cache()
+            return False
+
+        module_var(self, self.IDX_VIPR_AUTH_COOKIE, cached['token'])
+        module_var(self, self.IDX_VIPR_AUTH_ISSUED, cached['issued'])
+        if self.need_to_refresh_login():
+            cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                         "Cached ViPR auth token is about to expire, "
+                         "logging in...")
+            self.__forget_token()
+            return False
 
-        # set authorization header for the session
-        session.headers.update({
-            self.VIPR_AUTH_HEADER: response.headers[self.VIPR_AUTH_HEADER]
-        })
+        #
+        # cheapest authenticated call there is
+        #
+        try:
+            response = self.__send(
+                'GET', self.TOKEN_CACHE_VALIDATE_API,
+                self.__full_url(self.TOKEN_CACHE_VALIDATE_API),
+                {'ACCEPT': 'application/json',
+                 self.VIPR_AUTH_HEADER: cached['token']},
+                None, None)
+            valid = response.status_code == requests.codes['ok']
+        except requests.exceptions.RequestException:
+            valid = False
+
+        if not valid:
+            cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                         "Cached ViPR auth token is rejected, logging in...")
+            self.__forget_token()
+            self.__drop_token_cache()
+            return False
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Reusing cached ViPR auth token issued {0:.0f}s "
+                     "ago".format(self.get_login_age()))
+        cmn.add_to_counter('vipr_login_cache_hits')
+        return True
+
+
+    def __forget_token(self):
+        module_var(self, self.IDX_VIPR_AUTH_COOKIE, delete=True)
+        module_var(self, self.IDX_VIPR_AUTH_ISSUED, delete=True)
+
+
+    def __refresh_login(self, stale_token):
+        """
+        replaces stale_token with a fresh one. single flight - whoever gets
+        the lock first logs in, others find the token already replaced and
+        return right away.
+
+        stale token is not logged out, it may already be expired (that is
+        usually why we are here), ViPR drops it on its own.
+        """
+        cmn = module_var(self, self.IDX_CMN)
+
+        with module_var(self, self.IDX_LOGIN_LOCK):
+            if module_var(self, self.IDX_VIPR_AUTH_COOKIE) != stale_token:
+                return
+
+            cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                         "Refreshing ViPR auth token issued {0:.0f}s "
+                         "ago...".format(self.get_login_age()))
+            cmn.add_to_counter('vipr_login_refreshes')
+            self.__login()
 
 
     def vipr_logout(self):
@@ -258,16 +1167,36 @@ class VseHttp:
 
         :return:
         """
-        cmn = module_var(self, self.IDX_CMN)
-        protocol = module_var(self, self.IDX_HTTP_PROTOCOL)
-        ip = module_var(self, self.IDX_IP)
-        port = module_var(self, self.IDX_PORT)
         user = module_var(self, self.IDX_VIPR_USER)
         pwd = module_var(self, self.IDX_VIPR_PASSWORD)
 
         if user is None or pwd is None:
             raise RuntimeError("Username or password for ViPR are undefined")
 
+        with module_var(self, self.IDX_LOGIN_LOCK):
+            #
+            # token stays alive on the server, next process picks it up
+            #
+            if self.token_cache_enabled():
+                cmn = module_var(self, self.IDX_CMN)
+                if not self.vipr_logged_in():
+                    raise RuntimeError("Not logged into ViPR")
+                cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                             "Keeping ViPR auth token cached for reuse, "
+                             "skipping logout")
+                self.__forget_token()
+                return
+
+            self.__logout()
+
+
+    def __logout(self):
+        cmn = module_var(self, self.IDX_CMN)
+        protocol = module_var(self, self.IDX_HTTP_PROTOCOL)
+        ip = module_var(self, self.IDX_IP)
+        port = module_var(self, self.IDX_PORT)
+        user = module_var(self, self.IDX_VIPR_USER)
+
         if not self.vipr_logged_in():
             raise RuntimeError("Not logged into ViPR")
 
@@ -277,9 +1206,14 @@ class VseHttp:
                      ))
 
         session = module_var(self, self.IDX_SESSION)
-        response = session.get(
-            "{0}://{1}:{2}/logout".format(protocol, ip, port),
-            verify=False)
+        response = self.__auth_call(
+            '/logout',
+            lambda: session.get(
+                "{0}://{1}:{2}/logout".format(protocol, ip, port),
+                headers={self.VIPR_AUTH_HEADER: module_var(
+                    self, self.IDX_VIPR_AUTH_COOKIE)},
+                verify=False,
+                timeout=self.get_timeouts()))
 
         if response.status_code != requests.codes['ok']:
             cmn.printMsg(cmn.MSG_LVL_ERROR,
@@ -287,14 +1221,32 @@ class VseHttp:
                              response.text))
             response.raise_for_status()
 
-        module_var(self, self.IDX_VIPR_AUTH_COOKIE, delete=True)
+        self.__forget_token()
+
+
+    def __auth_call(self, resource, live_call):
+        """
+        login/logout go around request(), but still get recorded/replayed
+        """
+        archive = module_var(self, self.IDX_HTTP_ARCHIVE_REF)
+        mode = self.get_http_mode()
+
+        if mode == self.HTTP_MODE_REPLAY:
+            return archive.replay('GET', resource, None)
+
+        started = time.time()
+        response = live_call()
+        if mode == self.HTTP_MODE_RECORD:
+            archive.record('GET', resource, None, response, response.content,
+                           time.time() - started)
+        return response
 
 
     def vipr_logged_in(self):
         """
         Returns True or False if logged into ViPR. Decision is based on
-        presence of ViPR Auth Token, even though it may be expired by now
-        though unlikely.
+        presence of ViPR Auth Token, even though it may be expired by now.
+        request() refreshes expiring tokens on its own.
 
         :return:  True/False
         """
@@ -303,6 +1255,280 @@ class VseHttp:
         return False
 
 
+    def get_login_age(self):
+        """
+        :return: seconds since current token was issued, None if logged out
+        """
+        issued = module_var(self, self.IDX_VIPR_AUTH_ISSUED)
+        return None if issued is None else time.time() - issued
+
+
+    def need_to_refresh_login(self):
+        """
+        :return: True if logged in, and token is about to expire
+        """
+        age = self.get_login_age()
+        return age is not None and \
+            age >= self.VIPR_AUTH_TOKEN_LIFETIME_SECONDS - \
+            self.VIPR_AUTH_TOKEN_REFRESH_MARGIN_SECONDS
+
+
+class HttpThrottle:
+    """
+    pace of calls to one ViPR host, shared by every VseHttp talking to it
+
+    token bucket - rate calls per second on average (0 - unlimited), with
+        bursts of up to burst calls
+    AIMD limit of calls in flight, between min_limit and max_limit - grows
+        by one for every limit's worth of healthy calls, shrinks by
+        DECREASE_FACTOR on overload (503/429, connection errors, latency
+        above latency_target if set), at most once per
+        DECREASE_INTERVAL_SECONDS so one burst of failures counts once
+    """
+    OVERLOAD_STATUS_CODES = [429, 503]
+    DECREASE_FACTOR = 0.7
+    DECREASE_INTERVAL_SECONDS = 1.0
+
+    throttles = {}
+    throttles_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, cmn, key, rate, burst, min_limit, max_limit,
+            latency_target):
+        with cls.throttles_lock:
+            if key not in cls.throttles:
+                cls.throttles[key] = HttpThrottle(
+                    cmn, key, rate, burst, min_limit, max_limit,
+                    latency_target)
+            return cls.throttles[key]
+
+    def __init__(self, cmn, key, rate, burst, min_limit, max_limit,
+                 latency_target):
+        self.cmn = cmn
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.latency_target = latency_target
+
+        self.condition = threading.Condition()
+        self.tokens = float(burst)
+        self.refilled = time.time()
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.decreased = 0
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "HTTP throttle for [{0}]: rate {1}/s (burst {2}), "
+                     "{3}-{4} calls in flight, latency target {5}s".format(
+                         key, rate or 'unlimited', burst, self.min_limit,
+                         self.max_limit, latency_target or 'none'))
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+            while self.rate:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.refilled) * self.rate)
+                self.refilled = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                self.condition.wait((1 - self.tokens) / self.rate)
+
+    def release(self, latency, overloaded):
+        decreased = False
+        with self.condition:
+            self.in_flight -= 1
+            if overloaded or (self.latency_target and
+                              latency > self.latency_target):
+                now = time.time()
+                if now - self.decreased >= self.DECREASE_INTERVAL_SECONDS:
+                    self.limit = max(self.min_limit,
+                                     self.limit * self.DECREASE_FACTOR)
+                    self.decreased = now
+                    decreased = True
+            else:
+                self.limit = min(self.max_limit,
+                                 self.limit + 1.0 / self.limit)
+            limit = self.limit
+            self.condition.notify_all()
+
+        if decreased:
+            self.cmn.add_to_counter('http_concurrency_decreases')
+            self.cmn.printMsg(self.cmn.MSG_LVL_DEBUG,
+                              "[{0}] is overloaded (latency {1:.2f}s), "
+                              "calls in flight limit is now {2}".format(
+                                  self.key, latency, int(limit)))
+
+
+class HttpArchive:
+    """
+    gzip'd JSON lines, one request/response exchange per line:
+        seq, method, resource, body_sha1, status, headers, elapsed and
+        text (or b64 for binary content)
+
+    request bodies are only kept as a digest (they are the replay key, and
+    may carry passwords); auth tokens in response headers and password
+    fields in JSON responses are redacted.
+
+    replay serves exchanges for the same method/resource/body in recorded
+    order, the last one repeats once exhausted (e.g. task polling).
+    """
+    REDACTED = "REDACTED"
+    KEPT_HEADERS = ['Content-Type', 'Content-Disposition',
+                    VseHttp.VIPR_AUTH_HEADER]
+    REDACTED_HEADERS = [VseHttp.VIPR_AUTH_HEADER]
+    REDACTED_FIELDS = ['password', 'pwd']
+
+    archives = {}
+    archives_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, cmn, path, mode):
+        with cls.archives_lock:
+            if path not in cls.archives:
+                cls.archives[path] = HttpArchive(cmn, path, mode)
+            return cls.archives[path]
+
+    def __init__(self, cmn, path, mode):
+        self.cmn = cmn
+        self.path = path
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.fp = None
+        self.exchanges = {}
+
+        if mode == VseHttp.HTTP_MODE_RECORD:
+            self.fp = gzip.open(path, 'ab')
+            atexit.register(self.close)
+            cmn.printMsg(cmn.MSG_LVL_INFO,
+                         "Recording ViPR API traffic into " + path)
+        else:
+            for line in self.__read_lines(path):
+                try:
+                    exchange = json.loads(line)
+                except ValueError:
+                    cmn.printMsg(cmn.MSG_LVL_WARNING,
+                                 "Skipping truncated archive line in " +
+                                 path)
+                    continue
+                self.exchanges.setdefault(
+                    self.__key(exchange['method'],
+                               exchange['resource'],
+                               exchange['body_sha1']),
+                    []).append(exchange)
+            cmn.printMsg(cmn.MSG_LVL_INFO,
+                         "Replaying ViPR API traffic from {0}, {1} distinct "
+                         "requests".format(path, len(self.exchanges)))
+
+    def close(self):
+        with self.lock:
+            if self.fp is not None:
+                self.fp.close()
+                self.fp = None
+
+    #
+    # archive of a session that died never got its gzip trailer - every
+    # line was flushed though, so inflate raw members without CRC checks
+    #
+    @staticmethod
+    def __read_lines(path):
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        text = ''
+        while data:
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            text += inflater.decompress(data)
+            data = inflater.unused_data
+        return text.splitlines()
+
+    @staticmethod
+    def __key(method, resource, body_sha1):
+        return "{0} {1} {2}".format(method, resource, body_sha1)
+
+    @staticmethod
+    def __digest(body):
+        if body is None:
+            return None
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        return hashlib.sha1(body).hexdigest()
+
+    def __redact(self, value):
+        if isinstance(value, dict):
+            return dict((k, self.REDACTED if k in self.REDACTED_FIELDS
+                         else self.__redact(v)) for k, v in value.items())
+        if isinstance(value, list):
+            return [self.__redact(v) for v in value]
+        return value
+
+    def record(self, method, resource, body, response, content, elapsed):
+        headers = {}
+        for name in self.KEPT_HEADERS:
+            if name in response.headers:
+                headers[name] = self.REDACTED \
+                    if name in self.REDACTED_HEADERS \
+                    else response.headers[name]
+
+        exchange = {
+            'method': method,
+            'resource': resource,
+            'body_sha1': self.__digest(body),
+            'status': response.status_code,
+            'headers': headers,
+            'elapsed': round(elapsed, 6),
+        }
+        try:
+            exchange['text'] = content.decode('utf-8')
+        except ValueError:
+            exchange['b64'] = base64.b64encode(content)
+
+        if 'text' in exchange and \
+           'json' in headers.get('Content-Type', ''):
+            try:
+                exchange['text'] = json.dumps(
+                    self.__redact(json.loads(exchange['text'])))
+            except ValueError:
+                pass
+
+        with self.lock:
+            self.seq += 1
+            exchange['seq'] = self.seq
+            self.fp.write(json.dumps(exchange) + '\n')
+            self.fp.flush()
+
+    def replay(self, method, resource, body):
+        key = self.__key(method, resource, self.__digest(body))
+        with self.lock:
+            exchanges = self.exchanges.get(key)
+            if not exchanges:
+                raise RuntimeError(
+                    "No recorded response for {0} {1} in {2}".format(
+                        method, resource, self.path))
+            exchange = exchanges.pop(0) if len(exchanges) > 1 \
+                else exchanges[0]
+
+        if 'b64' in exchange:
+            content = base64.b64decode(exchange['b64'])
+        else:
+            content = exchange['text'].encode('utf-8')
+
+        response = requests.Response()
+        response.status_code = exchange['status']
+        response.headers = CaseInsensitiveDict(exchange['headers'])
+        response.encoding = 'utf-8'
+        response.url = resource
+        response.raw = StringIO(content)
+        response._content = content
+        return response
+
+
 def json_decode(rsp):
     return json.loads(rsp, object_hook=_decode_dict)
 
@@ -0,0 +1,159 @@
+__author__ = 'belens'
+
+"""
+append-only checkpoint journal for bulk driver apps (load_hosts,
+drop_and_ingest_volume, XFER...): one JSON line per unit of work done,
+written to the session folder, so a run that died half way can be resumed
+from another session without repeating what already went through.
+
+a unit of work is identified by a step name (what was done - "register
+host", "ingest volume", ...) and a content hash of the values it was done
+for (CSV row, volume info...). an edited row hashes differently, so it is
+done again on resume, as it should be.
+
+resuming reads the journal of an earlier session; its completed entries
+are copied into the journal of this session first, so a resumed run can
+itself be resumed. a line cut short by a crash is ignored.
+
+throws exceptions that should be handled above
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from vseCmn import module_var
+
+
+class VseJournal:
+    IDX_CMN = "Module_Ref_Common"
+    IDX_JOURNAL_FILE = "Journal_File_Path"
+    IDX_JOURNAL_FH = "Journal_File_Handle"
+    IDX_COMPLETED = "Completed_Keys"
+    IDX_LOCK = "Journal_Lock"
+
+    JOURNAL_FILE_NAME = "journal.jsonl"
+
+    OUTCOME_DONE = "DONE"
+    OUTCOME_FAILED = "FAILED"
+
+
+    def __init__(self, cmn, resume_session=None):
+        """
+        :param resume_session: session name (folder next to the current
+                               session) or path of a session folder, whose
+                               completed work is to be skipped
+        """
+        self.data = {}
+        module_var(self, self.IDX_CMN, cmn)
+        module_var(self, self.IDX_LOCK, threading.Lock())
+        module_var(self, self.IDX_JOURNAL_FILE,
+                   os.path.join(cmn.get_session_path(),
+                                self.JOURNAL_FILE_NAME))
+
+        completed = {}
+        if resume_session is not None:
+            completed = self.__load_completed(
+                self.__get_resume_journal_file(resume_session))
+        module_var(self, self.IDX_COMPLETED, completed)
+
+        #
+        # line buffered - every record is on disk before the next is done
+        #
+        module_var(self, self.IDX_JOURNAL_FH,
+                   open(module_var(self, self.IDX_JOURNAL_FILE), 'a', 1))
+        for key, entry in completed.items():
+            self.__write(entry)
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "VseJournal module initialization is complete, "
+                     "journal {0}, {1} completed entries carried "
+                     "over".format(module_var(self, self.IDX_JOURNAL_FILE),
+                                   len(completed)))
+
+
+    def __get_resume_journal_file(self, resume_session):
+        cmn = module_var(self, self.IDX_CMN)
+        session_path = resume_session
+        if not os.path.isdir(session_path):
+            session_path = os.path.join(
+                os.path.dirname(cmn.get_session_path()), resume_session)
+
+        journal_file = os.path.join(session_path, self.JOURNAL_FILE_NAME)
+        if not os.path.isfile(journal_file):
+            from VseExceptions import VSEInitExc
+            raise VSEInitExc(
+                "Can not resume session [{0}] - journal [{1}] does not "
+                "exist".format(resume_session, journal_file))
+        return journal_file
+
+
+    def __load_completed(self, journal_file):
+        cmn = module_var(self, self.IDX_CMN)
+        completed = {}
+        with open(journal_file, 'r') as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    cmn.printMsg(cmn.MSG_LVL_WARNING,
+                                 "Skipping damaged journal line: " +
+                                 line.strip())
+                    continue
+                key = entry.get('key')
+                if entry.get('outcome') == self.OUTCOME_DONE:
+                    completed[key] = entry
+                else:
+                    completed.pop(key, None)
+
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Resuming from journal {0}: {1} completed entries will "
+                     "be skipped".format(journal_file, len(completed)))
+        return completed
+
+
+    def __write(self, entry):
+        fh = module_var(self, self.IDX_JOURNAL_FH)
+        fh.write(json.dumps(entry, sort_keys=True, default=str) + '\n')
+
+
+    @staticmethod
+    def make_key(step, *values):
+        """
+        step plus content hash of values - anything json serializable
+        """
+        return "{0}:{1}".format(
+            step,
+            hashlib.sha256(json.dumps(values, sort_keys=True)).hexdigest())
+
+
+    def is_done(self, key):
+        with module_var(self, self.IDX_LOCK):
+            return key in module_var(self, self.IDX_COMPLETED)
+
+
+    def record(self, key, outcome, details=None):
+        """
+        appends outcome (OUTCOME_DONE/OUTCOME_FAILED) of key to journal
+        :param details: anything json serializable, for the reader
+        """
+        entry = {
+            'key': key,
+            'outcome': outcome,
+            'time': time.time(),
+            'details': details
+        }
+        with module_var(self, self.IDX_LOCK):
+            completed = module_var(self, self.IDX_COMPLETED)
+            if outcome == self.OUTCOME_DONE:
+                completed[key] = entry
+            else:
+                completed.pop(key, None)
+            self.__write(entry)
+
+
+    def close(self):
+        with module_var(self, self.IDX_LOCK):
+            module_var(self, self.IDX_JOURNAL_FH).close()
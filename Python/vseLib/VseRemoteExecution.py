@@ -3,7 +3,9 @@ __author__ = 'belens'
 """
 VseRemoteExecution Remote Execution library uses python's paramiko library
 
-SSH tunnel is opened for every command
+SSH sessions are pooled per host/user (unless pooling is turned off), every
+command and every SFTP transfer opens its own channel on a pooled transport.
+pooled sessions are closed at interpreter exit
 
 throws exceptions that should be handled above
 """
@@ -11,21 +13,124 @@ throws exceptions that should be handled above
 
 from paramiko import AutoAddPolicy
 from paramiko import SSHClient
+import atexit
 import hashlib
+import os
+import pipes
+import Queue
+import threading
 import time
+import zlib
 from vseCmn import module_var
 
 
 class VseRemoteExecution:
     IDX_CMN = "Module_Ref_Common"
+    IDX_POOL_SESSIONS = "Pool_SSH_Sessions"
+    IDX_COMPRESS_THRESHOLD = "Compress_Transfers_Above_Bytes"
 
-    def __init__(self, cmn):
+    #
+    # connected SSH sessions, keyed by (host, user). kept at class level,
+    # so that apps instantiating this module for every dump/load still
+    # share one transport per ViPR node
+    #
+    ssh_session_pool = {}
+    ssh_session_pool_lock = threading.Lock()
+
+    #
+    # one per (host, user) - connecting holds up only threads that want
+    # the same host, and only one of them connects
+    #
+    ssh_session_connect_locks = {}
+
+    #
+    # dbcli XML dumps are very repetitive text, anything larger than this
+    # travels gzipped through an exec channel instead of plain SFTP
+    #
+    XFER_COMPRESS_THRESHOLD = 256 * 1024
+    XFER_CHUNK_SIZE = 64 * 1024
+
+    #
+    # defaults for every instance. apps create this module on the fly, so
+    # harnesses (e.g. app_Benchmarks) flip these at class level
+    #
+    SSH_PORT = 22
+    POOL_SESSIONS = True
+
+    def __init__(self, cmn, pool_sessions=None, compress_threshold=None):
         module_var(self, self.IDX_CMN, cmn)
+        module_var(self, self.IDX_POOL_SESSIONS,
+                   pool_sessions if pool_sessions is not None
+                   else self.POOL_SESSIONS)
+        module_var(self, self.IDX_COMPRESS_THRESHOLD,
+                   compress_threshold if compress_threshold is not None
+                   else self.XFER_COMPRESS_THRESHOLD)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "VseRemoteExecution module is initialized...")
 
 
+    def __connect(self, ip, username, pwd):
+        ssh_session = SSHClient()
+        ssh_session.set_missing_host_key_policy(AutoAddPolicy())
+        ssh_session.connect(hostname=ip, port=self.SSH_PORT,
+                            username=username, password=pwd)
+        return ssh_session
+
+
+    def __get_ssh_session(self, ip, username, pwd):
+        """
+        returns connected SSHClient - from the pool if pooling is on and
+        pooled transport is still alive, otherwise a brand new one
+        """
+        cmn = module_var(self, self.IDX_CMN)
+
+        if not module_var(self, self.IDX_POOL_SESSIONS):
+            return self.__connect(ip, username, pwd)
+
+        key = (ip, username)
+        with self.ssh_session_pool_lock:
+            ssh_session = self.ssh_session_pool.get(key)
+            if is_session_active(ssh_session):
+                return ssh_session
+            connect_lock = self.ssh_session_connect_locks.setdefault(
+                key, threading.Lock())
+
+        with connect_lock:
+            # another thread may have connected while this one waited
+            with self.ssh_session_pool_lock:
+                ssh_session = self.ssh_session_pool.get(key)
+            if is_session_active(ssh_session):
+                return ssh_session
+
+            cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                         "Opening pooled SSH session to {0}@{1}...".format(
+                             username, ip))
+            ssh_session = self.__connect(ip, username, pwd)
+            with self.ssh_session_pool_lock:
+                self.ssh_session_pool[key] = ssh_session
+            cmn.add_to_counter('ssh_sessions_opened')
+
+        return ssh_session
+
+
+    def __release_ssh_session(self, ssh_session):
+        if not module_var(self, self.IDX_POOL_SESSIONS):
+            ssh_session.close()
+
+
+    @classmethod
+    def close_pooled_sessions(cls):
+        with cls.ssh_session_pool_lock:
+            ssh_sessions = cls.ssh_session_pool.values()
+            cls.ssh_session_pool.clear()
+        for ssh_session in ssh_sessions:
+            try:
+                ssh_session.close()
+            except Exception:
+                pass
+
+
     def rx_cmd_simple(self, ip, username, pwd, cmd, sleepTimerSeconds=1):
         """
         execute any command on targeted system.
@@ -41,9 +146,7 @@ class VseRemoteExecution:
                      "To server [" + str(ip) + "], sending " +
                      "command [" + str(cmd) + "]...")
 
-        ssh_session = SSHClient()
-        ssh_session.set_missing_host_key_policy(AutoAddPolicy())
-        ssh_session.connect(hostname=ip, username=username, password=pwd)
+        ssh_session = self.__get_ssh_session(ip, username, pwd)
 
         # reach out to lower level Channel class in order to reach exit code.
         channel = ssh_session.get_transport().open_session()
@@ -83,7 +186,8 @@ class VseRemoteExecution:
                 exit_code = channel.recv_exit_status()
                 break
 
-        ssh_session.close()
+        channel.close()
+        self.__release_ssh_session(ssh_session)
 
         # report event in the logfiles
         msg_level = cmn.MSG_LVL_DEBUG
@@ -107,11 +211,15 @@ class VseRemoteExecution:
     # Upload/Download a file are some of the simplest things only. Can
     # mkdir, chown, ls, pwd, and more.
     #
+    # compress - None picks compressed transfer automatically for files
+    # above the threshold, True/False forces it on/off
+    #
     XFER_OP_UP = 'Upload'
     XFER_OP_DL = 'Download'
     def xfer_file_sftp(self, xfer_op,
                        remote_host, username, pwd,
-                       local_path, remote_path):
+                       local_path, remote_path,
+                       compress=None):
 
         cmn = module_var(self, self.IDX_CMN)
 
@@ -137,11 +245,31 @@ class VseRemoteExecution:
         #
         # open SFTP client session
         #
-        ssh_session = SSHClient()
-        ssh_session.set_missing_host_key_policy(AutoAddPolicy())
-        ssh_session.connect(hostname=remote_host, username=username, password=pwd)
+        ssh_session = self.__get_ssh_session(remote_host, username, pwd)
         sftp = ssh_session.open_sftp()
 
+        if compress is None:
+            if xfer_op == self.XFER_OP_UP:
+                file_size = os.path.getsize(local_path)
+            else:
+                file_size = sftp.stat(remote_path).st_size
+            compress = \
+                file_size >= module_var(self, self.IDX_COMPRESS_THRESHOLD)
+
+        #
+        # large files go gzipped through exec channel, and are verified
+        # by comparing local MD5 with remote md5sum
+        #
+        if compress:
+            sftp.close()
+            try:
+                self.xfer_file_compressed(xfer_op,
+                                          ssh_session.get_transport(),
+                                          local_path, remote_path)
+            finally:
+                self.__release_ssh_session(ssh_session)
+            return
+
         #
         # File transfer, up or down
         #
@@ -165,7 +293,7 @@ class VseRemoteExecution:
         # cleanup before ending
         #
         sftp.close()
-        ssh_session.close()
+        self.__release_ssh_session(ssh_session)
 
         if md5_local != md5_remote:
             raise Exception("File {0} transferred to {1}@{2}:{3}, "
@@ -173,6 +301,300 @@ class VseRemoteExecution:
                             "operation a failure.")
 
 
+    def xfer_file_compressed(self, xfer_op, transport,
+                             local_path, remote_path):
+        """
+        transfer file gzipped over exec channel on an open transport.
+        remote side runs gzip/gunzip, local side (de)compresses as a
+        stream, so neither side holds the whole file in memory.
+
+        byte counts and compression ratio are reported into cmn counters
+
+        :return: tuple of (raw bytes, bytes on the wire)
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        chunk_size = self.XFER_CHUNK_SIZE
+        raw_bytes = 0
+        wire_bytes = 0
+
+        channel = transport.open_session()
+
+        if xfer_op == self.XFER_OP_DL:
+            channel.exec_command("gzip -c {0}".format(
+                pipes.quote(remote_path)))
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            with open(local_path, 'wb') as fp:
+                while True:
+                    chunk = channel.recv(chunk_size)
+                    if not chunk:
+                        break
+                    wire_bytes += len(chunk)
+                    data = decompressor.decompress(chunk)
+                    raw_bytes += len(data)
+                    fp.write(data)
+                data = decompressor.flush()
+                raw_bytes += len(data)
+                fp.write(data)
+
+        else:
+            channel.exec_command("gzip -dc > {0}".format(
+                pipes.quote(remote_path)))
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            with open(local_path, 'rb') as fp:
+                while True:
+                    data = fp.read(chunk_size)
+                    if not data:
+                        break
+                    raw_bytes += len(data)
+                    chunk = compressor.compress(data)
+                    if chunk:
+                        wire_bytes += len(chunk)
+                        channel.sendall(chunk)
+            chunk = compressor.flush()
+            wire_bytes += len(chunk)
+            channel.sendall(chunk)
+            channel.shutdown_write()
+
+        exit_code = channel.recv_exit_status()
+        channel.close()
+
+        if exit_code != 0:
+            raise Exception("Compressed {0} of {1} failed, remote gzip "
+                            "exited with code [{2}]".format(
+                                xfer_op, remote_path, exit_code))
+
+        #
+        # bytes are carried as-is, so straight MD5 comparison is valid
+        #
+        md5_local = file_md5(local_path)
+        md5_remote = self.remote_md5(transport, remote_path)
+        if md5_local != md5_remote:
+            raise Exception("File {0} transferred to {1}, but MD5 checksum "
+                            "is wrong, consider operation a "
+                            "failure.".format(local_path, remote_path))
+
+        cmn.add_to_counter('sftp_compressed_xfers')
+        cmn.add_to_counter('sftp_compressed_bytes_raw', raw_bytes)
+        cmn.add_to_counter('sftp_compressed_bytes_wire', wire_bytes)
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Compressed {0} of {1} done: {2} bytes raw, {3} bytes "
+                     "on the wire, ratio {4:.1f}x".format(
+                         xfer_op, remote_path, raw_bytes, wire_bytes,
+                         float(raw_bytes) / max(wire_bytes, 1)))
+
+        return raw_bytes, wire_bytes
+
+
+    #
+    # transfer many independent files at once - e.g. dumps that cannot be
+    # batched into one dbcli call. every worker owns an SFTP channel on the
+    # pooled transport, failed files are retried individually.
+    #
+    # file_pairs - list of (remote_path, local_path) tuples
+    #
+    # returns list of per-file result dictionaries, in file_pairs order
+    #
+    XFER_RESULT_OK = 'OK'
+    XFER_RESULT_FAILED = 'FAILED'
+    def xfer_files_sftp_parallel(self, xfer_op,
+                                 remote_host, username, pwd,
+                                 file_pairs,
+                                 concurrency=4,
+                                 retries=2,
+                                 compress=None):
+        cmn = module_var(self, self.IDX_CMN)
+
+        if xfer_op not in [self.XFER_OP_DL, self.XFER_OP_UP]:
+            cmn.printMsg(cmn.MSG_LVL_WARNING,
+                         "Unsupported SFTP operation, not in:",
+                         [self.XFER_OP_UP, self.XFER_OP_DL])
+            raise Exception("Unsupported SFTP operation")
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "{0}ing {1} files {2}@{3} over {4} channels...".format(
+                         xfer_op, len(file_pairs), username, remote_host,
+                         concurrency))
+
+        results = [None] * len(file_pairs)
+        work_queue = Queue.Queue()
+        for idx, (remote_path, local_path) in enumerate(file_pairs):
+            work_queue.put((idx, remote_path, local_path))
+
+        def worker():
+            ssh_session = None
+            sftp = None
+            while True:
+                try:
+                    idx, remote_path, local_path = work_queue.get_nowait()
+                except Queue.Empty:
+                    break
+
+                result = {
+                    'remote_path': remote_path,
+                    'local_path': local_path,
+                    'status': self.XFER_RESULT_FAILED,
+                    'attempts': 0,
+                    'bytes': 0,
+                    'seconds': 0.0,
+                    'md5': None,
+                    'error': None
+                }
+                started = time.time()
+
+                while result['attempts'] <= retries:
+                    result['attempts'] += 1
+                    try:
+                        if sftp is None:
+                            ssh_session = self.__get_ssh_session(
+                                remote_host, username, pwd)
+                            sftp = ssh_session.open_sftp()
+
+                        result['bytes'], result['md5'] = \
+                            self.__xfer_one_file_verified(
+                                xfer_op, ssh_session, sftp,
+                                local_path, remote_path, compress)
+                        result['status'] = self.XFER_RESULT_OK
+                        result['error'] = None
+                        break
+
+                    except Exception as e:
+                        result['error'] = str(e)
+                        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                                     "{0} of {1} failed on attempt {2}: "
+                                     "{3}".format(xfer_op, remote_path,
+                                                  result['attempts'], e))
+                        #
+                        # channel (or whole transport) may be broken,
+                        # drop it and let next attempt re-open
+                        #
+                        try:
+                            if sftp is not None:
+                                sftp.close()
+                        except Exception:
+                            pass
+                        sftp = None
+                        if ssh_session is not None:
+                            self.__release_ssh_session(ssh_session)
+                            ssh_session = None
+
+                        # last attempt failed - nothing left to wait for
+                        if result['attempts'] <= retries:
+                            cmn.add_to_counter('sftp_parallel_retries')
+                            time.sleep(result['attempts'])
+
+                result['seconds'] = time.time() - started
+                results[idx] = result
+
+            if sftp is not None:
+                sftp.close()
+            if ssh_session is not None:
+                self.__release_ssh_session(ssh_session)
+
+        workers = []
+        for i in range(max(1, min(concurrency, len(file_pairs)))):
+            t = threading.Thread(target=worker,
+                                 name="sftp-xfer-{0}".format(i))
+            t.daemon = True
+            t.start()
+            workers.append(t)
+        for t in workers:
+            t.join()
+
+        #
+        # summarize - counters and a table for the log
+        #
+        table = "{0:<8} {1:>8} {2:>12} {3:>8}  {4}\n".format(
+            'STATUS', 'ATTEMPTS', 'BYTES', 'SECONDS', 'REMOTE PATH')
+        for result in results:
+            if result['status'] == self.XFER_RESULT_OK:
+                cmn.add_to_counter('sftp_parallel_files_ok')
+                cmn.add_to_counter('sftp_parallel_bytes', result['bytes'])
+            else:
+                cmn.add_to_counter('sftp_parallel_files_failed')
+            table += "{0:<8} {1:>8} {2:>12} {3:>8.2f}  {4}\n".format(
+                result['status'], result['attempts'], result['bytes'],
+                result['seconds'], result['remote_path'])
+
+        failed = [r for r in results if r['status'] != self.XFER_RESULT_OK]
+        cmn.printMsg(cmn.MSG_LVL_WARNING if len(failed) > 0
+                     else cmn.MSG_LVL_DEBUG,
+                     "Parallel {0} finished, {1} of {2} files "
+                     "failed:\n{3}".format(xfer_op, len(failed),
+                                           len(results), table))
+
+        return results
+
+
+    def __xfer_one_file_verified(self, xfer_op, ssh_session, sftp,
+                                 local_path, remote_path, compress):
+        """
+        single file transfer on already opened SFTP channel, verified by
+        MD5 of the bytes on both ends.
+
+        :return: tuple of (bytes, md5 hex)
+        """
+        if compress is None:
+            if xfer_op == self.XFER_OP_UP:
+                file_size = os.path.getsize(local_path)
+            else:
+                file_size = sftp.stat(remote_path).st_size
+            compress = \
+                file_size >= module_var(self, self.IDX_COMPRESS_THRESHOLD)
+
+        if compress:
+            raw_bytes, wire_bytes = self.xfer_file_compressed(
+                xfer_op, ssh_session.get_transport(), local_path, remote_path)
+            return raw_bytes, file_md5(local_path)
+
+        if xfer_op == self.XFER_OP_UP:
+            sftp.put(local_path, remote_path, callback=None, confirm=True)
+        else:
+            sftp.get(remote_path, local_path, callback=None)
+
+        md5_local = file_md5(local_path)
+        md5_remote = self.remote_md5(ssh_session.get_transport(),
+                                     remote_path)
+        if md5_local != md5_remote:
+            raise Exception("File {0} transferred to {1}, but MD5 checksum "
+                            "is wrong.".format(local_path, remote_path))
+
+        return os.path.getsize(local_path), md5_local
+
+
+    def remote_md5(self, transport, remote_path):
+        """
+        hex MD5 of a remote file, computed remotely with md5sum
+        """
+        channel = transport.open_session()
+        channel.exec_command("md5sum {0}".format(pipes.quote(remote_path)))
+        output = ''
+        while True:
+            chunk = channel.recv(1024)
+            if not chunk:
+                break
+            output += chunk
+        exit_code = channel.recv_exit_status()
+        channel.close()
+
+        if exit_code != 0 or len(output.split()) == 0:
+            raise Exception("Unable to compute MD5 of remote file "
+                            "{0}".format(remote_path))
+
+        return output.split()[0]
+
+
+def file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as fp:
+        while True:
+            data = fp.read(1024 * 1024)
+            if not data:
+                break
+            md5.update(data)
+    return md5.hexdigest()
+
+
 def get_buffered_output(channel):
     out = ''
     if channel.recv_ready():
@@ -182,3 +604,15 @@ def get_buffered_output(channel):
             next_kb = channel.recv(1024)
     return out
 
+
+def is_session_active(ssh_session):
+    return ssh_session is not None and \
+        ssh_session.get_transport() is not None and \
+        ssh_session.get_transport().is_active()
+
+
+#
+# nothing else closes the pool, transports would stay open until the very
+# end of the interpreter
+#
+atexit.register(VseRemoteExecution.close_pooled_sessions)
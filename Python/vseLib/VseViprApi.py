@@ -9,11 +9,13 @@ path]
 """
 
 import string
+import threading
 import time
 import re
 
 from vseCmn import module_var
 from VseHttp import VseHttp, json_decode, json_encode, json_encode_value
+from VseViprApiConcurrent import VseViprApiConcurrent
 
 
 class VseViprApi:
@@ -60,11 +62,13 @@ class VseViprApi:
     #
     # initiators
     #
+    API_GET_ALL_INIT_URNS = "/compute/initiators/bulk"
     API_PST_INIT_BULK_INFO = "/compute/initiators/bulk"
 
     #
     # hosts
     #
+    API_GET_ALL_HOST_URNS = "/compute/hosts/bulk"
     API_PST_HOST_BULK_INFO = "/compute/hosts/bulk"
     API_GET_HOST_INITIATORS = "/compute/hosts/{0}/initiators"
     API_PST_HOST_CREATE = "/compute/hosts"
@@ -74,6 +78,7 @@ class VseViprApi:
     #
     # clusters
     #
+    API_GET_ALL_CLUSTER_URNS = "/compute/clusters/bulk"
     API_PST_CLUSTER_BULK_INFO = "/compute/clusters/bulk"
     API_GET_CLUSTER_HOSTS = "/compute/clusters/{0}/hosts"
     API_PST_CLUSTER_CREATE = "/tenants/{0}/clusters"
@@ -92,6 +97,7 @@ class VseViprApi:
     API_GET_STORAGE_SYSTEM = "/vdc/storage-systems/{0}"
     API_GET_STORAGE_SYSTEM_POOLS = "/vdc/storage-systems/{0}/storage-pools"
     API_GET_STORAGE_POOL = "/vdc/storage-pools/{0}"
+    API_PST_ALL_STORAGE_POOL_DETAILS = "/vdc/storage-pools/bulk"
     API_GET_STORAGE_SYSTEM_PORTS = "/vdc/storage-systems/{0}/storage-ports"
     API_PST_ALL_STORAGE_PORT_DETAILS = "/vdc/storage-ports/bulk"
 
@@ -170,22 +176,33 @@ class VseViprApi:
     IDX_CACHED_SS_INFO = "cached_storage_systems_list"
     IDX_CACHED_SS_DETAILS = "cached_storage_systems_details_dict_by_id"
     IDX_CACHED_SP_DETAILS = "cached_storage_pools_details_dict_by_id"
+    IDX_CACHED_SP_BY_NAME = "cached_storage_pools_by_name_dict_by_ss_id"
     IDX_CACHED_PROJECT_DETAILS = "cached_project_details_dict_by_id"
     IDX_CACHED_VA_DETAILS = "cached_va_details_dict_by_id"
     IDX_CACHED_VP_DETAILS = "cached_vp_details_dict_by_id"
     IDX_CACHED_CG_DETAILS = "cached_cg_details_dict_by_id"
     IDX_CACHED_CATALOG_DETAILS = 'cached_sc_svc_details_dict_by_name'
+    IDX_CACHE_LOCK = "cache_lock"
+    IDX_CACHE_FILL_LOCKS = "cache_fill_locks_by_entry"
 
 
-    def __init__(self, cmn):
+    def __init__(self, cmn, vipr_host=None, vipr_port=None, vipr_user=None,
+                 vipr_password=None):
+        """
+        connection parameters default to [vseCmn] ones, pass them in to
+        talk to another ViPR instance
+        """
         self.data = {}
         module_var(self, self.IDX_CMN, cmn)
+        module_var(self, self.IDX_CACHE_LOCK, threading.Lock())
+        module_var(self, self.IDX_CACHE_FILL_LOCKS, {})
         module_var(self, self.IDX_VIPR_SESSION,
                    VseHttp(cmn,
-                           cmn.get_vipr_host_name(),
-                           cmn.get_vipr_host_port(),
-                           vipr_user=cmn.get_vipr_user(),
-                           vipr_password=cmn.get_vipr_password()))
+                           vipr_host or cmn.get_vipr_host_name(),
+                           int(vipr_port or cmn.get_vipr_host_port()),
+                           vipr_user=vipr_user or cmn.get_vipr_user(),
+                           vipr_password=vipr_password or
+                           cmn.get_vipr_password()))
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "VseViprApi module initialization is complete")
@@ -195,6 +212,57 @@ class VseViprApi:
         module_var(self, self.IDX_VIPR_SESSION).vipr_login()
 
 
+    #
+    # cache lookup with single-flight fill. on a miss the first caller runs
+    # fetch(), concurrent callers for the same entry wait for it and then
+    # find it cached, instead of making the same call N times.
+    # key None - cache holds one value, not a dictionary by key.
+    # a fill lock lives only while its entry is being filled, callers
+    # waiting on it hold their own reference
+    #
+    # returns (data, True if data came from cache)
+    #
+    def __get_cached(self, cache_idx, key, fetch):
+        def lookup():
+            cache = module_var(self, cache_idx)
+            if key is None or cache is None:
+                return cache
+            return cache.get(key)
+
+        data = lookup()
+        if data is not None:
+            return data, True
+
+        with module_var(self, self.IDX_CACHE_LOCK):
+            fill_locks = module_var(self, self.IDX_CACHE_FILL_LOCKS)
+            fill_lock = fill_locks.setdefault((cache_idx, key),
+                                              threading.Lock())
+
+        with fill_lock:
+            try:
+                data = lookup()
+                if data is not None:
+                    return data, True
+
+                data = fetch()
+
+                with module_var(self, self.IDX_CACHE_LOCK):
+                    if key is None:
+                        module_var(self, cache_idx, data)
+                    else:
+                        cache = module_var(self, cache_idx)
+                        if cache is None:
+                            cache = dict()
+                            module_var(self, cache_idx, cache)
+                        cache[key] = data
+            finally:
+                with module_var(self, self.IDX_CACHE_LOCK):
+                    if fill_locks.get((cache_idx, key)) is fill_lock:
+                        del fill_locks[(cache_idx, key)]
+
+        return data, False
+
+
     def logout(self):
         module_var(self, self.IDX_VIPR_SESSION).vipr_logout()
 
@@ -223,13 +291,15 @@ class VseViprApi:
             (r_code, r_text) = session.request(
                 'PUT',
                 self.API_PUT_TAGS.format(tag_resource_type, target_urn),
-                body=json_encode("add", tags_delta_list)
+                body=json_encode("add", tags_delta_list),
+                retry_safe=True
             )
         elif tag_action == self.IDX_TAG_ACTION_RMV:
             (r_code, r_text) = session.request(
                 'PUT',
                 self.API_PUT_TAGS.format(tag_resource_type, target_urn),
-                body=json_encode("remove", tags_delta_list)
+                body=json_encode("remove", tags_delta_list),
+                retry_safe=True
             )
         else:
             msg = "Unrecognized action [{0}]".format(tag_action)
@@ -266,7 +336,7 @@ class VseViprApi:
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "Personal Info: ",
-                     cmn.ppFormat(about_me),
+                     about_me,
                      print_only_in_full_debug_mode=True)
 
         return about_me
@@ -297,7 +367,30 @@ class VseViprApi:
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "List of all volume URNs: ",
-                     cmn.ppFormat(list_urns),
+                     list_urns,
+                     print_only_in_full_debug_mode=True)
+
+        return list_urns
+
+
+    def get_list_of_all_uris(self, get_api):
+        """
+        GET on a bulk endpoint (API_GET_ALL_*_URNS) - URNs of every object
+        of that kind, fodder for get_bulk_info_by_list_of_ids
+        :return:  list of URIs
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        session = module_var(self, self.IDX_VIPR_SESSION)
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Attempting to list URNs of all [{0}]...".format(
+                         get_api))
+
+        (r_code, r_text) = session.request('GET', get_api)
+        list_urns = json_decode(r_text).get('id')
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "List of all [{0}] URNs: ".format(get_api),
+                     list_urns,
                      print_only_in_full_debug_mode=True)
 
         return list_urns
@@ -326,7 +419,7 @@ class VseViprApi:
             cmn.printMsg(
                 cmn.MSG_LVL_DEBUG,
                 "Attempting to retrieve details for devices in: ",
-                cmn.ppFormat(list_urns),
+                list_urns,
                 print_only_in_full_debug_mode=True)
 
         (r_code, r_text) = session.request(
@@ -390,10 +483,7 @@ class VseViprApi:
         #
         # handle retrieval of systems from cache or from ViPR
         #
-        cached_storage_systems = module_var(
-            self, self.IDX_CACHED_SS_INFO)
-
-        if cached_storage_systems is None:
+        def fetch():
             session = module_var(self, self.IDX_VIPR_SESSION)
             cmn.printMsg(cmn.MSG_LVL_DEBUG,
                          "Retrieving list of all storage systems")
@@ -403,23 +493,16 @@ class VseViprApi:
                 self.API_GET_STORAGE_SYSTEMS
             )
 
-            cached_storage_systems = json_decode(r_text).get(
-                'storage_system')
-
-            # create a list module variable entry
-            module_var(self, self.IDX_CACHED_SS_INFO,
-                       cached_storage_systems)
+            return json_decode(r_text).get('storage_system')
 
-            cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                         "Storage Systems list JSON retrieved (from ViPR):",
-                         cached_storage_systems,
-                         print_only_in_full_debug_mode=True)
+        cached_storage_systems, from_cache = self.__get_cached(
+            self.IDX_CACHED_SS_INFO, None, fetch)
 
-        else:
-            cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                         "Storage Systems list JSON retrieved (from cache):",
-                         cached_storage_systems,
-                         print_only_in_full_debug_mode=True)
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Storage Systems list JSON retrieved (from {0}):".format(
+                         'cache' if from_cache else 'ViPR'),
+                     cached_storage_systems,
+                     print_only_in_full_debug_mode=True)
 
         # create a copy of the list - wouldn't want to delete items from
         # cached list, that would defeat the purpose of caching
@@ -471,43 +554,27 @@ class VseViprApi:
         """
         cmn = module_var(self, self.IDX_CMN)
 
-        cached_va_details = module_var(
-            self,
-            self.IDX_CACHED_VA_DETAILS)
+        def fetch():
+            session = module_var(self, self.IDX_VIPR_SESSION)
 
-        if cached_va_details is not None and \
-           cached_va_details.get(uri) is not None:
             cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                         "Data for virtual array (cached) - " + uri,
-                         cached_va_details.get(uri),
-                         print_only_in_full_debug_mode=True)
-            return cached_va_details.get(uri)
+                         "Retrieving info for virtual array - " + uri)
 
-        session = module_var(self, self.IDX_VIPR_SESSION)
-
-        cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Retrieving info for virtual array - " + uri)
+            (r_code, r_text) = session.request(
+                'GET',
+                self.API_GET_VA.format(uri)
+            )
+            return json_decode(r_text)
 
-        (r_code, r_text) = session.request(
-            'GET',
-            self.API_GET_VA.format(uri)
-        )
-        data = json_decode(r_text)
+        data, from_cache = self.__get_cached(
+            self.IDX_CACHED_VA_DETAILS, uri, fetch)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Data for virtual array (retrieved) - " + uri,
+                     "Data for virtual array ({0}) - ".format(
+                         'cached' if from_cache else 'retrieved') + uri,
                      data,
                      print_only_in_full_debug_mode=True)
 
-        #
-        #  cache for later consumption
-        #
-        if cached_va_details is None:
-            cached_va_details = dict()
-            module_var(self, self.IDX_CACHED_VA_DETAILS,
-                       cached_va_details)
-        cached_va_details[uri] = data
-
         return data
 
 
@@ -524,43 +591,27 @@ class VseViprApi:
         """
         cmn = module_var(self, self.IDX_CMN)
 
-        cached_vp_details = module_var(
-            self,
-            self.IDX_CACHED_VP_DETAILS)
+        def fetch():
+            session = module_var(self, self.IDX_VIPR_SESSION)
 
-        if cached_vp_details is not None and \
-           cached_vp_details.get(uri) is not None:
             cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                         "Data for virtual pool (cached) - " + uri,
-                         cached_vp_details.get(uri),
-                         print_only_in_full_debug_mode=True)
-            return cached_vp_details.get(uri)
+                         "Retrieving info for virtual pool - " + uri)
 
-        session = module_var(self, self.IDX_VIPR_SESSION)
-
-        cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Retrieving info for virtual pool - " + uri)
+            (r_code, r_text) = session.request(
+                'GET',
+                self.API_GET_BLOCK_VP.format(uri)
+            )
+            return json_decode(r_text)
 
-        (r_code, r_text) = session.request(
-            'GET',
-            self.API_GET_BLOCK_VP.format(uri)
-        )
-        data = json_decode(r_text)
+        data, from_cache = self.__get_cached(
+            self.IDX_CACHED_VP_DETAILS, uri, fetch)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Data for virtual pool (retrieved) - " + uri,
+                     "Data for virtual pool ({0}) - ".format(
+                         'cached' if from_cache else 'retrieved') + uri,
                      data,
                      print_only_in_full_debug_mode=True)
 
-        #
-        #  cache for later consumption
-        #
-        if cached_vp_details is None:
-            cached_vp_details = dict()
-            module_var(self, self.IDX_CACHED_VP_DETAILS,
-                       cached_vp_details)
-        cached_vp_details[uri] = data
-
         return data
 
 
@@ -606,18 +657,34 @@ class VseViprApi:
         else:
             hosts = [{"id": uri, "name": name}]
 
+        # initiator URNs of every host, concurrently, then details of all of
+        # them in one bulk POST - not a GET and a POST per host, in turn.
+        # a failed lookup is handed back, not raised in the worker, so the
+        # caller gets the same HTTP error as from a lookup made in turn
+        def get_uris_or_error(h_name, h_uri):
+            try:
+                return self.get_host_initiator_uris(h_name, h_uri), None
+            except Exception as e:
+                return None, e
+
+        init_uris = list()
+        for h_init_uris, error in VseViprApiConcurrent(cmn, self).fan_out(
+                "initiators of {0} hosts".format(name),
+                get_uris_or_error,
+                [(host.get('name'), host.get('id')) for host in hosts]):
+            if error is not None:
+                raise error
+            init_uris.extend(h_init_uris)
+
         init_infos = list()
-        for host in hosts:
-            h_uri = host.get('id')
-            h_name = host.get('name')
-            h_wwn_infos = self.get_host_initiators(h_name, h_uri)
-            for h_wwn_info in h_wwn_infos:
-                if protocol is not None and \
-                    h_wwn_info.get('protocol') != protocol:
-                    continue
-                init_infos.append(h_wwn_info)
+        chunk_size = VseViprApiConcurrent.BULK_CHUNK_SIZE
+        for i in range(0, len(init_uris), chunk_size):
+            init_infos.extend(self.get_bulk_info_by_list_of_ids(
+                self.API_PST_INIT_BULK_INFO, init_uris[i:i + chunk_size]))
 
-        return init_infos
+        return list(
+            h_wwn_info for h_wwn_info in init_infos
+            if protocol is None or h_wwn_info.get('protocol') == protocol)
 
 
     #
@@ -625,6 +692,16 @@ class VseViprApi:
     # returns list of full infos [ {info1}, {info2}, etc ]
     #
     def get_host_initiators(self, name, uri):
+        init_uris = self.get_host_initiator_uris(name, uri)
+
+        return self.get_bulk_info_by_list_of_ids(self.API_PST_INIT_BULK_INFO,
+                                                 init_uris)
+
+
+    #
+    # implements lookup of initiator URNs of a host, returns list of URNs
+    #
+    def get_host_initiator_uris(self, name, uri):
         cmn = module_var(self, self.IDX_CMN)
         session = module_var(self, self.IDX_VIPR_SESSION)
 
@@ -638,16 +715,13 @@ class VseViprApi:
         data = json_decode(r_text)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Hosts of cluster [{0}]=>[{1}] (retrieved):".format(
+                     "Initiators of host [{0}]=>[{1}] (retrieved):".format(
                          name, uri
                      ),
                      data)
 
         # use generator to get a list of ID values. aka - URNs of all inits
-        init_uris = list(init.get('id') for init in data.get('initiator'))
-
-        return self.get_bulk_info_by_list_of_ids(self.API_PST_INIT_BULK_INFO,
-                                                 init_uris)
+        return list(init.get('id') for init in data.get('initiator'))
 
 
     #
@@ -784,7 +858,7 @@ class VseViprApi:
         cmn.printMsg(
             cmn.MSG_LVL_DEBUG,
             "Attempting to get bulk details for [{0}] in: ".format(post_api),
-            cmn.ppFormat(list_urns),
+            list_urns,
             print_only_in_full_debug_mode=True)
 
         (r_code, r_text) = session.request(
@@ -801,6 +875,8 @@ class VseViprApi:
             response_dict_key = 'volume'
         elif post_api == self.API_PST_ALL_STORAGE_PORT_DETAILS:
             response_dict_key = 'storage_port'
+        elif post_api == self.API_PST_ALL_STORAGE_POOL_DETAILS:
+            response_dict_key = 'storage_pool'
         elif post_api == self.API_PST_ALL_VOLUME_EXPORT_PATHS:
             response_dict_key = 'itl'
         elif post_api == self.API_PST_INIT_BULK_INFO:
@@ -835,43 +911,27 @@ class VseViprApi:
         """
         cmn = module_var(self, self.IDX_CMN)
 
-        cached_cg_details = module_var(
-            self,
-            self.IDX_CACHED_CG_DETAILS)
+        def fetch():
+            session = module_var(self, self.IDX_VIPR_SESSION)
 
-        if cached_cg_details is not None and \
-           cached_cg_details.get(uri) is not None:
             cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                         "Data for CG (cached) - " + uri,
-                         cached_cg_details.get(uri),
-                         print_only_in_full_debug_mode=True)
-            return cached_cg_details.get(uri)
+                         "Retrieving info for CG - " + uri)
 
-        session = module_var(self, self.IDX_VIPR_SESSION)
+            (r_code, r_text) = session.request(
+                'GET',
+                self.API_GET_BLOCK_CG.format(uri)
+            )
+            return json_decode(r_text)
 
-        cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Retrieving info for CG - " + uri)
-
-        (r_code, r_text) = session.request(
-            'GET',
-            self.API_GET_BLOCK_CG.format(uri)
-        )
-        data = json_decode(r_text)
+        data, from_cache = self.__get_cached(
+            self.IDX_CACHED_CG_DETAILS, uri, fetch)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Data for CG (retrieved) - " + uri,
+                     "Data for CG ({0}) - ".format(
+                         'cached' if from_cache else 'retrieved') + uri,
                      data,
                      print_only_in_full_debug_mode=True)
 
-        #
-        #  cache for later consumption
-        #
-        if cached_cg_details is None:
-            cached_cg_details = dict()
-            module_var(self, self.IDX_CACHED_CG_DETAILS,
-                       cached_cg_details)
-        cached_cg_details[uri] = data
-
         return data
 
 
@@ -888,43 +948,27 @@ class VseViprApi:
         """
         cmn = module_var(self, self.IDX_CMN)
 
-        cached_sss_details = module_var(
-            self,
-            self.IDX_CACHED_SS_DETAILS)
+        def fetch():
+            session = module_var(self, self.IDX_VIPR_SESSION)
 
-        if cached_sss_details is not None and \
-           cached_sss_details.get(uri) is not None:
             cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                         "Data for storage system (cached) - " + uri,
-                         cached_sss_details.get(uri),
-                         print_only_in_full_debug_mode=True)
-            return cached_sss_details.get(uri)
+                         "Retrieving info for storage system - " + uri)
 
-        session = module_var(self, self.IDX_VIPR_SESSION)
+            (r_code, r_text) = session.request(
+                'GET',
+                self.API_GET_STORAGE_SYSTEM.format(uri)
+            )
+            return json_decode(r_text)
 
-        cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Retrieving info for storage system - " + uri)
-
-        (r_code, r_text) = session.request(
-            'GET',
-            self.API_GET_STORAGE_SYSTEM.format(uri)
-        )
-        data = json_decode(r_text)
+        data, from_cache = self.__get_cached(
+            self.IDX_CACHED_SS_DETAILS, uri, fetch)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Data for storage system (retrieved) - " + uri,
+                     "Data for storage system ({0}) - ".format(
+                         'cached' if from_cache else 'retrieved') + uri,
                      data,
                      print_only_in_full_debug_mode=True)
 
-        #
-        #  cache for later consumption
-        #
-        if cached_sss_details is None:
-            cached_sss_details = dict()
-            module_var(self, self.IDX_CACHED_SS_DETAILS,
-                       cached_sss_details)
-        cached_sss_details[uri] = data
-
         return data
 
 
@@ -951,6 +995,60 @@ class VseViprApi:
         return data
 
 
+    #
+    # returns list of storage pool details for storage system - one GET
+    # for the URIs, one bulk POST for the details. details are cached for
+    # get_storage_pool_info_by_uri as well
+    #
+    def get_storage_pools_by_ss_uri(self, ss_uri):
+        pool_uris = list(
+            brief.get('id') for brief in
+            self.get_storage_pool_uris_by_ss_uri(ss_uri))
+        if len(pool_uris) == 0:
+            return list()
+
+        pools = self.get_bulk_info_by_list_of_ids(
+            self.API_PST_ALL_STORAGE_POOL_DETAILS, pool_uris)
+
+        with module_var(self, self.IDX_CACHE_LOCK):
+            cache = module_var(self, self.IDX_CACHED_SP_DETAILS)
+            if cache is None:
+                cache = dict()
+                module_var(self, self.IDX_CACHED_SP_DETAILS, cache)
+            for pool in pools:
+                cache[pool.get('id')] = pool
+
+        return pools
+
+
+    #
+    # returns details of active storage pool of storage system by its
+    # pool_name, None if there is no such pool. pools of a storage system
+    # are looked up once, then indexed by name
+    #
+    def find_storage_pool_by_name(self, ss_uri, name):
+        cmn = module_var(self, self.IDX_CMN)
+
+        def fetch():
+            pools_by_name = dict()
+            for pool in self.get_storage_pools_by_ss_uri(ss_uri):
+                if str(pool.get('inactive')).lower() == 'true':
+                    continue
+                pools_by_name[pool.get('pool_name')] = pool
+            return pools_by_name
+
+        pools_by_name, from_cache = self.__get_cached(
+            self.IDX_CACHED_SP_BY_NAME, ss_uri, fetch)
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Storage pool [{0}] of ss {1} ({2}) - {3}".format(
+                         name, ss_uri,
+                         'cached' if from_cache else 'retrieved',
+                         'found' if name in pools_by_name else 'not found'))
+
+        return pools_by_name.get(name)
+
+
     #
     # return list of storage port URIs for storage system
     #
@@ -991,43 +1089,27 @@ class VseViprApi:
         """
         cmn = module_var(self, self.IDX_CMN)
 
-        cached_sps_details = module_var(
-            self,
-            self.IDX_CACHED_SP_DETAILS)
+        def fetch():
+            session = module_var(self, self.IDX_VIPR_SESSION)
 
-        if cached_sps_details is not None and \
-           cached_sps_details.get(uri) is not None:
             cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                         "Data for storage system (cached) - " + uri,
-                         cached_sps_details.get(uri),
-                         print_only_in_full_debug_mode=True)
-            return cached_sps_details.get(uri)
+                         "Retrieving info for storage pool - " + uri)
 
-        session = module_var(self, self.IDX_VIPR_SESSION)
-
-        cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Retrieving info for storage pool - " + uri)
+            (r_code, r_text) = session.request(
+                'GET',
+                self.API_GET_STORAGE_POOL.format(uri)
+            )
+            return json_decode(r_text)
 
-        (r_code, r_text) = session.request(
-            'GET',
-            self.API_GET_STORAGE_POOL.format(uri)
-        )
-        data = json_decode(r_text)
+        data, from_cache = self.__get_cached(
+            self.IDX_CACHED_SP_DETAILS, uri, fetch)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Data for storage pool (retrieved) - " + uri,
+                     "Data for storage pool ({0}) - ".format(
+                         'cached' if from_cache else 'retrieved') + uri,
                      data,
                      print_only_in_full_debug_mode=True)
 
-        #
-        #  cache for later consumption
-        #
-        if cached_sps_details is None:
-            cached_sps_details = dict()
-            module_var(self, self.IDX_CACHED_SP_DETAILS,
-                       cached_sps_details)
-        cached_sps_details[uri] = data
-
         return data
 
 
@@ -1084,38 +1166,28 @@ class VseViprApi:
         """
         cmn = module_var(self, self.IDX_CMN)
 
-        # attempt to retrieve from cache
-        cached_projects = module_var(self, self.IDX_CACHED_PROJECT_DETAILS)
-        if cached_projects is not None and \
-           cached_projects.get(uri) is not None:
-            cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                         "Project [{0}] info (cached):".format(uri),
-                         cached_projects.get(uri),
-                         print_only_in_full_debug_mode=True)
-            return cached_projects.get(uri)
+        def fetch():
+            session = module_var(self, self.IDX_VIPR_SESSION)
 
-        session = module_var(self, self.IDX_VIPR_SESSION)
+            cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                         "Retrieving info for project - " + uri)
 
-        cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Retrieving info for project - " + uri)
+            (r_code, r_text) = session.request(
+                'GET',
+                self.API_GET_PROJECT.format(uri)
+            )
+            return json_decode(r_text)
 
-        (r_code, r_text) = session.request(
-            'GET',
-            self.API_GET_PROJECT.format(uri)
-        )
-        data = json_decode(r_text)
+        # retrieve from cache, or from ViPR and commit project to cache
+        data, from_cache = self.__get_cached(
+            self.IDX_CACHED_PROJECT_DETAILS, uri, fetch)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Project [{0}] info (retrieved):".format(uri),
+                     "Project [{0}] info ({1}):".format(
+                         uri, 'cached' if from_cache else 'retrieved'),
                      data,
                      print_only_in_full_debug_mode=True)
 
-        # commit project to cache
-        if cached_projects is None:
-            cached_projects = dict()
-            module_var(self, self.IDX_CACHED_PROJECT_DETAILS, cached_projects)
-        cached_projects[uri] = data
-
         return data
 
 
@@ -1185,7 +1257,7 @@ class VseViprApi:
         except Exception as e:
             return e.response.status_code, json_decode(e.response.text)['details']
 
-        return r_code, ''
+        return r_code, json_decode(r_text)
 
 
     #
@@ -1198,7 +1270,7 @@ class VseViprApi:
         session = module_var(self, self.IDX_VIPR_SESSION)
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Creating host - " + label)
+                     "Updating host - {0}".format(label or host_uri))
 
         host_create_payload = {}
 
@@ -1962,16 +2034,24 @@ class VseViprApi:
                      "Backup created successfully on ViPR vApp: " + name)
 
 
-    def backup_download(self, name, path):
+    #
+    # streams backup into path (via path.part, resumable), returns
+    # VseHttp.download() stats - bytes, sha256, seconds, mb_per_sec.
+    # new_hasher - see VseHttp.download()
+    #
+    def backup_download(self, name, path, new_hasher=None):
         cmn = module_var(self, self.IDX_CMN)
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "Downloading backup from ViPR vApp: " + name)
         vipr_session = module_var(self, self.IDX_VIPR_SESSION)
-        vipr_session.request('GET',
-                             self.API_GET_BCKP.format(name),
-                             filename=path)
-        cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Backup downloaded from ViPR vApp: " + path)
+        stats = vipr_session.download(self.API_GET_BCKP.format(name), path,
+                                      new_hasher=new_hasher)
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Backup downloaded from ViPR vApp: {0}, {1:.1f} MB in "
+                     "{2:.1f}s ({3:.1f} MB/s)".format(
+                         path, stats['bytes'] / 1024.0 / 1024.0,
+                         stats['seconds'], stats['mb_per_sec']))
+        return stats
 
 
     def backup_delete(self, name):
@@ -2016,14 +2096,15 @@ class VseViprApi:
         #
         # cache empty dictionary in case there is nothing yet.
         #
-        if module_var(self, self.IDX_CACHED_CATALOG_DETAILS) is None:
+        def fetch():
             services_info_list = self.fetch_list_of_sc_services_info()
             cached_catalog = dict()
             for service_info in services_info_list:
                 cached_catalog[service_info['title']] = service_info
-            module_var(self, self.IDX_CACHED_CATALOG_DETAILS, cached_catalog)
+            return cached_catalog
 
-        cached_sc = module_var(self, self.IDX_CACHED_CATALOG_DETAILS)
+        cached_sc, from_cache = self.__get_cached(
+            self.IDX_CACHED_CATALOG_DETAILS, None, fetch)
 
         #
         # if service_name is not present - tough luck, we are done.
@@ -2095,7 +2176,7 @@ class VseViprApi:
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "List of all catalog services URNs: ",
-                     cmn.ppFormat(list_urns),
+                     list_urns,
                      print_only_in_full_debug_mode=True)
 
         return list_urns
@@ -2284,7 +2365,7 @@ class VseViprApi:
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "API Response: ",
-                     cmn.ppFormat(response_dict),
+                     response_dict,
                      print_only_in_full_debug_mode=True)
 
         # there are 2 separate lists of dictionaries in response dictionary
@@ -2302,7 +2383,7 @@ class VseViprApi:
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "List of unmanaged volume URNs for {0}: ".format(
                          owner_urn),
-                     cmn.ppFormat(response_list_of_urns),
+                     response_list_of_urns,
                      print_only_in_full_debug_mode=True)
 
         return response_list_of_urns
@@ -2330,7 +2411,7 @@ class VseViprApi:
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "List of all unmanaged volume URNs: ",
-                     cmn.ppFormat(list_urns),
+                     list_urns,
                      print_only_in_full_debug_mode=True)
 
         return list_urns
@@ -2359,7 +2440,7 @@ class VseViprApi:
             cmn.printMsg(
                 cmn.MSG_LVL_DEBUG,
                 "Attempting to retrieve details for unmanaged devices in: ",
-                cmn.ppFormat(list_urns),
+                list_urns,
                 print_only_in_full_debug_mode=True)
 
         (r_code, r_text) = session.request(
@@ -0,0 +1,308 @@
+__author__ = 'belens'
+
+"""
+fan-out companion to VseViprApi, for inventory and migration jobs that are
+network bound: per-host initiators, per-volume protections, per-name
+searches, task polling, tagging.
+
+runs the regular VseViprApi calls from a pool of worker threads, over the
+same logged in VseHttp session (same login and token semantics), so one
+calling thread can keep many requests in flight.
+
+requests in flight are capped per HTTP request, by the HttpThrottle VseHttp
+keeps per ViPR host (HTTP_MAX_CONCURRENCY, HTTP_POOL_SIZE by default) - not
+here. a worker holds nothing while fn runs, so fan-outs can nest (a worker
+running a fan_out of its own) or run side by side without deadlocking, and
+all of them together still can not flood ViPR.
+
+python 2 has no asyncio, threads over a shared requests session give the
+same effect for I/O bound calls. keep VseHttp HTTP_POOL_SIZE at or above
+DEFAULT_WORKERS, otherwise extra workers just wait for a connection.
+
+throws exceptions that should be handled above
+"""
+
+import Queue
+import threading
+import time
+
+from vseCmn import module_var
+from VseExceptions import VSEViPRAPIExc
+
+
+class VseViprApiConcurrent:
+    IDX_CMN = "Module_Ref_Common"
+    IDX_VIPR_API = "ViPR_Api"
+    IDX_WORKERS = "Worker_Threads"
+
+    #
+    # threads per fan-out, unless told otherwise
+    #
+    DEFAULT_WORKERS = 16
+
+    #
+    # bulk POSTs are split into chunks of this many ids
+    #
+    BULK_CHUNK_SIZE = 1000
+
+    #
+    # calls queued per worker by fan_out_by_key
+    #
+    STREAM_QUEUE_DEPTH = 64
+
+
+    def __init__(self, cmn, vipr_api, workers=None):
+        """
+        :param vipr_api: VseViprApi instance, logged in or not
+        :param workers: threads per fan-out, defaults to DEFAULT_WORKERS
+        """
+        self.data = {}
+        module_var(self, self.IDX_CMN, cmn)
+        module_var(self, self.IDX_VIPR_API, vipr_api)
+        module_var(self, self.IDX_WORKERS, workers or self.DEFAULT_WORKERS)
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "VseViprApiConcurrent module initialization is "
+                     "complete, {0} workers".format(
+                         module_var(self, self.IDX_WORKERS)))
+
+
+    def fan_out(self, description, fn, list_of_args):
+        """
+        calls fn(*args) for every args tuple on worker threads
+        :return: list of results, in list_of_args order
+        raises VSEViPRAPIExc if any call failed, after all of them finish
+        """
+        cmn = module_var(self, self.IDX_CMN)
+
+        results = [None] * len(list_of_args)
+        errors = [None] * len(list_of_args)
+        if len(list_of_args) == 0:
+            return results
+
+        work_queue = Queue.Queue()
+        for idx, args in enumerate(list_of_args):
+            work_queue.put((idx, args))
+
+        def worker():
+            while True:
+                try:
+                    idx, args = work_queue.get_nowait()
+                except Queue.Empty:
+                    break
+
+                try:
+                    results[idx] = fn(*args)
+                except Exception as e:
+                    errors[idx] = e
+
+        n_workers = max(1, min(module_var(self, self.IDX_WORKERS),
+                               len(list_of_args)))
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Fanning out {0} calls of [{1}] over {2} "
+                     "workers...".format(len(list_of_args), description,
+                                         n_workers))
+
+        started = time.time()
+        workers = []
+        for i in range(n_workers):
+            t = threading.Thread(target=worker,
+                                 name="vipr-api-{0}".format(i))
+            t.daemon = True
+            t.start()
+            workers.append(t)
+        for t in workers:
+            t.join()
+
+        failed = [(list_of_args[idx], e) for idx, e in enumerate(errors)
+                  if e is not None]
+        self.__finish(description, started, len(list_of_args), failed)
+
+        return results
+
+
+    def fan_out_by_key(self, description, fn, iter_of_args, key_fn):
+        """
+        streaming fan_out: calls fn(*args) for every args tuple of
+        iter_of_args (any iterable, a generator is read as workers keep up).
+        calls with the same key_fn(args) run on the same worker, one after
+        the other, in iter_of_args order.
+        fn is a unit of work (a CSV row...) that may make several calls or
+        a fan_out of its own - like fan_out, requests it makes are capped
+        by the VseHttp throttle
+        :return: number of calls made
+        raises VSEViPRAPIExc if any call failed, after all of them finish
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        n_workers = max(1, module_var(self, self.IDX_WORKERS))
+
+        #
+        # bounded, so a large input is never all queued up in memory
+        #
+        queues = [Queue.Queue(self.STREAM_QUEUE_DEPTH)
+                  for i in range(n_workers)]
+        failed = []
+        failed_lock = threading.Lock()
+
+        def worker(work_queue):
+            while True:
+                args = work_queue.get()
+                if args is None:
+                    break
+
+                try:
+                    fn(*args)
+                except Exception as e:
+                    with failed_lock:
+                        failed.append((args, e))
+
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "Streaming calls of [{0}] over {1} "
+                     "workers...".format(description, n_workers))
+
+        started = time.time()
+        workers = []
+        for i in range(n_workers):
+            t = threading.Thread(target=worker, args=(queues[i],),
+                                 name="vipr-api-{0}".format(i))
+            t.daemon = True
+            t.start()
+            workers.append(t)
+
+        count = 0
+        try:
+            for args in iter_of_args:
+                queues[hash(key_fn(args)) % n_workers].put(args)
+                count += 1
+        finally:
+            # input failed or ran out - let workers drain and stop
+            for work_queue in queues:
+                work_queue.put(None)
+            for t in workers:
+                t.join()
+
+        self.__finish(description, started, count, failed)
+
+        return count
+
+
+    def __finish(self, description, started, n_calls, failed):
+        cmn = module_var(self, self.IDX_CMN)
+        cmn.add_to_counter('vipr_api_fan_out_calls', n_calls)
+        cmn.add_to_counter('vipr_api_fan_out_failures', len(failed))
+        cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                     "[{0}] fan-out finished in {1:.2f}s, {2} of {3} "
+                     "calls failed".format(description,
+                                           time.time() - started,
+                                           len(failed),
+                                           n_calls))
+
+        if len(failed) > 0:
+            cmn.printMsg(cmn.MSG_LVL_WARNING,
+                         "[{0}] failed for:".format(description),
+                         ["{0}: {1}".format(args, e) for args, e in failed])
+            raise VSEViPRAPIExc(
+                "{0} of {1} [{2}] calls failed, first: {3}".format(
+                    len(failed), n_calls, description,
+                    failed[0][1]))
+
+
+    #
+    # same as VseViprApi.get_bulk_info_by_list_of_ids, chunks of ids are
+    # POSTed concurrently. returns one flat list of details
+    #
+    def get_bulk_info_by_list_of_ids(self, post_api, list_urns,
+                                     chunk_size=None):
+        vipr_api = module_var(self, self.IDX_VIPR_API)
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+
+        chunks = [(post_api, list_urns[i:i + chunk_size])
+                  for i in range(0, len(list_urns), chunk_size)]
+        list_of_details = []
+        for details in self.fan_out(post_api,
+                                    vipr_api.get_bulk_info_by_list_of_ids,
+                                    chunks):
+            list_of_details.extend(details or [])
+
+        return list_of_details
+
+
+    #
+    # returns dictionary of name => list of matched URNs
+    #
+    def search_by_name(self, type, names, exact_match=False):
+        vipr_api = module_var(self, self.IDX_VIPR_API)
+        names = list(names)
+
+        matches = self.fan_out(
+            "search {0}".format(type),
+            vipr_api.search_by_name,
+            [(type, name, exact_match) for name in names])
+
+        return dict(zip(names, matches))
+
+
+    #
+    # hosts - list of (name, uri) tuples
+    # returns dictionary of host uri => list of initiator full infos
+    #
+    def get_host_initiators(self, hosts):
+        vipr_api = module_var(self, self.IDX_VIPR_API)
+        hosts = list(hosts)
+
+        initiators = self.fan_out("host initiators",
+                                  vipr_api.get_host_initiators,
+                                  hosts)
+
+        return dict(zip([uri for name, uri in hosts], initiators))
+
+
+    #
+    # returns dictionary of volume id => list of protections of given type
+    #
+    def get_block_volume_protection(self, protection_type, volume_infos):
+        vipr_api = module_var(self, self.IDX_VIPR_API)
+        volume_infos = list(volume_infos)
+
+        protections = self.fan_out(
+            "{0} protections".format(protection_type),
+            vipr_api.get_block_volume_protection,
+            [(protection_type, info) for info in volume_infos])
+
+        return dict(zip([info.get('id') for info in volume_infos],
+                        protections))
+
+
+    #
+    # returns dictionary of task urn => task state
+    #
+    def query_task_state(self, task_urns):
+        vipr_api = module_var(self, self.IDX_VIPR_API)
+        task_urns = list(task_urns)
+
+        states = self.fan_out("task state",
+                              vipr_api.query_task_state,
+                              [(urn,) for urn in task_urns])
+
+        return dict(zip(task_urns, states))
+
+
+    #
+    # same action and tags delta applied to every target
+    # returns dictionary of target urn => resulting tags
+    #
+    def manage_resource_tags(self,
+                             tag_resource_type,
+                             tag_action,
+                             target_urns,
+                             tags_delta_list=None):
+        vipr_api = module_var(self, self.IDX_VIPR_API)
+        target_urns = list(target_urns)
+
+        tags = self.fan_out(
+            tag_action,
+            vipr_api.manage_resource_tags,
+            [(tag_resource_type, tag_action, urn, tags_delta_list)
+             for urn in target_urns])
+
+        return dict(zip(target_urns, tags))
@@ -6,12 +6,28 @@ facade for ViPR CLI "viprcli system *-backup" functionality
 To "simulate" PYTHONPATH runtime modification, one can use
 File->Settings->ProjectStructure->AddContentRoot->[add CLI python libraries
 path]
+
+Repository (PATH_BKP_FILES/ViPR_BACKUPS) keeps either whole backup zip
+files (BACKUP_REPO_MODE FULL, default) or, with DEDUP, content defined
+chunks stored once plus a manifest per backup - see VseDedupRepo. Backups
+are mostly the same from one run to the next, so DEDUP repository grows
+by what changed only. restore_bckp() gives a zip file back either way.
+
+Several controllers: BACKUP_CONTROLLERS lists names, each with its own
+[VseViprBackups:<name>] section - ViPR connection (VIPR_HOSTNAME,
+VIPR_PORT, VIPR_USER, VIPR_PASSWORD, defaulting to [vseCmn] ones) and any
+[VseViprBackups] variable to override for it. take_bckps() backs them all
+up at once, each into its own ViPR_BACKUPS/<name> repository under its own
+retention policy, and logs one summary.
 """
 
 import os
+import threading
 import time
 from vseCmn import module_var
 from VseViprApi import VseViprApi
+from VseDedupRepo import VseDedupRepo
+from VseFileIndex import VseFileIndex
 
 
 class VseViprBackups:
@@ -22,6 +38,8 @@ class VseViprBackups:
     IDX_CMN = "Module_Ref_Common"
     IDX_VIPR_API = "Module_Ref_ViPR_API"
     IDX_VIPR_BKP_REPO_PATH = "Backups_Repository_Path"
+    IDX_DEDUP_REPO = "Module_Ref_Dedup_Repo"
+    IDX_REPO_INDEX = "Module_Ref_Repo_Index"
 
     #
     # required arguments
@@ -33,13 +51,52 @@ class VseViprBackups:
                      IDX_VIPR_RETENTION_POLICY_AT_LEAST,
                      IDX_VIPR_BACKUPS_PATH]
 
+    #
+    # optional arguments
+    #
+    IDX_BACKUP_REPO_MODE = "BACKUP_REPO_MODE"
+    IDX_BACKUP_CONTROLLERS = "BACKUP_CONTROLLERS"
+    OPTIONAL_VARS = [IDX_BACKUP_REPO_MODE, IDX_BACKUP_CONTROLLERS]
 
-    def __init__(self, cmn):
+    #
+    # [VseViprBackups:<controller>] only
+    #
+    IDX_CONTROLLER = "Controller_Name"
+    IDX_VIPR_HOSTNAME = "VIPR_HOSTNAME"
+    IDX_VIPR_PORT = "VIPR_PORT"
+    IDX_VIPR_USER = "VIPR_USER"
+    IDX_VIPR_PASSWORD = "VIPR_PASSWORD"
+    CONTROLLER_VARS = [IDX_VIPR_HOSTNAME, IDX_VIPR_PORT, IDX_VIPR_USER,
+                       IDX_VIPR_PASSWORD]
+
+    REPO_MODE_FULL = "FULL"
+    REPO_MODE_DEDUP = "DEDUP"
+
+
+    def __init__(self, cmn, controller=None):
+        """
+        :param controller: name from BACKUP_CONTROLLERS, None for the
+                           [vseCmn] ViPR instance
+        """
         cmn.read_config_file_for_module(
             self,
             cmn.get_env_settings_file(),
             self.__class__.__name__,
-            self.REQUIRED_VARS)
+            self.REQUIRED_VARS,
+            optional_vars=self.OPTIONAL_VARS)
+
+        #
+        # then [VseViprBackups:<controller>] on top
+        #
+        if controller is not None:
+            cmn.read_config_file_for_module(
+                self,
+                cmn.get_env_settings_file(),
+                "{0}:{1}".format(self.__class__.__name__, controller),
+                [self.IDX_VIPR_HOSTNAME],
+                optional_vars=self.REQUIRED_VARS + self.OPTIONAL_VARS +
+                self.CONTROLLER_VARS[1:])
+            module_var(self, self.IDX_CONTROLLER, controller)
 
         module_var(self,
                    self.IDX_CMN,
@@ -48,6 +105,8 @@ class VseViprBackups:
         backups_repo_path = os.path.join(
             module_var(self, self.IDX_VIPR_BACKUPS_PATH),
             "ViPR_BACKUPS")
+        if controller is not None:
+            backups_repo_path = os.path.join(backups_repo_path, controller)
 
         if not os.path.isdir(backups_repo_path):
             os.makedirs(backups_repo_path)
@@ -56,9 +115,20 @@ class VseViprBackups:
                    self.IDX_VIPR_BKP_REPO_PATH,
                    value=backups_repo_path)
 
+        if self.get_repo_mode() == self.REPO_MODE_DEDUP:
+            module_var(self,
+                       self.IDX_DEDUP_REPO,
+                       value=VseDedupRepo(cmn, backups_repo_path))
+
         module_var(self,
                    self.IDX_VIPR_API,
-                   value=VseViprApi(cmn))
+                   value=VseViprApi(
+                       cmn,
+                       vipr_host=module_var(self, self.IDX_VIPR_HOSTNAME),
+                       vipr_port=module_var(self, self.IDX_VIPR_PORT),
+                       vipr_user=module_var(self, self.IDX_VIPR_USER),
+                       vipr_password=module_var(self,
+                                                self.IDX_VIPR_PASSWORD)))
 
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
                      "VseViprBackups module initialization is complete")
@@ -68,6 +138,160 @@ class VseViprBackups:
         return module_var(self, self.IDX_VIPR_BKP_REPO_PATH)
 
 
+    def __get_repo_index(self):
+        """
+        repository index, reconciled with what is in repository - names
+        only, backups index does not know yet get described once
+        """
+        repo_index = module_var(self, self.IDX_REPO_INDEX)
+        if repo_index is not None:
+            return repo_index
+
+        dedup_repo = module_var(self, self.IDX_DEDUP_REPO)
+        if dedup_repo is not None:
+            names = dedup_repo.list_manifests().keys()
+
+            def describe(name):
+                manifest = dedup_repo.read_manifest(name)
+                return (manifest['created'], manifest['bytes'],
+                        manifest['sha256'])
+        else:
+            names = [f for f in os.listdir(self.__get_repo_path())
+                     if f.endswith(self.__get_bckp_dl_name(''))]
+
+            #
+            # zip files from before the index - not worth reading multi GB
+            # files to get their checksum, it stays unknown
+            #
+            def describe(name):
+                path = os.path.join(self.__get_repo_path(), name)
+                return os.path.getmtime(path), os.path.getsize(path), None
+
+        repo_index = VseFileIndex(module_var(self, self.IDX_CMN),
+                                  self.__get_repo_path())
+        if repo_index.reconcile(names, describe):
+            repo_index.save()
+        module_var(self, self.IDX_REPO_INDEX, repo_index)
+        return repo_index
+
+
+    def get_controller(self):
+        return module_var(self, self.IDX_CONTROLLER)
+
+
+    def get_controllers(self):
+        """
+        :return: list of BACKUP_CONTROLLERS names, empty if not set
+        """
+        controllers = module_var(self, self.IDX_BACKUP_CONTROLLERS)
+        return controllers.replace(',', ' ').split() \
+            if controllers is not None else []
+
+
+    def take_bckps(self, controllers=None):
+        """
+        backs up every controller at once, one thread each - create,
+        download and delete of one do not wait for any other. failures are
+        reported after all of them finish
+        :param controllers: names, defaults to BACKUP_CONTROLLERS
+        :return: dictionary of controller => take_bckp() stats
+        raises VSEViPRAPIExc when any of them failed
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        if controllers is None:
+            controllers = self.get_controllers()
+        results = {}
+        errors = {}
+
+        #
+        # config is read here, one controller after the other - reading it
+        # sets os.environ, threads would overwrite each other's values
+        #
+        backups = {}
+        for controller in controllers:
+            cmn.set_log_context(controller)
+            try:
+                backups[controller] = self.__class__(cmn, controller)
+            except Exception as e:
+                errors[controller] = e
+                cmn.printMsg(cmn.MSG_LVL_ERROR,
+                             "Backup of {0} failed: {1}".format(controller,
+                                                                e))
+            finally:
+                cmn.set_log_context(None)
+
+        def worker(controller):
+            cmn.set_log_context(controller)
+            try:
+                results[controller] = backups[controller].take_bckp()
+            except Exception as e:
+                errors[controller] = e
+                cmn.printMsg(cmn.MSG_LVL_ERROR,
+                             "Backup of {0} failed: {1}".format(controller,
+                                                                e))
+            finally:
+                cmn.set_log_context(None)
+
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Backing up {0} controllers in parallel: {1}".format(
+                         len(controllers), ", ".join(controllers)))
+        started = time.time()
+        threads = []
+        for controller in [c for c in controllers if c in backups]:
+            t = threading.Thread(target=worker, args=(controller,),
+                                 name="backup-{0}".format(controller))
+            t.daemon = True
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        #
+        # one summary for the whole run - it is what the email leads with
+        #
+        summary = ["{0:<20} {1:<8} {2:>10} {3:>10} {4:>8}".format(
+            "CONTROLLER", "RESULT", "MB", "SECONDS", "MB/S")]
+        for controller in controllers:
+            if controller in results:
+                stats = results[controller]
+                summary.append(
+                    "{0:<20} {1:<8} {2:>10.1f} {3:>10.1f} {4:>8.1f}".format(
+                        controller, "OK",
+                        stats['bytes'] / 1024.0 / 1024.0,
+                        stats['seconds_total'], stats['mb_per_sec']))
+            else:
+                summary.append("{0:<20} {1:<8} {2}".format(
+                    controller, "FAILED", errors.get(controller)))
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Backups finished in {0:.1f}s, {1} of {2} "
+                     "failed:\n{3}".format(time.time() - started,
+                                           len(errors), len(controllers),
+                                           "\n".join(summary)))
+
+        if len(errors) > 0:
+            from VseExceptions import VSEViPRAPIExc
+            raise VSEViPRAPIExc(
+                "Backup of {0} of {1} controllers failed: {2}".format(
+                    len(errors), len(controllers),
+                    ", ".join(sorted(errors.keys()))))
+
+        return results
+
+
+    def get_repo_mode(self):
+        mode = module_var(self, self.IDX_BACKUP_REPO_MODE)
+        if mode is None:
+            return self.REPO_MODE_FULL
+        mode = mode.strip().upper()
+        if mode not in [self.REPO_MODE_FULL, self.REPO_MODE_DEDUP]:
+            from VseExceptions import VSEInitExc
+            raise VSEInitExc(
+                "{0} must be {1} or {2}, not {3}".format(
+                    self.IDX_BACKUP_REPO_MODE, self.REPO_MODE_FULL,
+                    self.REPO_MODE_DEDUP, mode))
+        return mode
+
+
     def __get_bckp_name(self):
         # name of backup cannot have underscores, and all alphabetic characters
         # must be lower case
@@ -80,42 +304,85 @@ class VseViprBackups:
 
 
     def __get_bckp_dl_full_file_path(self, name):
-        cmn = module_var(self, self.IDX_CMN)
-        return os.path.join(cmn.get_session_path(),
+        return os.path.join(self.__get_repo_path(),
                             self.__get_bckp_dl_name(name))
 
 
     def take_bckp(self, verify_repo=True):
+        """
+        :return: backup_download() stats, plus seconds_total for the whole
+                 create/download/delete/retention cycle
+        """
         cmn = module_var(self, self.IDX_CMN)
 
         bckp_name = self.__get_bckp_name()
+
+        #
+        # download goes straight into repository - VseHttp streams it into
+        # a .part file there and renames it once complete
+        #
         bkp_dl_path = self.__get_bckp_dl_full_file_path(bckp_name)
 
         #
         # create, download, delete files on ViPR
         #
+        started = time.time()
         cmn.printMsg(cmn.MSG_LVL_INFO,
                      "Taking a backup: " + bckp_name)
         vipr_api = module_var(self,
                               self.IDX_VIPR_API)
+        #
+        # DEDUP - the zip is chunked into repository as it streams in, in
+        # place of the download's sha256, so it is not read back. a new
+        # store every time the download starts over, last one is the file
+        #
+        dedup_stores = []
+        new_hasher = None
+        if self.get_repo_mode() == self.REPO_MODE_DEDUP:
+            dedup_repo = module_var(self, self.IDX_DEDUP_REPO)
+
+            def new_hasher():
+                dedup_stores.append(dedup_repo.new_store(
+                    self.__get_bckp_dl_name(bckp_name)))
+                return dedup_stores[-1]
+
         vipr_api.login()
         vipr_api.backup_create(bckp_name)
-        vipr_api.backup_download(bckp_name, bkp_dl_path)
+        stats = vipr_api.backup_download(bckp_name, bkp_dl_path,
+                                         new_hasher=new_hasher)
         vipr_api.backup_delete(bckp_name)
         vipr_api.logout()
 
         #
-        # save downloaded file in appropriate place
+        # .part still lands on disk, resume needs it - dropped once stored
         #
-        src_full_path = self.__get_bckp_dl_full_file_path(bckp_name)
-        tgt_full_path = os.path.join(self.__get_repo_path(),
-                                     self.__get_bckp_dl_name(bckp_name))
-        cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Saving downloaded backup into repository: " +
-                     src_full_path)
-        cmn.copyFile(src_full_path, tgt_full_path)
+        if len(dedup_stores) > 0:
+            dedup_stats = dedup_stores[-1].close()
+            if dedup_stats['bytes'] != stats['bytes'] or \
+               dedup_stats['sha256'] != stats['sha256']:
+                raise RuntimeError(
+                    "Backup {0} stored differs from download: {1} bytes, "
+                    "sha256 {2} downloaded, {3} bytes, sha256 {4} "
+                    "stored".format(bckp_name, stats['bytes'],
+                                    stats['sha256'], dedup_stats['bytes'],
+                                    dedup_stats['sha256']))
+            cmn.deleteFile(bkp_dl_path)
+            cmn.printMsg(cmn.MSG_LVL_INFO,
+                         "Backup {0} deduplicated: {1} of {2} chunks new, "
+                         "{3:.1f} MB added to repository".format(
+                             bckp_name, dedup_stats['new_chunks'],
+                             dedup_stats['chunks'],
+                             dedup_stats['new_bytes'] / 1024.0 / 1024.0))
+
+        repo_index = self.__get_repo_index()
+        repo_index.add(self.__get_bckp_dl_name(bckp_name),
+                       size=stats['bytes'],
+                       sha256=stats['sha256'])
+        repo_index.save()
+
         cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                     "Backup saved in repository: " + tgt_full_path)
+                     "Backup saved in repository: {0}, sha256 {1}".format(
+                         bkp_dl_path, stats['sha256']))
 
         #
         # make sure retention policy is observed
@@ -123,7 +390,32 @@ class VseViprBackups:
         if verify_repo:
             self.__vrf_repo_for_policy_compliance()
 
-        return
+        stats['seconds_total'] = time.time() - started
+        return stats
+
+
+    def restore_bckp(self, name, tgt_path):
+        """
+        puts backup zip file from repository into tgt_path directory
+        :param name: backup name, with or without .zip
+        :return: full path of restored zip file
+        """
+        cmn = module_var(self, self.IDX_CMN)
+        if name.endswith(".zip"):
+            name = name[:-len(".zip")]
+        tgt_full_path = os.path.join(tgt_path, self.__get_bckp_dl_name(name))
+
+        cmn.printMsg(cmn.MSG_LVL_INFO,
+                     "Restoring backup {0} into {1}".format(name,
+                                                            tgt_full_path))
+        if self.get_repo_mode() == self.REPO_MODE_DEDUP:
+            module_var(self, self.IDX_DEDUP_REPO).restore(
+                self.__get_bckp_dl_name(name), tgt_full_path)
+        else:
+            cmn.copyFile(self.__get_bckp_dl_full_file_path(name),
+                         tgt_full_path)
+
+        return tgt_full_path
 
 
     def __vrf_repo_for_policy_compliance(self):
@@ -145,35 +437,29 @@ class VseViprBackups:
         #
         plc_retain_days = module_var(self,
                                      self.IDX_VIPR_RETENTION_POLICY_DAYS)
-        if cmn.is_simple_value_defined(plc_retain_days):
+        if not cmn.is_simple_value_defined(plc_retain_days):
             return
 
         #
-        # create a sorted map of backups, by created timestamp
-        #
-        bkps_dict = {}
-        for bkpFile in os.listdir(self.__get_repo_path()):
-            bkp_file_path = os.path.join(self.__get_repo_path(), bkpFile)
-            bkps_dict[os.path.getmtime(bkp_file_path)] = bkp_file_path
-        bkp_time_stamps = bkps_dict.keys()
-        bkp_time_stamps.sort()
-
-        #
-        # - only if we have more backups will we try to retain per keep_cnt
-        # - since list is sorted, iterate from 0 to last possible element we
-        # would want to delete based on retention count
-        # - evaluate if elements are beyond date-based retention and delete
-        # them
-        #
-        # python ranges are not inclusive of the ending element
+        # backups by created time come from repository index - entries
+        # created the same second do not collide, and there is no stat of
+        # every backup on every run
         #
-        if len(bkp_time_stamps) > keep_cnt:
-            for idx, bkp_time in enumerate(
-                    bkp_time_stamps[0:len(bkp_time_stamps) - keep_cnt]):
-                if bkp_time < time.time() - int(plc_retain_days) * 86400:
-                    cmn.printMsg(cmn.MSG_LVL_DEBUG,
-                                 "Backup file " + bkps_dict[bkp_time] +
-                                 " has expired, deleting.")
-                    cmn.deleteFile(bkps_dict[bkp_time])
+        repo_index = self.__get_repo_index()
+        dedup_repo = module_var(self, self.IDX_DEDUP_REPO)
+
+        for bkp_name in repo_index.expired(plc_retain_days, keep_cnt):
+            cmn.printMsg(cmn.MSG_LVL_DEBUG,
+                         "Backup " + bkp_name + " has expired, deleting.")
+            if dedup_repo is not None:
+                dedup_repo.delete(bkp_name)
+            else:
+                cmn.deleteFile(os.path.join(self.__get_repo_path(),
+                                            bkp_name))
+            repo_index.remove(bkp_name)
+        repo_index.save()
+
+        if dedup_repo is not None:
+            dedup_repo.gc()
 
         return
\ No newline at end of file
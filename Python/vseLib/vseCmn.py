@@ -24,6 +24,7 @@ import datetime
 import traceback
 import shutil
 import smtplib
+import threading
 
 from vseLib import VseExceptions
 
@@ -103,6 +104,19 @@ class vseCmn:
     #
     IDX_FULL_DEBUG = "Full Debug (print extra large objects?)"
 
+    #
+    # run-time counters (bytes moved, retries taken, etc.) that libraries
+    # report into. summary gets dumped into log.txt on exit.
+    #
+    IDX_COUNTERS = "Session_Counters"
+    IDX_COUNTERS_LOCK = "Session_Counters_Lock"
+
+    #
+    # per thread log context, e.g. controller a worker thread is busy with,
+    # shows up in every message header that thread prints
+    #
+    IDX_LOG_CONTEXT = "Log_Context_Thread_Local"
+
     #
     # Exit/Error Codes
     #
@@ -143,6 +157,13 @@ class vseCmn:
         #
         self.__handle_bean(self.IDX_PPRINT, pprint.PrettyPrinter(indent=4))
 
+        #
+        # counters are shared by all libraries, possibly across threads
+        #
+        self.__handle_bean(self.IDX_COUNTERS, {})
+        self.__handle_bean(self.IDX_COUNTERS_LOCK, threading.Lock())
+        self.__handle_bean(self.IDX_LOG_CONTEXT, threading.local())
+
         #
         # minimum data that is expected at initialization
         #
@@ -328,9 +349,15 @@ class vseCmn:
     def __get_logs_path(self):
         return self.__handle_bean(self.IDX_VIPR_SCRIPT_LOGS_PATH)
 
+    def get_vipr_logs_path(self):
+        return self.__handle_bean(self.IDX_VIPR_LOGS_PATH)
+
     def get_session_path(self):
         return self.__handle_bean(self.IDX_SESSION_PATH)
 
+    def is_full_debug(self):
+        return self.__handle_bean(self.IDX_FULL_DEBUG) is True
+
     def __get_vipr_cli_path(self):
         return self.__handle_bean(self.IDX_VIPR_CLI_PKG_PATH)
 
@@ -409,20 +436,30 @@ class vseCmn:
     # os.environ
     #
     def read_config_file_for_module(self, vse_mod_ref, cfg_file_path, section,
-                                    vars):
+                                    vars, optional_vars=None):
         #
         # cannot use printMsg yet - logFH isn't configured.
         #
         # self.printMsg(self.MSG_LVL_DEBUG,
         # "Reading CFG file [{0}], section [{1}]...".format(
         #                   cfg_file_path, section))
+        #
+        # optional_vars may be missing (or empty) along with their whole
+        # section, in which case module_var is simply left unset
+        #
         cfg = ConfigParser.SafeConfigParser()
         cfg.read(cfg_file_path)
-        for var_name in vars:
+        optional_vars = [] if optional_vars is None else optional_vars
+        for var_name in vars + optional_vars:
             try:
                 var_value = cfg.get(section, var_name)
-            except ConfigParser.NoOptionError as e:
+            except (ConfigParser.NoSectionError,
+                    ConfigParser.NoOptionError) as e:
+                if var_name in optional_vars:
+                    continue
                 raise VseExceptions.VSEInitExc(e.message)
+            if var_name in optional_vars and var_value == '':
+                continue
             if var_value is None:
                 raise VseExceptions.VSEInitExc(
                     "Variable " + var_name +
@@ -484,28 +521,24 @@ class vseCmn:
             cFile,
             cFunction,
             str(cLine),
-            self.get_session_name()
+            self.get_session_name() + self.__get_log_context_tag()
         )
         msg += "{0}: {1}\n".format(self.MSG_LVLS[msgLevel], msgText)
 
-        collateralObj if isinstance(collateralObj, basestring) else \
-            self.ppFormat(collateralObj)
-
+        #
+        # pretty print only what is going to be written - large API
+        # responses are expensive to format
+        #
         if collateralObj is not None:
 
-            obj_string = collateralObj \
-                if isinstance(collateralObj, basestring) \
-                else self.ppFormat(collateralObj)
+            is_in_full_debug = self.is_full_debug()
 
-            is_in_full_debug = self.__handle_bean(self.IDX_FULL_DEBUG)
+            if not print_only_in_full_debug_mode or is_in_full_debug:
+                msg += (collateralObj
+                        if isinstance(collateralObj, basestring)
+                        else self.ppFormat(collateralObj)) + "\n"
 
-            if not print_only_in_full_debug_mode:
-                msg += obj_string + "\n"
-
-            if print_only_in_full_debug_mode and is_in_full_debug:
-                msg += obj_string + "\n"
-
-            if print_only_in_full_debug_mode and not is_in_full_debug:
+            else:
                 msg += "\t==> Full detail is hidden to conserve hard drive " \
                        "space. To see full detail " \
                        "execute in full debug mode <==\n"
@@ -519,9 +552,36 @@ class vseCmn:
             print msg
 
 
+    #
+    # messages this thread prints get tagged with context, None clears it
+    #
+    def set_log_context(self, context):
+        self.__handle_bean(self.IDX_LOG_CONTEXT).value = context
+
+    def get_log_context(self):
+        return getattr(self.__handle_bean(self.IDX_LOG_CONTEXT), 'value',
+                       None)
+
+    def __get_log_context_tag(self):
+        context = self.get_log_context()
+        return "" if context is None else "[{0}]".format(context)
+
     def ppFormat(self, ds):
         return pprint.pformat(ds, indent=4)
 
+    #
+    # bump a named run-time counter. value can be any number, e.g. byte
+    # counts, so counters double as simple accumulators
+    #
+    def add_to_counter(self, name, value=1):
+        with self.__handle_bean(self.IDX_COUNTERS_LOCK):
+            counters = self.__handle_bean(self.IDX_COUNTERS)
+            counters[name] = counters.get(name, 0) + value
+
+    def get_counters(self):
+        with self.__handle_bean(self.IDX_COUNTERS_LOCK):
+            return dict(self.__handle_bean(self.IDX_COUNTERS))
+
     #
     # forces end to program execution
     # check log folders to be compliant with retention policy
@@ -539,6 +599,12 @@ class vseCmn:
             msg += "\texit message: " + str(exitText) + "\n"
 
         self.printMsg(lvl, msg)
+
+        if len(self.get_counters()) > 0:
+            self.printMsg(self.MSG_LVL_DEBUG,
+                          "Session counters:",
+                          self.get_counters())
+
         self.__get_session_log_fh().close()
         self.__get_session_out_fh().close()
         self.__email_session_results(exitCode)
@@ -608,7 +674,35 @@ class vseCmn:
         )
 
 
+    #
+    # log folders are kept in an index under logs path (created, size) -
+    # retention is a query over it, not a stat of every session folder
+    # ever made on every exit
+    #
     def __disposeOfOldLogs(self):
+        logs_index = VseFileIndex.VseFileIndex(self, self.__get_logs_path())
+
+        #
+        # skip hidden folders that OSs create, and the index itself
+        #
+        def describe(d):
+            return (os.path.getmtime(os.path.join(self.__get_logs_path(), d)),
+                    None, None)
+
+        logs_index.reconcile(
+            [d for d in os.listdir(self.__get_logs_path())
+             if not d.__contains__(".")],
+            describe)
+
+        session_bytes = 0
+        for dir_path, dir_names, file_names in os.walk(
+                self.get_session_path()):
+            for file_name in file_names:
+                session_bytes += os.path.getsize(
+                    os.path.join(dir_path, file_name))
+        logs_index.add(os.path.basename(self.get_session_path()),
+                       size=session_bytes)
+
         if self.is_simple_value_defined(
                 self.__handle_bean(self.IDX_VIPR_LOGS_RETENTION)):
             self.printMsg(self.MSG_LVL_DEBUG,
@@ -616,26 +710,17 @@ class vseCmn:
                           "retention compliance...")
 
             # if older then "daysToKeep times seconds in a day 86400" -
-            # delete
-            deleteIfCreatedBefore = \
-                time.time() - \
-                int(self.__handle_bean(self.IDX_VIPR_LOGS_RETENTION)) * 86400
-
-            for d in os.listdir(self.__get_logs_path()):
-                # skip hidden folders that OSs create
-                # skip this session folder
-                if d.__contains__("."):
-                    continue
-                if d == self.get_session_name():
-                    continue
-
-                dPath = os.path.join(self.__get_logs_path(), d)
+            # delete. this session folder stays, whatever the policy
+            for d in logs_index.expired(
+                    self.__handle_bean(self.IDX_VIPR_LOGS_RETENTION),
+                    exclude=[os.path.basename(self.get_session_path())]):
+                self.printMsg(self.MSG_LVL_DEBUG,
+                              "Log directory " + d + " is older than "
+                                                     "policy allows, deleting.")
+                self.deleteDir(os.path.join(self.__get_logs_path(), d))
+                logs_index.remove(d)
 
-                if os.path.getmtime(dPath) < deleteIfCreatedBefore:
-                    self.printMsg(self.MSG_LVL_DEBUG,
-                                  "Log directory " + d + " is older than "
-                                                         "policy allows, deleting.")
-                    self.deleteDir(dPath)
+        logs_index.save()
 
 
     def confirm(self, prompt=None, resp=False):
@@ -764,3 +849,10 @@ def module_var(module, var, value=None, delete=False):
                 return module.data[var]
         else:
             return None
+
+
+#
+# VseFileIndex needs module_var from here - imported once it is defined,
+# as a module, so either of the two can be imported first
+#
+import VseFileIndex